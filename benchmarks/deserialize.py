@@ -0,0 +1,101 @@
+# Copyright (c) 2012-2013 SHIFT.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Micro-benchmark of building elements from query results, compares the
+compiled deserialization plan against the constructor path, and compact
+elements against regular ones.
+
+    python benchmarks/deserialize.py [count]
+"""
+import gc
+import resource
+import sys
+import timeit
+from uuid import uuid4
+
+from thunderdome import properties
+from thunderdome.models import Element, Vertex
+
+
+class BenchmarkVertex(Vertex):
+    name = properties.String()
+    count = properties.Integer()
+    score = properties.Double()
+    created = properties.DateTime()
+    tags = properties.List()
+    attrs = properties.Dictionary()
+
+
+class CompactBenchmarkVertex(BenchmarkVertex):
+    __compact__ = True
+
+
+def results(count, klass=BenchmarkVertex):
+    return [{
+        '_id': i,
+        '_type': 'vertex',
+        'element_type': klass.get_element_type(),
+        'vid': str(uuid4()),
+        'name': 'vertex {}'.format(i),
+        'count': i,
+        'score': i / 3.0,
+        'created': 1369000000 + i,
+        'tags': ['a', 'b'],
+        'attrs': {'k': i},
+    } for i in xrange(count)]
+
+
+def constructor(data):
+    return [BenchmarkVertex(**BenchmarkVertex.translate_db_fields(d)) for d in data]
+
+
+def plan(data):
+    return [Element.deserialize(d) for d in data]
+
+
+def max_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def main(count=10000, repeat=5):
+    data = results(count)
+    compact_data = results(count, CompactBenchmarkVertex)
+    runs = [
+        ('constructor', lambda: constructor(data)),
+        ('plan', lambda: plan(data)),
+        ('compact', lambda: plan(compact_data)),
+    ]
+
+    #the peak resident size only grows, so memory is measured first and the
+    #smaller compact elements before the regular ones
+    for name, func in [('compact', runs[2][1]), ('regular', runs[1][1])]:
+        gc.collect()
+        before = max_rss_kb()
+        elements = func()
+        print '{:<12} {:>8.1f} MB'.format(name, (max_rss_kb() - before) / 1024.0)
+        del elements
+
+    for name, func in runs:
+        best = min(timeit.repeat(func, number=1, repeat=repeat))
+        print '{:<12} {:>8.1f} ms  {:>6.2f} us/element'.format(name, best * 1000, best * 1e6 / count)
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:2]])
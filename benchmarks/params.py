@@ -0,0 +1,89 @@
+# Copyright (c) 2012-2013 SHIFT.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""
+Micro-benchmark of encoding gremlin method parameters, compares the type
+dispatch encoder against the previous isinstance chain.
+
+    python benchmarks/params.py [count]
+"""
+from datetime import datetime
+import inspect
+import sys
+import timeit
+from uuid import uuid4
+
+from thunderdome import properties
+from thunderdome.gremlin import encode_param
+from thunderdome.models import BaseElement, Edge, Vertex
+
+
+class BenchmarkVertex(Vertex):
+    name = properties.String()
+
+
+def isinstance_chain(params):
+    """ The encoder before type dispatch """
+    from decimal import Decimal as _Decimal
+    from uuid import UUID as _UUID
+    from thunderdome.properties import DateTime, Decimal, UUID
+
+    if isinstance(params, dict):
+        return {k:isinstance_chain(v) for k,v in params.iteritems()}
+    if isinstance(params, list):
+        return [isinstance_chain(x) for x in params]
+    if isinstance(params, BaseElement):
+        return params.eid
+    if inspect.isclass(params) and issubclass(params, Edge):
+        return params.label
+    if inspect.isclass(params) and issubclass(params, Vertex):
+        return params.element_type
+    if isinstance(params, datetime):
+        return DateTime().to_database(params)
+    if isinstance(params, _UUID):
+        return UUID().to_database(params)
+    if isinstance(params, _Decimal):
+        return Decimal().to_database(params)
+    return params
+
+
+def vertex(eid):
+    v = BenchmarkVertex()
+    v.eid = eid
+    return v
+
+
+def main(count=10000, repeat=5):
+    now = datetime.now()
+    cases = [
+        ('eids', {'eids': range(count), 'label': 'knows'}),
+        ('vertices', {'vertices': [vertex(i) for i in xrange(count)]}),
+        ('mixed', {'elements': [{'eid': i, 'attrs': {'name': str(i), 'vid': uuid4(), 'at': now}}
+                                for i in xrange(count)]}),
+    ]
+    for name, params in cases:
+        assert encode_param(params) == isinstance_chain(params)
+        for encoder in (isinstance_chain, encode_param):
+            best = min(timeit.repeat(lambda: encoder(params), number=1, repeat=repeat))
+            print '{:<10} {:<18} {:>8.2f} ms'.format(name, encoder.__name__, best * 1000)
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:2]])
@@ -35,7 +35,7 @@ setup(
         "Topic :: Software Development :: Libraries :: Python Modules",
     ],
     keywords='cassandra,titan,ogm,thunderdome',
-    install_requires=['pyparsing==1.5.7'],
+    install_requires=[],
     author='StartTheShift',
     author_email='dev@shift.com',
     url='https://github.com/StartTheShift/thunderdome',
@@ -20,9 +20,11 @@ import os
 
 from thunderdome.properties import *
 from thunderdome.exceptions import *
-from thunderdome.models import PaginatedVertex, Vertex, Edge, IN, OUT
-from thunderdome.gremlin import BaseGremlinMethod, GremlinMethod, GremlinValue, GremlinTable
+from thunderdome.models import PaginatedVertex, Vertex, Edge, IN, OUT, prefetch_vertices
+from thunderdome.gremlin import BaseGremlinMethod, GremlinMethod, GremlinValue, GremlinTable, register_param_encoder
+from thunderdome.cache import CachePolicy
 from thunderdome.containers import Table
+from thunderdome.session import Session
 
 __thunderdome_version_path__ = os.path.realpath(__file__ + '/../VERSION')
 __version__ = open(__thunderdome_version_path__, 'r').readline().strip()
@@ -0,0 +1,358 @@
+# Copyright (c) 2012-2013 SHIFT.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import atexit
+import itertools
+import logging
+import random
+import threading
+import time
+import weakref
+
+
+logger = logging.getLogger(__name__)
+
+#balancers running a health probe, stopped before the interpreter shuts down
+_probing = weakref.WeakSet()
+
+#seconds the interpreter waits at exit for a probe still checking a host
+PROBE_EXIT_TIMEOUT = 1.0
+
+
+class HostState(object):
+    """
+    Tracks the health and load of a single Rexster host.
+    """
+
+    # weight of the newest sample in the latency moving average
+    LATENCY_DECAY = 0.3
+
+    def __init__(self, host):
+        """
+        :param host: The host being tracked
+        :type host: thunderdome.connection.Host
+
+        """
+        self.host = host
+        self.up = True
+        self.failures = 0
+        self.retry_at = 0
+        self.outstanding = 0
+        self.latency = None
+        self.requests = 0
+
+    @property
+    def available(self):
+        """
+        Indicates whether requests may be sent to this host, down hosts become
+        available again for a single trial request once their backoff expires.
+
+        :rtype: boolean
+
+        """
+        return self.up or time.time() >= self.retry_at
+
+    def record_latency(self, elapsed):
+        if self.latency is None:
+            self.latency = elapsed
+        else:
+            self.latency += self.LATENCY_DECAY * (elapsed - self.latency)
+
+    def as_dict(self):
+        return {
+            'up': self.up,
+            'failures': self.failures,
+            'retry_at': self.retry_at,
+            'outstanding': self.outstanding,
+            'latency': self.latency,
+            'requests': self.requests,
+        }
+
+
+class BasePolicy(object):
+    """
+    Load balancing policies pick the host the next request is sent to from
+    the hosts which are currently available.
+    """
+
+    def choose(self, states):
+        """
+        Returns one of the given host states.
+
+        :param states: The available hosts, never empty
+        :type states: list of HostState
+        :rtype: HostState
+
+        """
+        raise NotImplementedError
+
+
+class RoundRobinPolicy(BasePolicy):
+    """Cycles through the available hosts."""
+
+    def __init__(self):
+        self._counter = itertools.count()
+
+    def choose(self, states):
+        return states[next(self._counter) % len(states)]
+
+
+class LeastOutstandingPolicy(BasePolicy):
+    """Picks the host with the fewest requests in flight."""
+
+    def __init__(self):
+        self._counter = itertools.count()
+
+    def choose(self, states):
+        fewest = min(s.outstanding for s in states)
+        candidates = [s for s in states if s.outstanding == fewest]
+        return candidates[next(self._counter) % len(candidates)]
+
+
+class LatencyWeightedPolicy(BasePolicy):
+    """
+    Picks hosts at random, weighted by the inverse of their average response
+    time. Hosts without any samples yet are treated as the fastest host so
+    they get measured.
+    """
+
+    def __init__(self, rand=random.random):
+        self._random = rand
+
+    def choose(self, states):
+        known = [s.latency for s in states if s.latency is not None]
+        fastest = min(known) if known else 1.0
+        weights = [1.0 / max(s.latency if s.latency is not None else fastest, 0.0001) for s in states]
+
+        target = self._random() * sum(weights)
+        for state, weight in zip(states, weights):
+            target -= weight
+            if target < 0:
+                return state
+        return states[-1]
+
+
+POLICIES = {
+    'round_robin': RoundRobinPolicy,
+    'least_outstanding': LeastOutstandingPolicy,
+    'latency_weighted': LatencyWeightedPolicy,
+}
+
+
+def get_policy(policy):
+    """
+    Returns a policy instance for the given policy name or instance.
+
+    :param policy: The policy name or an instance of BasePolicy
+    :type policy: str or BasePolicy
+    :rtype: BasePolicy
+
+    """
+    if isinstance(policy, BasePolicy):
+        return policy
+    try:
+        return POLICIES[policy]()
+    except KeyError:
+        raise ValueError("Unknown load balancing policy '{}', expected one of {}".format(
+            policy, ', '.join(sorted(POLICIES))))
+
+
+class LoadBalancer(object):
+    """
+    Distributes requests over a set of hosts, marking hosts down when they
+    fail and backing off exponentially before retrying them.
+    """
+
+    def __init__(self, hosts, policy='round_robin', retry_backoff=1.0, max_retry_backoff=60.0):
+        """
+        :param hosts: The hosts to balance across
+        :type hosts: list of thunderdome.connection.Host
+        :param policy: The load balancing policy name or instance
+        :type policy: str or BasePolicy
+        :param retry_backoff: Seconds a host is considered down after its first failure
+        :type retry_backoff: float
+        :param max_retry_backoff: Upper bound on the backoff between retries
+        :type max_retry_backoff: float
+
+        """
+        self.policy = get_policy(policy)
+        self.retry_backoff = retry_backoff
+        self.max_retry_backoff = max_retry_backoff
+        self.states = [HostState(h) for h in hosts]
+        self._by_host = {s.host: s for s in self.states}
+        self._lock = threading.Lock()
+        self._probe = None
+
+    def choose(self, exclude=()):
+        """
+        Picks the host for the next request and counts it as outstanding. If
+        every host is down the one which is due to be retried first is
+        returned, so requests fail fast with the real error. Returns None if
+        every host is excluded.
+
+        :param exclude: Hosts which have already been tried for this request
+        :type exclude: collection of Host
+        :rtype: HostState or None
+
+        """
+        with self._lock:
+            candidates = [s for s in self.states if s.host not in exclude]
+            if not candidates:
+                return None
+            available = [s for s in candidates if s.available]
+            if available:
+                state = self.policy.choose(available)
+            else:
+                state = min(candidates, key=lambda s: s.retry_at)
+            state.outstanding += 1
+            state.requests += 1
+            return state
+
+    def finish(self, state, elapsed=None, failed=False):
+        """
+        Records the outcome of a request sent to the given host.
+
+        :param state: The host state returned by choose
+        :type state: HostState
+        :param elapsed: Seconds the request took if it succeeded
+        :type elapsed: float or None
+        :param failed: Whether or not the host failed to serve the request
+        :type failed: boolean
+
+        """
+        with self._lock:
+            state.outstanding -= 1
+            if failed:
+                self._mark_down(state)
+            else:
+                if elapsed is not None:
+                    state.record_latency(elapsed)
+                self._mark_up(state)
+
+    def _mark_down(self, state):
+        if state.up:
+            logger.warning("Marking Rexster host {}:{} down".format(*state.host))
+        state.up = False
+        state.failures += 1
+        backoff = min(self.retry_backoff * 2 ** (state.failures - 1), self.max_retry_backoff)
+        state.retry_at = time.time() + backoff
+
+    def _mark_up(self, state):
+        if not state.up:
+            logger.warning("Rexster host {}:{} is back up".format(*state.host))
+        state.up = True
+        state.failures = 0
+        state.retry_at = 0
+
+    def mark_down(self, host):
+        with self._lock:
+            self._mark_down(self._by_host[host])
+
+    def mark_up(self, host):
+        with self._lock:
+            self._mark_up(self._by_host[host])
+
+    def down_hosts(self):
+        with self._lock:
+            return [s.host for s in self.states if not s.up]
+
+    def status(self):
+        """
+        Returns the state of every host keyed by "<hostname>:<port>".
+
+        :rtype: dict
+
+        """
+        with self._lock:
+            return {'{}:{}'.format(*s.host): s.as_dict() for s in self.states}
+
+    def start_probe(self, check, interval):
+        """
+        Starts a daemon thread which runs `check(host)` against every down host
+        every `interval` seconds and marks it up if the check returns True.
+
+        :param check: Callable returning whether the host is healthy
+        :type check: callable
+        :param interval: Seconds between probes
+        :type interval: float
+
+        """
+        self.stop_probe()
+        self._probe = HealthProbe(self, check, interval)
+        self._probe.start()
+        _probing.add(self)
+
+    def stop_probe(self, timeout=None):
+        """
+        Stops the health probe thread.
+
+        :param timeout: Seconds to wait for a check in progress to finish,
+        the thread is left to finish on its own if None
+        :type timeout: float or None
+
+        """
+        _probing.discard(self)
+        if self._probe is not None:
+            self._probe.stop()
+            if timeout is not None:
+                self._probe.join(timeout)
+            self._probe = None
+
+
+@atexit.register
+def _stop_probes():
+    """
+    Stops the running health probes, so their checks don't run into the
+    interpreter tearing down the modules they use.
+    """
+    for balancer in list(_probing):
+        balancer.stop_probe(PROBE_EXIT_TIMEOUT)
+
+
+class HealthProbe(threading.Thread):
+    """
+    Background thread bringing hosts which have been marked down back into
+    rotation once they respond again.
+    """
+
+    def __init__(self, balancer, check, interval):
+        super(HealthProbe, self).__init__(name='thunderdome-health-probe')
+        self.daemon = True
+        self.balancer = balancer
+        self.check = check
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.probe()
+
+    def probe(self):
+        for host in self.balancer.down_hosts():
+            if self._stopped.is_set():
+                return
+            try:
+                healthy = self.check(host)
+            except Exception:
+                healthy = False
+            if healthy:
+                self.balancer.mark_up(host)
+
+    def stop(self):
+        self._stopped.set()
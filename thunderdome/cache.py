@@ -0,0 +1,460 @@
+# Copyright (c) 2012-2013 SHIFT.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from collections import OrderedDict
+import json
+import sys
+import threading
+import time
+
+from thunderdome import futures
+
+
+class LRUCache(object):
+    """
+    Thread safe mapping keeping at most `maxsize` entries, evicting the least
+    recently used one first.
+    """
+
+    def __init__(self, maxsize=128):
+        """
+        :param maxsize: The maximum number of entries
+        :type maxsize: int
+
+        """
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """
+        Returns the value stored under key, marking it as recently used.
+
+        :param key: The key
+        :type key: hashable
+        :param default: Returned when the key isn't cached
+
+        """
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data[key] = value
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """
+        Stores value under key, evicting the least recently used entry if the
+        cache is full.
+
+        :param key: The key
+        :type key: hashable
+
+        """
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        """
+        Removes key from the cache if it is there.
+
+        :param key: The key
+        :type key: hashable
+
+        """
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+class CacheBackend(object):
+    """
+    Storage used by the element cache. Values are strings, so stores shared
+    between processes (e.g. memcached) can be used by implementing these
+    methods.
+    """
+
+    def get(self, key):
+        """
+        Returns the value stored under key or None.
+
+        :param key: The key
+        :type key: str
+        :rtype: str or None
+
+        """
+        raise NotImplementedError
+
+    def get_many(self, keys):
+        """
+        Returns a dict of the values stored under the given keys, missing keys
+        are left out.
+
+        :param keys: The keys
+        :type keys: list of str
+        :rtype: dict
+
+        """
+        values = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                values[key] = value
+        return values
+
+    def set(self, key, value, ttl=None):
+        """
+        Stores value under key.
+
+        :param key: The key
+        :type key: str
+        :param value: The value
+        :type value: str
+        :param ttl: Number of seconds the value stays valid, forever if None
+        :type ttl: float or None
+
+        """
+        raise NotImplementedError
+
+    def delete_many(self, keys):
+        """
+        Removes the given keys.
+
+        :param keys: The keys
+        :type keys: list of str
+
+        """
+        raise NotImplementedError
+
+    def clear(self):
+        """
+        Removes every key.
+        """
+        raise NotImplementedError
+
+
+class LocalCacheBackend(CacheBackend):
+    """
+    In process backend keeping at most `max_entries` values, evicting the
+    least recently used ones and dropping values once their ttl expired.
+    """
+
+    def __init__(self, max_entries=10000, clock=time.time):
+        """
+        :param max_entries: The maximum number of values kept
+        :type max_entries: int
+        :param clock: Returns the current time in seconds
+        :type clock: callable
+
+        """
+        self._lru = LRUCache(max_entries)
+        self._clock = clock
+
+    def get(self, key):
+        entry = self._lru.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires is not None and expires <= self._clock():
+            self._lru.delete(key)
+            return None
+        return value
+
+    def set(self, key, value, ttl=None):
+        expires = self._clock() + ttl if ttl is not None else None
+        self._lru.set(key, (expires, value))
+
+    def delete_many(self, keys):
+        for key in keys:
+            self._lru.delete(key)
+
+    def clear(self):
+        self._lru.clear()
+
+    def __len__(self):
+        return len(self._lru)
+
+
+class ElementCache(object):
+    """
+    Read through cache of the raw data of vertices and edges, looked up by
+    Vertex.get, Vertex.all, Vertex.get_by_eid and Edge.get_by_eid. Saving or
+    deleting elements through thunderdome invalidates their entries, changes
+    made by other clients are picked up once the ttl expires.
+    """
+
+    def __init__(self, backend=None, ttl=300, prefix='thunderdome:'):
+        """
+        :param backend: The storage, an in process LocalCacheBackend by default
+        :type backend: CacheBackend
+        :param ttl: Number of seconds entries stay valid
+        :type ttl: float or None
+        :param prefix: Prefixed to every key, keeps graphs sharing a store apart
+        :type prefix: str
+
+        """
+        self.backend = backend if backend is not None else LocalCacheBackend()
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _key(self, kind, value):
+        return '{}{}:{}'.format(self.prefix, kind, value)
+
+    def vertex_keys(self, eid=None, vid=None):
+        keys = []
+        if eid is not None:
+            keys.append(self._key('v', eid))
+        if vid is not None:
+            keys.append(self._key('vid', vid))
+        return keys
+
+    def edge_keys(self, eid):
+        return [self._key('e', eid)]
+
+    def vertices_by_vid(self, vids):
+        """
+        Returns a dict of the cached data of the vertices with the given vids.
+
+        :param vids: The vids
+        :type vids: list of str
+        :rtype: dict
+
+        """
+        keys = {self._key('vid', vid): vid for vid in vids}
+        found = self.backend.get_many(list(keys))
+        return {keys[k]: json.loads(v) for k, v in found.items()}
+
+    def vertex_by_eid(self, eid):
+        return self._load(self._key('v', eid))
+
+    def edge_by_eid(self, eid):
+        return self._load(self._key('e', eid))
+
+    def _load(self, key):
+        value = self.backend.get(key)
+        return json.loads(value) if value is not None else None
+
+    def store(self, data):
+        """
+        Caches the raw data of a vertex or edge returned by rexster.
+
+        :param data: The element data
+        :type data: dict
+
+        """
+        value = json.dumps(data)
+        if data.get('_type') == 'vertex':
+            keys = self.vertex_keys(data.get('_id'), data.get('vid'))
+        else:
+            keys = self.edge_keys(data.get('_id'))
+        for key in keys:
+            self.backend.set(key, value, self.ttl)
+
+    def invalidate(self, keys):
+        """
+        Removes the given keys, see vertex_keys and edge_keys.
+
+        :param keys: The keys
+        :type keys: list of str
+
+        """
+        if keys:
+            self.backend.delete_many(keys)
+
+    def clear(self):
+        self.backend.clear()
+
+
+_element_cache = None
+
+
+def configure(element_cache):
+    """
+    Sets the element cache used by the models, None disables caching.
+
+    :param element_cache: The element cache
+    :type element_cache: ElementCache or None
+
+    """
+    global _element_cache
+    _element_cache = element_cache
+
+
+def element_cache():
+    """
+    Returns the configured element cache, if any.
+
+    :rtype: ElementCache or None
+
+    """
+    return _element_cache
+
+
+class CachePolicy(object):
+    """
+    Memoizes the raw results of a gremlin method, keyed on the method and its
+    parameters, see GremlinMethod's cache argument. Results are cached before
+    deserialization so every hit builds fresh elements. Concurrent misses for
+    the same key are coalesced into a single query.
+
+    recommendations = GremlinMethod(cache=CachePolicy(ttl=300))
+    """
+
+    def __init__(self, ttl=60, max_entries=1000, key=None, backend=None):
+        """
+        :param ttl: Number of seconds results stay valid, forever if None
+        :type ttl: float or None
+        :param max_entries: The maximum number of results kept by the default
+        in process backend
+        :type max_entries: int
+        :param key: Builds the cache key from the parameters sent to the
+        method, by default all of them are used
+        :type key: callable
+        :param backend: Where results are stored
+        :type backend: CacheBackend
+
+        """
+        self.ttl = ttl
+        self.key = key
+        self.backend = backend if backend is not None else LocalCacheBackend(max_entries)
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def make_key(self, name, params):
+        """
+        Returns the key results of the named method called with params are
+        cached under.
+
+        :param name: The method name
+        :type name: str
+        :param params: The parameters sent to the method
+        :type params: dict
+        :rtype: str
+
+        """
+        if self.key is not None:
+            part = self.key(params)
+        else:
+            part = json.dumps(params, sort_keys=True, default=str)
+        return '{}:{}'.format(name, part)
+
+    def fetch(self, key, load):
+        """
+        Returns the results cached under key, calling load on a miss. Callers
+        missing the same key while load runs wait for its results. Results
+        which can't be serialized aren't cached, the waiting callers then call
+        load themselves.
+
+        :param key: The cache key
+        :type key: str
+        :param load: Runs the query
+        :type load: callable
+
+        """
+        value = self.backend.get(key)
+        if value is not None:
+            return json.loads(value)
+
+        with self._lock:
+            pending = self._pending.get(key)
+            leader = pending is None
+            if leader:
+                pending = self._pending[key] = futures.Future()
+        if not leader:
+            value = pending.result()
+            if value is None:
+                #the results couldn't be cached, the query is run again
+                return load()
+            return json.loads(value)
+
+        try:
+            results = load()
+        except:
+            exc_info = sys.exc_info()
+            self._finish(key, pending, None, exc_info)
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+        if isinstance(results, futures.Future):
+            #deferred by a batch, later calls on this thread can't wait for it
+            with self._lock:
+                self._pending.pop(key, None)
+
+            def _store(future):
+                self._finish(key, pending, future._result, future._exc_info)
+            results.add_done_callback(_store)
+            return results
+
+        self._finish(key, pending, results, None)
+        return results
+
+    def _finish(self, key, pending, results, exc_info):
+        #waiting callers get their own copy of the results, or None when
+        #they can't be serialized and each caller loads them itself
+        value = None
+        if exc_info is None:
+            try:
+                value = json.dumps(results)
+            except (TypeError, ValueError):
+                pass
+            else:
+                self.backend.set(key, value, self.ttl)
+        with self._lock:
+            if self._pending.get(key) is pending:
+                del self._pending[key]
+        if exc_info is None:
+            pending.set_result(value)
+        else:
+            pending.set_exc_info(exc_info)
+
+    def invalidate(self, key):
+        """
+        Drops the results cached under key.
+
+        :param key: The cache key, see make_key
+        :type key: str
+
+        """
+        self.backend.delete_many([key])
+
+    def clear(self):
+        """
+        Drops every cached result.
+        """
+        self.backend.clear()
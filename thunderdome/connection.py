@@ -18,7 +18,6 @@
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 from collections import namedtuple
-import httplib
 import json
 import logging
 import Queue
@@ -26,9 +25,16 @@ import random
 import re
 import socket
 import textwrap
+import threading
 
+from thunderdome import cache
+from thunderdome.balancing import LoadBalancer
 from thunderdome.exceptions import ThunderdomeException
+from thunderdome import futures
+from thunderdome import groovy
+from thunderdome.pool import PoolTimeoutError
 from thunderdome.spec import Spec
+from thunderdome.transports import get_transport, HostConnectError, HTTPTransport, with_definitions
 
 
 logger = logging.getLogger(__name__)
@@ -84,6 +90,12 @@ _password = None
 _index_all_fields = True
 _existing_indices = None
 _statsd = None
+_transport = None
+_pool_options = {}
+_balancer = None
+_balancer_options = {}
+_register_functions = False
+_local = threading.local()
 
 
 def create_key_index(name):
@@ -91,11 +103,11 @@ def create_key_index(name):
     Creates a key index if it does not already exist
     """
     global _existing_indices
-    _existing_indices = _existing_indices or execute_query('g.getIndexedKeys(Vertex.class)')
+    _existing_indices = _existing_indices or execute_query('g.getIndexedKeys(Vertex.class)', batchable=False)
     if name not in _existing_indices:
         execute_query(
             "g.createKeyIndex(keyname, Vertex.class); g.stopTransaction(SUCCESS)",
-            {'keyname':name}, transaction=False)
+            {'keyname':name}, transaction=False, batchable=False)
         _existing_indices = None
 
         
@@ -104,16 +116,20 @@ def create_unique_index(name, data_type):
     Creates a key index if it does not already exist
     """
     global _existing_indices
-    _existing_indices = _existing_indices or execute_query('g.getIndexedKeys(Vertex.class)')
+    _existing_indices = _existing_indices or execute_query('g.getIndexedKeys(Vertex.class)', batchable=False)
     
     if name not in _existing_indices:
         execute_query(
             "g.makeType().name(name).dataType({}.class).functional().unique().indexed().makePropertyKey(); g.stopTransaction(SUCCESS)".format(data_type),
-            {'name':name}, transaction=False)
+            {'name':name}, transaction=False, batchable=False)
         _existing_indices = None
 
         
-def setup(hosts, graph_name, username=None, password=None, index_all_fields=False, statsd=None):
+def setup(hosts, graph_name, username=None, password=None, index_all_fields=False, statsd=None,
+          pool_size=10, pool_timeout=None, pool_idle_timeout=60, pool_max_lifetime=600,
+          load_balancing='round_robin', health_check_interval=5.0, retry_backoff=1.0,
+          max_retry_backoff=60.0, transport='http', max_concurrency=None, register_functions=False,
+          element_cache=None, groovy_cache_dir=None):
     """
     Records the hosts and connects to one of them.
 
@@ -129,6 +145,40 @@ def setup(hosts, graph_name, username=None, password=None, index_all_fields=Fals
     :type index_all_fields: boolean
     :param statsd: host:port or just host of statsd server to report metrics to
     :type statsd: str
+    :param pool_size: Maximum number of persistent connections per host
+    :type pool_size: int
+    :param pool_timeout: Seconds to wait for a free connection (None waits forever)
+    :type pool_timeout: float or None
+    :param pool_idle_timeout: Seconds an idle connection is kept open
+    :type pool_idle_timeout: float or None
+    :param pool_max_lifetime: Seconds after which a connection is recycled
+    :type pool_max_lifetime: float or None
+    :param load_balancing: 'round_robin', 'least_outstanding', 'latency_weighted'
+    or a thunderdome.balancing.BasePolicy instance
+    :type load_balancing: str or BasePolicy
+    :param health_check_interval: Seconds between probes of hosts marked down,
+    None disables the background probe
+    :type health_check_interval: float or None
+    :param retry_backoff: Seconds a failed host is skipped before it is retried,
+    doubled on each consecutive failure
+    :type retry_backoff: float
+    :param max_retry_backoff: Upper bound on the retry backoff
+    :type max_retry_backoff: float
+    :param transport: 'http' for the JSON gremlin extension, 'rexpro' for the
+    binary RexPro protocol, or a thunderdome.transports.BaseTransport instance
+    :type transport: str or BaseTransport
+    :param max_concurrency: Maximum number of graph calls the *_async methods
+    run at once, defaults to pool_size
+    :type max_concurrency: int or None
+    :param register_functions: Define gremlin methods once per session and
+    call them by name, only used by transports keeping sessions (rexpro)
+    :type register_functions: boolean
+    :param element_cache: Cache the elements looked up by get, all and
+    get_by_eid, True for an in process cache
+    :type element_cache: thunderdome.cache.ElementCache or boolean or None
+    :param groovy_cache_dir: Directory parsed groovy files are cached in,
+    shared by processes on the same host
+    :type groovy_cache_dir: str or None
     :rtype None
     """
     global _hosts
@@ -137,11 +187,33 @@ def setup(hosts, graph_name, username=None, password=None, index_all_fields=Fals
     global _password
     global _index_all_fields
     global _statsd
+    global _pool_options
+    global _balancer
+    global _balancer_options
+    global _transport
+    global _register_functions
 
     _graph_name = graph_name
     _username = username
     _password = password
     _index_all_fields = index_all_fields
+    _register_functions = register_functions
+    _pool_options = {
+        'size': pool_size,
+        'timeout': pool_timeout,
+        'idle_timeout': pool_idle_timeout,
+        'max_lifetime': pool_max_lifetime,
+    }
+    futures.configure(max_concurrency or pool_size)
+    if element_cache is True:
+        element_cache = cache.ElementCache(prefix='thunderdome:{}:'.format(graph_name))
+    cache.configure(element_cache or None)
+    groovy.configure_cache(groovy_cache_dir)
+    _balancer_options = {
+        'policy': load_balancing,
+        'retry_backoff': retry_backoff,
+        'max_retry_backoff': max_retry_backoff,
+    }
 
 
     if statsd:
@@ -157,11 +229,12 @@ def setup(hosts, graph_name, username=None, password=None, index_all_fields=Fals
         except:
             raise
 
+    new_transport = get_transport(transport)
     for host in hosts:
         host = host.strip()
         host = host.split(':')
         if len(host) == 1:
-            _hosts.append(Host(host[0], 8182))
+            _hosts.append(Host(host[0], new_transport.default_port))
         elif len(host) == 2:
             _hosts.append(Host(*host))
         else:
@@ -171,6 +244,17 @@ def setup(hosts, graph_name, username=None, password=None, index_all_fields=Fals
         raise ThunderdomeConnectionError("At least one host required")
 
     random.shuffle(_hosts)
+
+    if _transport is not None:
+        _transport.close()
+    _transport = new_transport
+    _transport.configure(graph_name, username, password, _pool_options)
+
+    if _balancer is not None:
+        _balancer.stop_probe()
+    _balancer = LoadBalancer(_hosts, **_balancer_options)
+    if health_check_interval is not None:
+        _balancer.start_probe(_transport.probe, health_check_interval)
     
     create_unique_index('vid', 'String')
 
@@ -180,18 +264,100 @@ def setup(hosts, graph_name, username=None, password=None, index_all_fields=Fals
         klass._create_indices()
     
     
-def execute_query(query, params={}, transaction=True, context=""):
+def _get_transport():
+    """
+    Returns the configured transport, defaulting to HTTP.
+
+    :rtype: thunderdome.transports.BaseTransport
+
+    """
+    global _transport
+    if _transport is None:
+        transport = HTTPTransport()
+        transport.configure(_graph_name, _username, _password, _pool_options)
+        _transport = transport
+    return _transport
+
+
+def _get_balancer():
+    """
+    Returns the load balancer for the configured hosts, rebuilding it if the
+    host list changed since it was created.
+
+    :rtype: thunderdome.balancing.LoadBalancer
+
+    """
+    global _balancer
+    balancer = _balancer
+    if balancer is None or [s.host for s in balancer.states] != _hosts:
+        if balancer is not None:
+            balancer.stop_probe()
+        balancer = _balancer = LoadBalancer(_hosts, **_balancer_options)
+    return balancer
+
+
+def host_status():
+    """
+    Returns the load balancer's view of every host keyed by
+    "<hostname>:<port>".
+
+    :rtype: dict
+
+    """
+    return _get_balancer().status()
+
+
+def pool_stats():
+    """
+    Returns connection pool statistics keyed by "<hostname>:<port>".
+
+    :rtype: dict
+
     """
-    Execute a raw Gremlin query with the given parameters passed in.
+    return _get_transport().pool_stats()
+
+
+def registered_functions_enabled():
+    """
+    Indicates whether gremlin methods should be called by name, relying on
+    the transport to define them once per session.
+
+    :rtype: boolean
+
+    """
+    return _register_functions and _get_transport().supports_functions and _current_batch() is None
+
+
+def execute_query(query, params={}, transaction=True, context="", batchable=True, functions=None,
+                  stream=False):
+    """
+    Execute a raw Gremlin query with the given parameters passed in. Inside a
+    batch() block the query is queued and a thunderdome.futures.Future of its
+    results is returned instead. With stream=True a Cursor is returned, which
+    yields the results as they are read from the response.
 
     :param query: The Gremlin query to be executed
     :type query: str
     :param params: Parameters to the Gremlin query
     :type params: dict
     :param context: String context data to include with the query for stats logging
+    :param batchable: Whether the query may be deferred by an active batch
+    :type batchable: boolean
+    :param functions: (name, definition) pairs of the functions the query
+    calls, defined by the transport if the connection doesn't know them yet
+    :type functions: list of tuple
+    :param stream: Return a Cursor over the results, streamed queries are never
+    deferred by a batch
+    :type stream: boolean
     :rtype: dict
     
     """
+    current_batch = _current_batch() if batchable and not stream else None
+    if current_batch is not None:
+        if functions:
+            query = with_definitions(query, functions)
+        return current_batch.add(query, params, transaction=transaction, context=context)
+
     if transaction:
         query = "g.stopTransaction(FAILURE)\n" + query
 
@@ -199,42 +365,50 @@ def execute_query(query, params={}, transaction=True, context=""):
     if len(_hosts) <= 0:
         raise ThunderdomeConnectionError('Attempt to execute query before calling thunderdome.connection.setup')
     
-    host = _hosts[0]
-    #url = 'http://{}/graphs/{}/tp/gremlin'.format(host.name, _graph_name)
-    data = json.dumps({'script':query, 'params': params})
-    headers = {'Content-Type':'application/json', 'Accept':'application/json', 'Accept-Charset':'utf-8'}
+    balancer = _get_balancer()
+    transport = _get_transport()
     import time
-    try:
-        start_time = time.time()
-        conn = httplib.HTTPConnection(host.name, host.port)
-        conn.request("POST", '/graphs/{}/tp/gremlin'.format(_graph_name), data, headers)
-        response = conn.getresponse()
-        content = response.read()
+    tried = set()
+    while True:
+        state = balancer.choose(exclude=tried)
+        tried.add(state.host)
+        try:
+            start_time = time.time()
+            if stream:
+                status, response_data = transport.stream(state.host, query, params, functions)
+            else:
+                status, response_data = transport.execute(state.host, query, params, functions)
+        except PoolTimeoutError as pte:
+            balancer.finish(state)
+            raise ThunderdomeConnectionError(str(pte))
+        except ValueError as ve:
+            balancer.finish(state)
+            raise ThunderdomeQueryError('Loading Rexster results failed: "{}"'.format(ve))
+        except socket.error as sock_err:
+            balancer.finish(state, failed=True)
+            if _statsd:
+                total_time = int((time.time() - start_time) * 1000)
+                _statsd.incr("thunderdome.socket_error".format(context), total_time)
+            # only fail over if nothing reached the server, the query may not be idempotent
+            if isinstance(sock_err, HostConnectError) and len(tried) < len(balancer.states):
+                logger.warning("Can't connect to {}:{} - {}, trying another host".format(
+                    state.host.name, state.host.port, sock_err))
+                continue
+            raise ThunderdomeQueryError('Socket error during query - {}'.format(sock_err))
+        except:
+            balancer.finish(state)
+            raise
 
-        total_time = int((time.time() - start_time) * 1000)
+        elapsed = time.time() - start_time
+        balancer.finish(state, elapsed=elapsed)
+        total_time = int(elapsed * 1000)
 
         if context and _statsd:
             _statsd.timing("{}.timer".format(context), total_time)
             _statsd.incr("{}.counter".format(context))
+        break
 
-
-    except socket.error as sock_err:
-        if _statsd:
-            total_time = int((time.time() - start_time) * 1000)
-            _statsd.incr("thunderdome.socket_error".format(context), total_time)
-        raise ThunderdomeQueryError('Socket error during query - {}'.format(sock_err))
-    except:
-        raise
-    
-    logger.info(json.dumps(data))
-    logger.info(content)
-
-    try:
-        response_data = json.loads(content)
-    except ValueError as ve:
-        raise ThunderdomeQueryError('Loading Rexster results failed: "{}"'.format(ve))
-    
-    if response.status != 200:
+    if status != 200:
         if 'message' in response_data and len(response_data['message']) > 0:
             graph_missing_re = r"Graph \[(.*)\] could not be found"
             if re.search(graph_missing_re, response_data['message']):
@@ -252,9 +426,234 @@ def execute_query(query, params={}, transaction=True, context=""):
                 response_data
             )
 
+    if stream:
+        return Cursor(response_data['results'])
     return response_data['results'] 
 
 
+class Cursor(object):
+    """
+    Iterates over the results of a streamed query as they are read from the
+    response. Close cursors which aren't read to the end so their connection
+    is released.
+    """
+
+    def __init__(self, results, transforms=()):
+        """
+        :param results: The streamed results
+        :type results: thunderdome.transports.ResultStream
+        :param transforms: Callables applied to each result in order
+        :type transforms: tuple
+
+        """
+        self._results = results
+        self._transforms = transforms
+
+    def __iter__(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    def next(self):
+        try:
+            result = next(self._results)
+        except StopIteration:
+            raise
+        except socket.error as sock_err:
+            raise ThunderdomeQueryError('Socket error during query - {}'.format(sock_err))
+        except ValueError as ve:
+            raise ThunderdomeQueryError('Loading Rexster results failed: "{}"'.format(ve))
+        for fn in self._transforms:
+            result = fn(result)
+        return result
+
+    def map(self, fn):
+        """
+        Returns a cursor over the same results, applying fn to each of them.
+
+        :param fn: The transformation
+        :type fn: callable
+        :rtype: Cursor
+
+        """
+        return Cursor(self._results, self._transforms + (fn,))
+
+    def close(self):
+        """
+        Stops reading the results.
+        """
+        self._results.close()
+
+
+def _current_batch():
+    """
+    Returns the innermost batch active on this thread, if any.
+
+    :rtype: Batch or None
+
+    """
+    stack = getattr(_local, 'batches', None)
+    return stack[-1] if stack else None
+
+
+def batch():
+    """
+    Returns a context manager collecting the queries run inside it into a
+    single script, sent to Rexster in one round trip when the block exits.
+
+    with connection.batch() as b:
+        person.save()
+        friends = person.outV(Friend)
+    friends.result()
+
+    :rtype: Batch
+
+    """
+    return Batch()
+
+
+class Batch(object):
+    """
+    Queues queries and sends them as one script. Each query runs in its own
+    closure with its parameters renamed so they can't collide, and errors are
+    caught per query so one failing call doesn't prevent the others from
+    running, just as if they had been sent separately.
+    """
+
+    # wraps each query result the way the gremlin extension wraps a script result
+    _prelude = textwrap.dedent("""\
+        _td_wrap = { r ->
+            if (r == null) { return [] }
+            if (r instanceof Iterator) { return r.toList() }
+            if (r instanceof Iterable) { return r.toList() }
+            return [r]
+        }
+        _td_call = { f ->
+            try {
+                return [true, _td_wrap(f())]
+            } catch (err) {
+                g.stopTransaction(FAILURE)
+                return [false, err.toString()]
+            }
+        }
+        """)
+
+    def __init__(self):
+        self._calls = []
+        self._executed = False
+        self.futures = []
+
+    def __enter__(self):
+        if not hasattr(_local, 'batches'):
+            _local.batches = []
+        _local.batches.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        _local.batches.remove(self)
+        if exc_type is not None:
+            self._fail(ThunderdomeException('Batch aborted by {}'.format(exc_type.__name__)))
+            return False
+        self.execute()
+        return False
+
+    def __len__(self):
+        return len(self._calls)
+
+    def add(self, query, params=None, transaction=True, context=""):
+        """
+        Queues a query and returns a Future of its results.
+
+        :param query: The Gremlin query to be executed
+        :type query: str
+        :param params: Parameters to the Gremlin query
+        :type params: dict
+        :param transaction: Roll back any open transaction before running the query
+        :type transaction: boolean
+        :rtype: thunderdome.futures.Future
+
+        """
+        if self._executed:
+            raise ThunderdomeException('Batch has already been executed')
+        future = futures.Future()
+        self._calls.append((query, params or {}, transaction, future))
+        self.futures.append(future)
+        return future
+
+    def compile(self):
+        """
+        Returns the combined script and its parameters.
+
+        :rtype: tuple
+
+        """
+        functions = {}
+        definitions = []
+        invocations = []
+        params = {}
+        for i, (query, call_params, transaction, future) in enumerate(self._calls):
+            names = sorted(call_params.keys())
+            if transaction:
+                query = "g.stopTransaction(FAILURE)\n" + query
+            key = (tuple(names), query)
+            if key not in functions:
+                functions[key] = '_td_f{}'.format(len(functions))
+                definitions.append('{} = {{ {} ->\n{}\n}}'.format(functions[key], ', '.join(names), query))
+
+            bound = []
+            for name in names:
+                param = '_td_{}_{}'.format(i, name)
+                params[param] = call_params[name]
+                bound.append(param)
+            invocations.append('_td_call({{ -> {}({}) }})'.format(functions[key], ', '.join(bound)))
+
+        script = '{}{}\n[{}]'.format(self._prelude, '\n'.join(definitions), ',\n'.join(invocations))
+        return script, params
+
+    def execute(self):
+        """
+        Sends the queued queries and resolves their futures, returns the list
+        of results in the order the queries were added. Queries which failed
+        are represented by their exception.
+
+        :rtype: list
+
+        """
+        if self._executed:
+            raise ThunderdomeException('Batch has already been executed')
+        self._executed = True
+        if not self._calls:
+            return []
+
+        script, params = self.compile()
+        try:
+            results = execute_query(script, params, transaction=False, context='batch', batchable=False)
+        except Exception as ex:
+            self._fail(ex)
+            raise
+
+        outcomes = []
+        for (query, call_params, transaction, future), (success, result) in zip(self._calls, results):
+            if success:
+                future.set_result(result)
+            else:
+                result = ThunderdomeQueryError(result, {'message': result})
+                future.set_exception(result)
+            outcomes.append(result)
+        return outcomes
+
+    def _fail(self, ex):
+        self._executed = True
+        for query, call_params, transaction, future in self._calls:
+            if not future.done():
+                future.set_exception(ex)
+
+
 def sync_spec(filename, host, graph_name, dry_run=False):
     """
     Sync the given spec file to thunderdome.
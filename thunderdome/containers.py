@@ -17,6 +17,12 @@
 # IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+import base64
+import json
+
+from thunderdome.exceptions import InvalidContinuationToken
+
+
 class Row(object):
     def __init__(self, data):
         for k,v in data.iteritems():
@@ -73,3 +79,59 @@ class Table(object):
     
     def __len__(self):
         return len(self._gremlin_result)
+
+
+class Page(list):
+    """
+    A page of keyset paginated results. Pass next_token as the `after`
+    argument of the same call to get the following page, it is None on the
+    last page. Declaring the sort key as the primary_key column of the edge
+    class lets each page stop reading edges once it is full.
+
+    page = vertex.outV(Follows, per_page=50, after=None, sort_key='since')
+    while page.next_token is not None:
+        page = vertex.outV(Follows, per_page=50, after=page.next_token, sort_key='since')
+    """
+
+    def __init__(self, results, next_token=None):
+        super(Page, self).__init__(results)
+        self.next_token = next_token
+
+
+def encode_token(sort_key, position):
+    """
+    Encodes the position of the last edge of a page into an opaque
+    continuation token.
+
+    :param sort_key: The edge property the results are ordered by
+    :type sort_key: str or None
+    :param position: The sort key value and id of the edge
+    :type position: list
+    :rtype: str
+
+    """
+    return base64.urlsafe_b64encode(json.dumps([sort_key] + list(position)))
+
+
+def decode_token(token, sort_key):
+    """
+    Decodes a continuation token into the position to resume after.
+
+    :param token: The token returned with the previous page, None for the
+    first page
+    :type token: str or None
+    :param sort_key: The edge property the results are ordered by
+    :type sort_key: str or None
+    :rtype: list or None
+
+    """
+    if token is None:
+        return None
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(str(token)))
+        token_key, value, eid = decoded
+    except (TypeError, ValueError):
+        raise InvalidContinuationToken('malformed continuation token: {}'.format(token))
+    if token_key != sort_key:
+        raise InvalidContinuationToken('continuation token was issued for sort key {}'.format(token_key))
+    return [value, eid]
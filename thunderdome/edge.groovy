@@ -36,6 +36,65 @@ def _save_edge(eid, outV, inV, label, attrs, exclusive) {
 }
 
 
+def _save_edges(label, exclusive, elements) {
+	/**
+	 * Creates a list of edges with the same label in a single transaction
+	 *
+	 * :param label: the label of the edges
+	 * :param exclusive: if true, an existing edge with the label between the same vertices is modified instead of creating another edge
+	 * :param elements: list of maps holding the out_eid or out_vid, the in_eid or in_vid and the attrs of each edge
+	 */
+	try {
+		vertices = [:]
+		resolve = { eid, vid ->
+			def key = eid != null ? eid : 'vid:' + vid
+			if (!vertices.containsKey(key)) {
+				vertices[key] = eid != null ? g.v(eid) : g.V('vid', vid).toList()[0]
+			}
+			if (vertices[key] == null) {
+				throw new IllegalArgumentException('vertex ' + key + ' not found')
+			}
+			return vertices[key]
+		}
+
+		// existing edges of each out vertex, looked up once and keyed by in vertex id
+		existing = [:]
+		edges = []
+		for (element in elements) {
+			outV = resolve(element.out_eid, element.out_vid)
+			inV = resolve(element.in_eid, element.in_vid)
+			e = null
+			if (exclusive) {
+				if (!existing.containsKey(outV.id)) {
+					byInV = [:]
+					outV.outE(label).each{ byInV[it.getVertex(Direction.IN).id] = it }
+					existing[outV.id] = byInV
+				}
+				e = existing[outV.id][inV.id]
+			}
+			if (e == null) {
+				e = g.addEdge(outV, inV, label)
+				if (exclusive) {
+					existing[outV.id][inV.id] = e
+				}
+			}
+			for (item in element.attrs.entrySet()) {
+				if (item.value == null) {
+					e.removeProperty(item.key)
+				} else {
+					e.setProperty(item.key, item.value)
+				}
+			}
+			edges << e
+		}
+		g.stopTransaction(SUCCESS)
+		return edges.collect{g.getEdge(it.id)}
+	} catch (err) {
+		g.stopTransaction(FAILURE)
+		throw(err)
+	}
+}
+
 def _get_edges_between(out_v, in_v, label, page_num, per_page) {
   try {
     results = g.v(out_v).outE(label).as('e').inV().retain([g.v(in_v)]).back('e')
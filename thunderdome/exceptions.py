@@ -23,4 +23,4 @@ class ValidationError(ThunderdomeException): pass
 class DoesNotExist(ThunderdomeException): pass
 class MultipleObjectsReturned(ThunderdomeException): pass
 class WrongElementType(ThunderdomeException): pass
-
+class InvalidContinuationToken(ThunderdomeException): pass
@@ -0,0 +1,362 @@
+# Copyright (c) 2012-2013 SHIFT.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import logging
+import Queue
+import sys
+import threading
+
+from thunderdome.exceptions import ThunderdomeException
+
+
+logger = logging.getLogger(__name__)
+
+
+class FutureTimeoutError(ThunderdomeException):
+    """
+    The result of a future wasn't available in time
+    """
+
+
+class Future(object):
+    """
+    The eventual result of a graph call running concurrently with the caller.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._done = False
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+
+    def done(self):
+        """
+        Indicates whether or not the result is available.
+
+        :rtype: boolean
+
+        """
+        with self._cond:
+            return self._done
+
+    def _wait(self, timeout):
+        with self._cond:
+            if not self._done:
+                self._cond.wait(timeout)
+            if not self._done:
+                raise FutureTimeoutError("Result not available after {} seconds".format(timeout))
+
+    def result(self, timeout=None):
+        """
+        Blocks until the call completes and returns its result, re-raising the
+        exception if it failed.
+
+        :param timeout: Maximum number of seconds to wait
+        :type timeout: float or None
+
+        """
+        self._wait(timeout)
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+    def exception(self, timeout=None):
+        """
+        Blocks until the call completes and returns the exception it raised, if
+        any.
+
+        :param timeout: Maximum number of seconds to wait
+        :type timeout: float or None
+        :rtype: Exception or None
+
+        """
+        self._wait(timeout)
+        return self._exc_info[1] if self._exc_info is not None else None
+
+    def add_done_callback(self, fn):
+        """
+        Calls fn with this future once it completes, immediately if it already
+        has.
+
+        :param fn: The callback
+        :type fn: callable
+
+        """
+        with self._cond:
+            if not self._done:
+                self._callbacks.append(fn)
+                return
+        self._run_callback(fn)
+
+    def then(self, fn, errback=None):
+        """
+        Returns a new future resolving to fn(result) once this one completes.
+        Exceptions propagate to the new future without calling fn, unless an
+        errback is given, in which case the new future resolves to
+        errback(exception) or to whatever exception the errback raises.
+
+        :param fn: Callable transforming the result
+        :type fn: callable
+        :param errback: Callable handling an exception
+        :type errback: callable or None
+        :rtype: Future
+
+        """
+        chained = Future()
+
+        def _transform(future):
+            try:
+                if future._exc_info is None:
+                    chained.set_result(fn(future._result))
+                elif errback is not None:
+                    chained.set_result(errback(future._exc_info[1]))
+                else:
+                    chained.set_exc_info(future._exc_info)
+            except:
+                chained.set_exc_info(sys.exc_info())
+
+        self.add_done_callback(_transform)
+        return chained
+
+    def set_result(self, result):
+        self._complete(result, None)
+
+    def set_exception(self, exc):
+        self._complete(None, (type(exc), exc, None))
+
+    def set_exc_info(self, exc_info):
+        self._complete(None, exc_info)
+
+    def _complete(self, result, exc_info):
+        with self._cond:
+            if self._done:
+                raise ThunderdomeException("Future already completed")
+            self._result = result
+            self._exc_info = exc_info
+            self._done = True
+            callbacks, self._callbacks = self._callbacks, []
+            self._cond.notify_all()
+        for fn in callbacks:
+            self._run_callback(fn)
+
+    def _run_callback(self, fn):
+        try:
+            fn(self)
+        except Exception:
+            logger.exception("Exception in future callback")
+
+
+def completed(result):
+    """
+    Returns a future which has already resolved to the given result.
+
+    :rtype: Future
+
+    """
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def chain(value, fn, errback=None):
+    """
+    Applies fn to value, or to its result once available if value is a
+    future, so code can post-process results without caring whether the call
+    that produced them was deferred. The errback is only used for futures,
+    exceptions raised by calls which ran immediately have already propagated.
+
+    :param value: A result or a Future
+    :type value: mixed
+    :param fn: Callable transforming the result
+    :type fn: callable
+    :param errback: Callable handling an exception raised by a deferred call
+    :type errback: callable or None
+
+    """
+    if isinstance(value, Future):
+        return value.then(fn, errback)
+    return fn(value)
+
+
+def gather(futures, timeout=None):
+    """
+    Waits for all of the futures and returns their results in order.
+
+    :param futures: The futures to wait for
+    :type futures: list of Future
+    :param timeout: Maximum number of seconds to wait for each future
+    :type timeout: float or None
+    :rtype: list
+
+    """
+    return [f.result(timeout) for f in futures]
+
+
+class Executor(object):
+    """
+    Runs calls on a bounded set of worker threads. Workers are started
+    lazily, at most `max_workers` calls run at the same time and the rest
+    wait in a queue.
+    """
+
+    def __init__(self, max_workers=10):
+        """
+        :param max_workers: The maximum number of concurrent calls
+        :type max_workers: int
+
+        """
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        self.max_workers = max_workers
+        self._queue = Queue.Queue()
+        self._workers = []
+        self._idle = 0
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Schedules fn(*args, **kwargs) and returns a Future for its result.
+
+        :param fn: The callable to run
+        :type fn: callable
+        :rtype: Future
+
+        """
+        future = Future()
+        with self._lock:
+            if self._shutdown:
+                raise ThunderdomeException("Executor has been shut down")
+            self._queue.put((future, fn, args, kwargs))
+            if self._idle == 0 and len(self._workers) < self.max_workers:
+                worker = threading.Thread(target=self._work, name='thunderdome-worker-{}'.format(len(self._workers)))
+                worker.daemon = True
+                self._workers.append(worker)
+                worker.start()
+            else:
+                self._idle -= 1
+        return future
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            future, fn, args, kwargs = item
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except:
+                future.set_exc_info(sys.exc_info())
+            with self._lock:
+                self._idle += 1
+
+    def shutdown(self, wait=True):
+        """
+        Stops the workers once queued calls have run.
+
+        :param wait: Block until the workers have exited
+        :type wait: boolean
+
+        """
+        with self._lock:
+            self._shutdown = True
+            workers = list(self._workers)
+        for w in workers:
+            self._queue.put(None)
+        if wait:
+            for w in workers:
+                w.join()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_max_concurrency = 10
+
+
+def configure(max_concurrency):
+    """
+    Sets the maximum number of graph calls run concurrently by spawn, the
+    previous executor finishes its queued calls in the background.
+
+    :param max_concurrency: The maximum number of concurrent calls
+    :type max_concurrency: int
+
+    """
+    global _executor
+    global _max_concurrency
+    with _executor_lock:
+        _max_concurrency = max_concurrency
+        old, _executor = _executor, None
+    if old is not None:
+        old.shutdown(wait=False)
+
+
+def get_executor():
+    """
+    Returns the shared executor, creating it on first use.
+
+    :rtype: Executor
+
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = Executor(_max_concurrency)
+        return _executor
+
+
+def spawn(fn, *args, **kwargs):
+    """
+    Runs fn(*args, **kwargs) on the shared executor and returns a Future.
+
+    :param fn: The callable to run
+    :type fn: callable
+    :rtype: Future
+
+    """
+    return get_executor().submit(fn, *args, **kwargs)
+
+
+class async_method(object):
+    """
+    Descriptor exposing a non-blocking counterpart of another method on the
+    same class, calling it returns a Future instead of blocking.
+
+    class Person(Vertex):
+        friends = GremlinMethod()
+        friends_async = async_method('friends')
+    """
+
+    def __init__(self, name):
+        """
+        :param name: The name of the blocking method
+        :type name: str
+
+        """
+        self.name = name
+
+    def __get__(self, instance, owner):
+        target = getattr(owner if instance is None else instance, self.name)
+
+        def call(*args, **kwargs):
+            return spawn(target, *args, **kwargs)
+        call.__name__ = '{}_async'.format(self.name)
+        call.__doc__ = "Non-blocking {}(), returns a thunderdome.futures.Future".format(self.name)
+        return call
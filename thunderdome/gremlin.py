@@ -1,16 +1,107 @@
+from datetime import datetime
+from decimal import Decimal as _Decimal
 import inspect
+import keyword
 import os.path
+import re
 import time
 import logging
+from uuid import UUID as _UUID
+import zlib
 
-from thunderdome.connection import execute_query, ThunderdomeQueryError
+from thunderdome import futures
+from thunderdome.connection import execute_query, registered_functions_enabled, ThunderdomeQueryError
 from thunderdome.exceptions import ThunderdomeException
 from thunderdome.groovy import parse
+from thunderdome.properties import DateTime, Decimal, UUID
+from thunderdome.transports import define_function
 from containers import Table
 
 
 logger = logging.getLogger(__name__)
 
+#names a compiled binding function can use as parameters
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+#default of the parameters of compiled binding functions
+_MISSING = object()
+
+
+#parameter encoders by type, None sends values as they are
+_param_encoders = {}
+
+#encoders looked up by exact type, subclasses are resolved on first use
+_resolved_encoders = {}
+
+
+def register_param_encoder(klass, encoder):
+    """
+    Sets how gremlin method parameters of the given type, or of its
+    subclasses, are sent to the database.
+
+    :param klass: The parameter type
+    :type klass: type
+    :param encoder: Callable returning the value to send, None to send values
+    of this type unchanged
+    :type encoder: callable or None
+
+    """
+    _param_encoders[klass] = encoder
+    _resolved_encoders.clear()
+    _resolved_encoders.update(_param_encoders)
+
+
+def _resolve_encoder(klass):
+    """
+    Finds the encoder of the closest registered base class of klass,
+    parameters of unknown types are sent unchanged.
+    """
+    encoder = None
+    for base in klass.__mro__:
+        if base in _param_encoders:
+            encoder = _param_encoders[base]
+            break
+    _resolved_encoders[klass] = encoder
+    return encoder
+
+
+def encode_param(value):
+    """
+    Translates a parameter, recursively, into a value appropriate for sending
+    over Rexster.
+
+    :param value: The parameter
+    :type value: mixed
+
+    """
+    try:
+        encoder = _resolved_encoders[type(value)]
+    except KeyError:
+        encoder = _resolve_encoder(type(value))
+    return value if encoder is None else encoder(value)
+
+
+def _encode_list(values):
+    #lists of values sent unchanged, like ids, aren't copied
+    resolved = _resolved_encoders
+    for value in values:
+        if resolved.get(type(value), _encode_list) is not None:
+            return [encode_param(v) for v in values]
+    return values
+
+
+def _encode_dict(values):
+    return {k:encode_param(v) for k,v in values.iteritems()}
+
+
+for _type in (int, long, float, bool, str, unicode, type(None)):
+    register_param_encoder(_type, None)
+register_param_encoder(list, _encode_list)
+register_param_encoder(dict, _encode_dict)
+register_param_encoder(datetime, DateTime().to_database)
+register_param_encoder(_UUID, UUID().to_database)
+register_param_encoder(_Decimal, Decimal().to_database)
+
 
 class ThunderdomeGremlinException(ThunderdomeException):
     """
@@ -18,16 +109,41 @@ class ThunderdomeGremlinException(ThunderdomeException):
     """
 
 
+def groovy_function(path, name):
+    """
+    Returns the (name, definition) pair defining a function of a groovy file
+    under its own name, for scripts calling it, see
+    thunderdome.connection.execute_query.
+
+    :param path: The path to the groovy file
+    :type path: str
+    :param name: The name of the function
+    :type name: str
+    :rtype: tuple
+
+    """
+    gremlin_obj = parse(path).get(name)
+    if gremlin_obj is None:
+        raise ThunderdomeGremlinException("The method '{}' wasnt found in {}".format(name, path))
+    return name, define_function(name, gremlin_obj.args, gremlin_obj.body)
+
+
 class BaseGremlinMethod(object):
     """ Maps a function in a groovy file to a method on a python class """
 
+    # whether the results can be streamed through a cursor
+    streamable = True
+
     def __init__(self,
                  path=None,
                  method_name=None,
                  classmethod=False,
                  property=False,
                  defaults={},
-                 transaction=True):
+                 transaction=True,
+                 stream=False,
+                 cache=None,
+                 requires=()):
         """
         Initialize the gremlin method and define how it is attached to class.
 
@@ -45,8 +161,19 @@ class BaseGremlinMethod(object):
         :param transaction: Close previous transaction before executing (True
         by default)
         :type transaction: boolean
+        :param stream: Return a thunderdome.connection.Cursor yielding the
+        results as they are read instead of a list
+        :type stream: boolean
+        :param cache: Memoize the results of calls with the same parameters
+        :type cache: thunderdome.cache.CachePolicy
+        :param requires: The functions of the groovy file the method calls
+        :type requires: list of str
 
         """
+        if stream and not self.streamable:
+            raise ThunderdomeGremlinException('{} results can not be streamed'.format(self.__class__.__name__))
+        if stream and cache is not None:
+            raise ThunderdomeGremlinException('streamed results can not be cached')
         self.is_configured = False
         self.is_setup = False
         self.path = path
@@ -55,11 +182,18 @@ class BaseGremlinMethod(object):
         self.property = property
         self.defaults =defaults
         self.transaction = transaction
+        self.stream = stream
+        self.cache = cache
+        self.requires = list(requires)
 
         self.attr_name = None
         self.arg_list = []
         self.function_body = None
         self.function_def = None
+        self.function_name = None
+        self.function_registration = None
+        self.required_functions = []
+        self.bind_arguments = None
 
         #configuring attributes
         self.parent_class = None
@@ -104,13 +238,7 @@ class BaseGremlinMethod(object):
                 path = os.path.split(path)[0]
                 path += '/' + self.path
 
-            #TODO: make this less naive
-            gremlin_obj = None
-            for grem_obj in parse(path):
-                if grem_obj.name == self.method_name:
-                    gremlin_obj = grem_obj
-                    break
-
+            gremlin_obj = parse(path).get(self.method_name)
             if gremlin_obj is None:
                 raise ThunderdomeGremlinException("The method '{}' wasnt found in {}".format(self.method_name, path))
 
@@ -121,8 +249,56 @@ class BaseGremlinMethod(object):
 
             self.function_body = gremlin_obj.body
             self.function_def = gremlin_obj.defn
+
+            #name the function is registered under, the checksum keeps
+            #different versions of a function apart
+            checksum = zlib.crc32('{}\n{}'.format(','.join(self.arg_list), self.function_body)) & 0xffffffff
+            self.function_name = '_td_{}_{:08x}'.format(self.method_name, checksum)
+            self.function_registration = (
+                self.function_name,
+                define_function(self.function_name, self.arg_list, self.function_body))
+            self.required_functions = [groovy_function(path, name) for name in self.requires]
+            self.bind_arguments = self._compile_binding()
             self.is_setup = True
 
+    def _compile_binding(self):
+        """
+        Compiles a function taking the arguments of the groovy function and
+        returning them as a params dict, so calls are bound by the
+        interpreter. Arguments which aren't valid python names fall back to
+        binding them in _bind_arguments.
+
+        :rtype: callable
+
+        """
+        names = self.arg_list + [k for k in self.defaults if k not in self.arg_list]
+        if not all(_IDENTIFIER.match(n) and not keyword.iskeyword(n) and not n.startswith('_td_') for n in names):
+            return self._bind_arguments
+
+        name = self.attr_name
+        if not name or not _IDENTIFIER.match(name) or keyword.iskeyword(name):
+            name = 'gremlin_method'
+
+        namespace = {'_td_missing': _MISSING}
+        lines = ['def {}({}):'.format(name, ', '.join('{}=_td_missing'.format(a) for a in self.arg_list)),
+                 '    _td_params = {}']
+        for arg in names:
+            if arg in self.defaults:
+                default = '_td_default_{}'.format(arg)
+                namespace[default] = self.defaults[arg]
+                if callable(self.defaults[arg]):
+                    default += '()'
+                if arg in self.arg_list:
+                    lines.append('    _td_params[{!r}] = {} if {} is _td_missing else {}'.format(arg, default, arg, arg))
+                else:
+                    lines.append('    _td_params[{!r}] = {}'.format(arg, default))
+            else:
+                lines.append('    if {} is not _td_missing: _td_params[{!r}] = {}'.format(arg, arg, arg))
+        lines.append('    return _td_params')
+
+        exec compile('\n'.join(lines), '<gremlin method {}>'.format(self.method_name), 'exec') in namespace
+        return namespace[name]
+
     def __call__(self, instance, *args, **kwargs):
         """
         Intercept attempts to call the GremlinMethod attribute and perform a
@@ -132,12 +308,67 @@ class BaseGremlinMethod(object):
         :type instance: object
 
         """
+        return self._call(instance, args, kwargs, self.stream)
+
+    def iterate(self, instance, *args, **kwargs):
+        """
+        Calls the method streaming its results, returns a
+        thunderdome.connection.Cursor.
+
+        :param instance: The class instance the method was called on
+        :type instance: object
+
+        """
+        if not self.streamable:
+            raise ThunderdomeGremlinException('{} results can not be streamed'.format(self.__class__.__name__))
+        return self._call(instance, args, kwargs, True)
+
+    def invalidate(self, instance, *args, **kwargs):
+        """
+        Drops the cached results of calling the method with the given
+        arguments.
+
+        :param instance: The class instance the method was called on
+        :type instance: object
+
+        """
+        if self.cache is None:
+            raise ThunderdomeGremlinException('{} results are not cached'.format(self.attr_name))
         self._setup()
+        params = self._build_params(instance, args, kwargs)
+        self.cache.invalidate(self.cache.make_key(self.function_name, params))
 
-        args = list(args)
-        if not self.classmethod:
-            args = [instance.eid] + args
+    def _call(self, instance, args, kwargs, stream):
+        self._setup()
+        params = self._build_params(instance, args, kwargs)
+        if self.cache is not None and not stream:
+            key = self.cache.make_key(self.function_name, params)
+            return self.cache.fetch(key, lambda: self._execute(instance, params, stream))
+        return self._execute(instance, params, stream)
+
+    def _build_params(self, instance, args, kwargs):
+        """
+        Maps the call arguments onto the function parameters, converted for
+        the database.
+
+        :rtype: dict
+
+        """
+        if self.classmethod:
+            params = self.bind_arguments(*args, **kwargs)
+        else:
+            params = self.bind_arguments(instance.eid, *args, **kwargs)
+        return self.transform_params_to_database(params)
+
+    def _bind_arguments(self, *args, **kwargs):
+        """
+        Maps the call arguments onto the function parameters, for functions
+        whose parameters can't be compiled into a binding function.
+
+        :rtype: dict
 
+        """
+        args = list(args)
         params = self.defaults.copy()
         if len(args + kwargs.values()) > len(self.arg_list):
             raise TypeError('{}() takes {} args, {} given'.format(self.attr_name, len(self.arg_list), len(args)))
@@ -163,7 +394,20 @@ class BaseGremlinMethod(object):
             arglist.pop(arglist.index(k))
             params[k] = v
 
-        params = self.transform_params_to_database(params)
+        return params
+
+    def _execute(self, instance, params, stream):
+        def _raise_gremlin_exception(ex):
+            if not isinstance(ex, ThunderdomeQueryError):
+                raise ex
+            import pprint
+            msg  = "Error while executing Gremlin method\n\n"
+            msg += "[Method]\n{}\n\n".format(self.method_name)
+            msg += "[Params]\n{}\n\n".format(pprint.pformat(params))
+            msg += "[Function Body]\n{}\n".format(self.function_body)
+            msg += "\n[Error]\n{}\n".format(ex)
+            msg += "\n[Raw Response]\n{}\n".format(ex.raw_response)
+            raise ThunderdomeGremlinException(msg)
 
         try:
             from thunderdome import Vertex
@@ -178,51 +422,29 @@ class BaseGremlinMethod(object):
 
             context = "{}.{}".format(context, self.method_name)
 
-            tmp = execute_query(self.function_body, params, transaction=self.transaction, context=context)
+            if registered_functions_enabled():
+                query = '{}({})'.format(self.function_name, ', '.join(self.arg_list))
+                tmp = execute_query(query, params, transaction=self.transaction, context=context,
+                                    functions=[self.function_registration] + self.required_functions,
+                                    stream=stream)
+            else:
+                tmp = execute_query(self.function_body, params, transaction=self.transaction, context=context,
+                                    functions=self.required_functions, stream=stream)
         except ThunderdomeQueryError as tqe:
-            import pprint
-            msg  = "Error while executing Gremlin method\n\n"
-            msg += "[Method]\n{}\n\n".format(self.method_name)
-            msg += "[Params]\n{}\n\n".format(pprint.pformat(params))
-            msg += "[Function Body]\n{}\n".format(self.function_body)
-            msg += "\n[Error]\n{}\n".format(tqe)
-            msg += "\n[Raw Response]\n{}\n".format(tqe.raw_response)
-            raise ThunderdomeGremlinException(msg)
-        return tmp
+            _raise_gremlin_exception(tqe)
+        return futures.chain(tmp, lambda results: results, _raise_gremlin_exception)
 
     def transform_params_to_database(self, params):
         """
         Takes a dictionary of parameters and recursively translates them into
-        parameters appropriate for sending over Rexster.
+        parameters appropriate for sending over Rexster, see
+        register_param_encoder.
 
         :param params: The parameters to be sent to the function
         :type params: dict
 
         """
-        import inspect
-        from datetime import datetime
-        from decimal import Decimal as _Decimal
-        from uuid import UUID as _UUID
-        from thunderdome.models import BaseElement, Edge, Vertex
-        from thunderdome.properties import DateTime, Decimal, UUID
-
-        if isinstance(params, dict):
-            return {k:self.transform_params_to_database(v) for k,v in params.iteritems()}
-        if isinstance(params, list):
-            return [self.transform_params_to_database(x) for x in params]
-        if isinstance(params, BaseElement):
-            return params.eid
-        if inspect.isclass(params) and issubclass(params, Edge):
-            return params.label
-        if inspect.isclass(params) and issubclass(params, Vertex):
-            return params.element_type
-        if isinstance(params, datetime):
-            return DateTime().to_database(params)
-        if isinstance(params, _UUID):
-            return UUID().to_database(params)
-        if isinstance(params, _Decimal):
-            return Decimal().to_database(params)
-        return params
+        return encode_param(params)
 
 
 class GremlinMethod(BaseGremlinMethod):
@@ -248,17 +470,24 @@ class GremlinMethod(BaseGremlinMethod):
         else:
             return obj
 
-    def __call__(self, instance, *args, **kwargs):
-        results = super(GremlinMethod, self).__call__(instance, *args, **kwargs)
-        return GremlinMethod._deserialize(results)
+    def _call(self, instance, args, kwargs, stream):
+        results = super(GremlinMethod, self)._call(instance, args, kwargs, stream)
+        if stream:
+            return results.map(GremlinMethod._deserialize)
+        return futures.chain(results, GremlinMethod._deserialize)
 
 
 class GremlinValue(GremlinMethod):
     """Gremlin Method that returns one value"""
 
+    streamable = False
+
     def __call__(self, instance, *args, **kwargs):
         results = super(GremlinValue, self).__call__(instance, *args, **kwargs)
+        return futures.chain(results, self._single_value)
 
+    @staticmethod
+    def _single_value(results):
         if results is None:
             return
         if len(results) != 1:
@@ -270,8 +499,8 @@ class GremlinValue(GremlinMethod):
 class GremlinTable(GremlinMethod):
     """Gremlin method that returns a table as its result"""
 
+    streamable = False
+
     def __call__(self, instance, *args, **kwargs):
         results = super(GremlinTable, self).__call__(instance, *args, **kwargs)
-        if results is None:
-            return
-        return Table(results)
+        return futures.chain(results, lambda r: None if r is None else Table(r))
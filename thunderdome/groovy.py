@@ -17,91 +17,250 @@
 # IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-import collections
-import pyparsing
+from collections import namedtuple, OrderedDict
+import errno
+import hashlib
+import json
+import logging
+import os
 import re
+import tempfile
 
+from thunderdome.exceptions import ThunderdomeException
 
-# Cache of parsed files
+
+logger = logging.getLogger(__name__)
+
+# Cache of parsed files by path, holding the modification time and size the
+# file had when parsed
 _parsed_file_cache = {}
 
+# Directory parsed files are kept in across processes, None disables it
+_cache_dir = None
+
+# Bumped when the scanner output changes, invalidating files cached on disk
+_CACHE_VERSION = 1
+
 
-class GroovyFunctionParser(object):
+class GroovyParseError(ThunderdomeException):
     """
-    Given a string containing a single function definition this class will 
-    parse the function definition and return information regarding it.
+    A groovy file couldn't be split into functions
     """
 
-    # Simple Groovy sub-grammar definitions
-    KeywordDef  = pyparsing.Keyword('def')
-    VarName     = pyparsing.Regex(r'[A-Za-z_]\w*')
-    FuncName    = VarName
-    FuncDefn    = KeywordDef + FuncName + "(" + pyparsing.delimitedList(VarName) + ")" + "{"
-    
-    # Result named tuple
-    GroovyFunction = collections.namedtuple('GroovyFunction', ['name', 'args', 'body', 'defn'])
-    
-    @classmethod
-    def parse(cls, data):
+
+GroovyFunction = namedtuple('GroovyFunction', ['name', 'args', 'body', 'defn'])
+
+
+# The tokens the scanner stops at. Comments and strings are skipped whole so
+# braces inside them aren't counted, slashy strings aren't recognized.
+_TOKENS = re.compile(r'''
+    (?P<defn>\bdef\s+(?P<name>[A-Za-z_]\w*)\s*\((?P<args>[^)]*)\)\s*\{)
+  | (?P<open>\{)
+  | (?P<close>\})
+  | //[^\n]*
+  | /\*.*?\*/
+  | """(?:\\.|[^\\])*?"""
+  | \'\'\'(?:\\.|[^\\])*?\'\'\'
+  | "(?:\\.|[^"\\\n])*"
+  | '(?:\\.|[^'\\\n])*'
+''', re.S | re.X)
+
+_ARG_NAME = re.compile(r'^[A-Za-z_]\w*$')
+
+
+class GroovyModule(object):
+    """
+    The functions defined in a groovy file, in the order they are defined and
+    indexed by name.
+    """
+
+    def __init__(self, path, functions):
+        """
+        :param path: The file the functions were read from
+        :type path: str
+        :param functions: The functions
+        :type functions: list of GroovyFunction
+
         """
-        Parse the given function definition and return information regarding
-        the contained definition.
-        
-        :param data: The function definition in a string
-        :type data: str
-        :rtype: dict
-        
+        self.path = path
+        self.functions = OrderedDict()
+        for fn in functions:
+            if fn.name in self.functions:
+                raise GroovyParseError("{} defines the function {} more than once".format(path, fn.name))
+            self.functions[fn.name] = fn
+        self._ordered = list(self.functions.values())
+
+    def get(self, name, default=None):
+        """
+        Returns the function with the given name.
+
+        :param name: The function name
+        :type name: str
+        :rtype: GroovyFunction or None
+
         """
+        return self.functions.get(name, default)
+
+    def __contains__(self, name):
+        return name in self.functions
+
+    def __getitem__(self, index):
+        return self._ordered[index]
+
+    def __iter__(self):
+        return iter(self._ordered)
+
+    def __len__(self):
+        return len(self._ordered)
+
+
+def scan(data, path='<string>'):
+    """
+    Splits groovy code into its top level functions in a single pass,
+    matching braces to find where each function ends.
+
+    :param data: The groovy code
+    :type data: str
+    :param path: The file the code was read from, for error messages
+    :type path: str
+    :rtype: list of GroovyFunction
+
+    """
+    functions = []
+    depth = 0
+    current = None
+    for token in _TOKENS.finditer(data):
+        if token.group('defn') is not None:
+            if depth == 0:
+                args = [a.strip() for a in token.group('args').split(',') if a.strip()]
+                for arg in args:
+                    if not _ARG_NAME.match(arg):
+                        raise GroovyParseError("{}: unsupported argument '{}' in function {}".format(
+                            path, arg, token.group('name')))
+                current = (token.group('name'), args, token.start(), token.end())
+            depth += 1
+        elif token.group('open') is not None:
+            depth += 1
+        elif token.group('close') is not None:
+            depth -= 1
+            if depth < 0:
+                raise GroovyParseError("{}: unmatched '}}' at offset {}".format(path, token.start()))
+            if depth == 0 and current is not None:
+                name, args, start, body_start = current
+                functions.append(GroovyFunction(name, args, data[body_start:token.start()].strip(),
+                                                data[start:token.end()]))
+                current = None
+    if depth != 0:
+        raise GroovyParseError("{}: unbalanced braces".format(path))
+    return functions
+
+
+def configure_cache(directory):
+    """
+    Sets the directory parsed groovy files are cached in, so other processes
+    don't parse them again. Entries are keyed by path and checked against the
+    modification time and content hash of the file.
+
+    :param directory: The cache directory, created if needed, None disables
+    the cache
+    :type directory: str or None
+
+    """
+    global _cache_dir
+    if directory is not None:
         try:
-            # Parse the function here
-            result = cls.FuncDefn.parseString(data)
-            result_list = result.asList()
-            args = result_list[3:result_list.index(')')]
-            # Return single line or multi-line function body
-            fn_body = re.sub(r'[^\{]+\{', '', data, count=1)
-            parts = fn_body.strip().split('\n')
-            fn_body = '\n'.join(parts[0:-1])
-            return cls.GroovyFunction(result[1], args, fn_body, data)
-        except Exception, ex:
-            return {}
-        
+            os.makedirs(directory)
+        except OSError as ex:
+            if ex.errno != errno.EEXIST:
+                raise
+    _cache_dir = directory
+
+
+def _cache_path(file):
+    digest = hashlib.sha1(os.path.abspath(file)).hexdigest()
+    return os.path.join(_cache_dir, '{}.json'.format(digest))
+
+
+def _read_cached(file):
+    """
+    Returns the cache entry of the given file, None if there isn't a usable
+    one.
+    """
+    try:
+        with open(_cache_path(file), 'r') as f:
+            entry = json.load(f)
+    except (IOError, ValueError):
+        return None
+    if not isinstance(entry, dict) or entry.get('version') != _CACHE_VERSION:
+        return None
+    return entry
+
+
+def _write_cached(file, stat, digest, functions):
+    """
+    Stores the functions of the given file in the cache directory, written to
+    a temporary file first so readers never see a partial entry.
+    """
+    entry = {
+        'version': _CACHE_VERSION,
+        'path': os.path.abspath(file),
+        'mtime': stat.st_mtime,
+        'size': stat.st_size,
+        'hash': digest,
+        'functions': [list(fn) for fn in functions],
+    }
+    tmp = None
+    try:
+        fd, tmp = tempfile.mkstemp(dir=_cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entry, f)
+        os.rename(tmp, _cache_path(file))
+    except (IOError, OSError) as ex:
+        logger.warning("Couldn't cache parsed groovy file %s: %s", file, ex)
+        if tmp is not None and os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _cached_functions(entry):
+    #json strings are unicode, function names and bodies are kept as str
+    utf8 = lambda v: v.encode('utf-8')
+    return [GroovyFunction(utf8(name), [utf8(a) for a in args], utf8(body), utf8(defn))
+            for name, args, body, defn in entry['functions']]
+
 
 def parse(file):
     """
-    Parse Groovy code in the given file and return a list of information about
-    each function necessary for usage in queries to database.
+    Parse Groovy code in the given file and return information about each
+    function necessary for usage in queries to database. Files are parsed
+    again once they change.
     
     :param file: The file containing groovy code.
     :type file: str
-    :rtype: 
+    :rtype: GroovyModule
     
     """
+    stat = os.stat(file)
+    version = (stat.st_mtime, stat.st_size)
+
     # Check cache before parsing file
-    global _parsed_file_cache
-    if file in _parsed_file_cache:
-        return _parsed_file_cache[file]
-    
-    FuncDefnRegexp = r'^def.*\{'
-    FuncEndRegexp = r'^\}.*$'
-    with open(file, 'r') as f:
-        data = f.read()
-    file_lines = data.split("\n")
-    all_fns = []
-    fn_lines = ''
-    for line in file_lines:
-        if len(fn_lines) > 0:
-            if re.match(FuncEndRegexp, line):
-                fn_lines += line + "\n"
-                all_fns.append(fn_lines)
-                fn_lines = ''
-            else:
-                fn_lines += line + "\n"
-        elif re.match(FuncDefnRegexp, line):
-            fn_lines += line + "\n"
-            
-    func_results = []
-    for fn in all_fns:
-        func_results += [GroovyFunctionParser.parse(fn)]
-        
-    _parsed_file_cache[file] = func_results
-    return func_results
+    cached = _parsed_file_cache.get(file)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    entry = _read_cached(file) if _cache_dir is not None else None
+    if entry is not None and (entry['mtime'], entry['size']) == version:
+        functions = _cached_functions(entry)
+    else:
+        with open(file, 'r') as f:
+            data = f.read()
+        digest = hashlib.sha1(data).hexdigest()
+        if entry is not None and entry['hash'] == digest:
+            functions = _cached_functions(entry)
+        else:
+            functions = scan(data, file)
+        if _cache_dir is not None:
+            _write_cached(file, stat, digest, functions)
+
+    module = GroovyModule(file, functions)
+    _parsed_file_cache[file] = (version, module)
+    return module
@@ -17,16 +17,25 @@
 # IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-from collections import OrderedDict
+from collections import namedtuple, OrderedDict
+import copy
 import inspect
+import itertools
+import os.path
 import re
 from uuid import UUID
 import warnings
 
+from thunderdome import cache
 from thunderdome import properties
+from thunderdome.cache import LRUCache
+from thunderdome.containers import Page, encode_token, decode_token
 from thunderdome.connection import execute_query, create_key_index, ThunderdomeQueryError
 from thunderdome.exceptions import ModelException, ValidationError, DoesNotExist, MultipleObjectsReturned, ThunderdomeException, WrongElementType
-from thunderdome.gremlin import BaseGremlinMethod, GremlinMethod
+from thunderdome import futures
+from thunderdome.futures import async_method
+from thunderdome.gremlin import BaseGremlinMethod, GremlinMethod, groovy_function, register_param_encoder
+from thunderdome.session import current_session
 
 
 #dict of node and edge types for rehydrating results
@@ -60,15 +69,274 @@ class SaveStrategyException(ModelException):
     """
 
 
+class BulkSaveException(ModelException):
+    """
+    One or more chunks of a bulk save failed, `errors` holds a ChunkError for
+    each of them. Elements in the other chunks were saved.
+    """
+
+    def __init__(self, errors, saved):
+        """
+        :param errors: The failed chunks
+        :type errors: list of ChunkError
+        :param saved: The number of elements saved
+        :type saved: int
+
+        """
+        self.errors = errors
+        self.saved = saved
+        failed = sum(len(e.elements) for e in errors)
+        super(BulkSaveException, self).__init__(
+            '{} chunks failed, {} elements saved and {} not saved: {}'.format(
+                len(errors), saved, failed,
+                '; '.join('offset {}: {}'.format(e.offset, e.exception) for e in errors)))
+
+
+#a chunk of a bulk save that failed, offset is the position of its first element
+ChunkError = namedtuple('ChunkError', ['offset', 'elements', 'exception'])
+
+
+#value of columns which weren't fetched by a projected query
+_DEFERRED = object()
+
+#keys always fetched by projected queries
+_PROJECTION_KEYS = ('vid', 'element_type')
+
+
+def _project_function():
+    """
+    Returns the definition of the groovy function projected queries turn
+    their elements into maps with, see _project in vertex.groovy.
+
+    :rtype: tuple
+
+    """
+    return groovy_function(os.path.join(os.path.dirname(__file__), 'vertex.groovy'), '_project')
+
+
+def _primary_key(label):
+    """
+    Returns the name the primary key of an edge label is stored under, as
+    declared by the primary_key column of its edge class, or None.
+
+    :param label: The edge label
+    :type label: str
+    :rtype: str or None
+
+    """
+    klass = edge_types.get(label)
+    if klass is None:
+        return None
+    for column in klass._columns.values():
+        if column.primary_key:
+            return column.db_field_name
+    return None
+
+
+def _projection(only=None, defer=None, classes=None):
+    """
+    Returns the only and defer parameters of a projected query. The keys are
+    attribute names of the given element classes, they are sent as the names
+    the properties are stored under. The vid and element type are always
+    fetched.
+
+    :param only: The only properties to fetch
+    :type only: list of str or None
+    :param defer: The properties not to fetch
+    :type defer: list of str or None
+    :param classes: The classes of the results, every registered element
+    class if None
+    :type classes: list of type or None
+    :rtype: tuple
+
+    """
+    if only is not None and defer is not None:
+        raise ThunderdomeQueryError("only and defer can't be used together")
+    if only is not None:
+        only = _db_field_names(only, classes)
+        return only + [k for k in _PROJECTION_KEYS if k not in only], None
+    if defer is not None:
+        return None, [k for k in _db_field_names(defer, classes) if k not in _PROJECTION_KEYS]
+    return None, None
+
+
+def _db_field_names(names, classes=None):
+    """
+    Translates attribute names into the names the properties are stored
+    under, raising a ThunderdomeQueryError for names none of the classes
+    define.
+
+    :param names: The attribute names
+    :type names: list of str
+    :param classes: The element classes defining them, every registered
+    element class if None
+    :type classes: list of type or None
+    :rtype: list of str
+
+    """
+    if classes is None:
+        classes = vertex_types.values() + edge_types.values()
+    fields = []
+    for name in names:
+        if name in _PROJECTION_KEYS:
+            columns = [name]
+        else:
+            columns = [klass._columns[name].db_field_name for klass in classes if name in klass._columns]
+        if not columns:
+            raise ThunderdomeQueryError("unknown property '{}'".format(name))
+        for column in columns:
+            if column not in fields:
+                fields.append(column)
+    return fields
+
+
+class DeferredValue(object):
+    """
+    Value manager of a column which wasn't fetched, reading it loads all of
+    the deferred columns of the element.
+    """
+    value = _DEFERRED
+    previous_value = _DEFERRED
+    deleted = False
+    changed = False
+
+    def __init__(self, instance, column):
+        self.instance = instance
+        self.column = column
+
+    def getval(self):
+        self.instance._load_deferred()
+        return self.instance._values[self.column.column_name].getval()
+
+    def peek(self):
+        return _DEFERRED
+
+    def setval(self, val):
+        #the loaded value is overwritten, no need to fetch it
+        value_mngr = self.column.value_manager(self.instance, self.column, None)
+        self.instance._values[self.column.column_name] = value_mngr
+        value_mngr.setval(val)
+
+    def delval(self):
+        self.setval(None)
+
+
+class CompactValue(object):
+    """
+    Value manager interface over one column of a compact element, the values
+    live in the element's arrays and changes are computed when asked for.
+    """
+    __slots__ = ('instance', 'column', 'index', 'mutable')
+
+    def __init__(self, instance, column, index, mutable):
+        self.instance = instance
+        self.column = column
+        self.index = index
+        self.mutable = mutable
+
+    @property
+    def value(self):
+        if self.mutable:
+            self.instance._detach(self.index)
+        return self.instance._current[self.index]
+
+    @value.setter
+    def value(self, val):
+        self.instance._current[self.index] = val
+
+    @property
+    def previous_value(self):
+        if self.mutable:
+            self.instance._detach(self.index)
+        return self.instance._original[self.index]
+
+    @previous_value.setter
+    def previous_value(self, val):
+        shared = not self.mutable or val is self.instance._current[self.index]
+        self.instance._original[self.index] = val if shared else copy.deepcopy(val)
+
+    @property
+    def deleted(self):
+        return self.instance._current[self.index] is None and self.instance._original[self.index] is not None
+
+    @property
+    def changed(self):
+        return self.instance._current[self.index] != self.instance._original[self.index]
+
+    def getval(self):
+        return self.value
+
+    def peek(self):
+        return self.instance._current[self.index]
+
+    def setval(self, val):
+        self.value = val
+
+    def delval(self):
+        self.value = None
+
+
+class CompactValues(object):
+    """
+    Read only mapping of column names to CompactValue views, standing in for
+    the value manager dict of regular elements.
+    """
+    __slots__ = ('instance',)
+
+    def __init__(self, instance):
+        self.instance = instance
+
+    def __getitem__(self, name):
+        index = self.instance._column_index[name]
+        return CompactValue(self.instance, self.instance._columns[name], index,
+                            index in self.instance._mutable_columns)
+
+    def __contains__(self, name):
+        return name in self.instance._column_index
+
+    def __iter__(self):
+        return iter(self.instance._columns)
+
+    def __len__(self):
+        return len(self.instance._columns)
+
+    def keys(self):
+        return list(self.instance._columns)
+
+    def values(self):
+        return [self[name] for name in self.instance._columns]
+
+    def items(self):
+        return [(name, self[name]) for name in self.instance._columns]
+
+    iterkeys = __iter__
+
+    def itervalues(self):
+        return iter(self.values())
+
+    def iteritems(self):
+        return iter(self.items())
+
+
 class BaseElement(object):
     """
     The base model class, don't inherit from this, inherit from Model, defined
     below
     """
+    __slots__ = ('eid', '__weakref__')
 
     # When true this will prepend the module name to the type name of the class
     __use_module_name__ = False
     __default_save_strategy__ = properties.SAVE_ALWAYS
+
+    # When true saved elements only send the columns which changed since they
+    # were loaded, for columns without their own save strategy
+    __dirty_tracking__ = False
+
+    # When true instances use __slots__ and keep their current and original
+    # values in two flat lists instead of a value manager per column. Compact
+    # elements can't be given attributes other than their columns.
+    __compact__ = False
     
     class DoesNotExist(DoesNotExist):
         """
@@ -94,6 +362,16 @@ class BaseElement(object):
         
         """
         self.eid = values.get('_id')
+        if self.__compact__:
+            current = []
+            for name, column in self._columns.items():
+                value = values.get(name, None)
+                if value is not None:
+                    value = column.to_python(value)
+                current.append(value)
+            self._set_compact_values(current)
+            return
+
         self._values = {}
         for name, column in self._columns.items():
             value = values.get(name, None)
@@ -102,6 +380,24 @@ class BaseElement(object):
             value_mngr = column.value_manager(self, column, value)
             self._values[name] = value_mngr
 
+    def _set_compact_values(self, current):
+        """
+        Sets the values of a compact element, the originals of the mutable
+        values are copied when they are first read, see _detach.
+        """
+        self._current = current
+        self._original = current[:]
+
+    def _detach(self, index):
+        """
+        Copies the original of a mutable value of a compact element if it
+        still is the current value, which is about to be handed out and may
+        be changed in place.
+        """
+        value = self._current[index]
+        if value is not None and value is not _DEFERRED and self._original[index] is value:
+            self._original[index] = copy.deepcopy(value)
+
     def __eq__(self, other):
         """
         Check for equality between two elements.
@@ -165,12 +461,15 @@ class BaseElement(object):
     def validate(self):
         """Cleans and validates the field values"""
         for name in self._columns.keys():
+            value_mngr = self._values[name]
+            if value_mngr.peek() is _DEFERRED:
+                continue
             func_name = 'validate_{}'.format(name)
-            val = getattr(self, name)
             if hasattr(self, func_name):
-                val = getattr(self, func_name)(val)
+                #custom validators are handed the value like any other reader
+                val = getattr(self, func_name)(getattr(self, name))
             else:
-                val = self.validate_field(name, val)
+                val = self.validate_field(name, value_mngr.peek())
             setattr(self, name, val)
 
     def as_dict(self):
@@ -196,29 +495,137 @@ class BaseElement(object):
         values = {}
         was_saved = self.eid is not None
         for name, col in self._columns.items():
+            #columns which weren't fetched are left as they are
+            value_mngr = self._values[name]
+            if value_mngr.peek() is _DEFERRED:
+                continue
+
             # Determine the save strategy for this column
             should_save = True
 
             col_strategy = self.__default_save_strategy__
             if col.has_save_strategy:
                 col_strategy = col.get_save_strategy()
+            elif self.__dirty_tracking__:
+                col_strategy = properties.SAVE_ONCHANGE
 
             # Enforce the save strategy
             if col_strategy == properties.SAVE_ONCE:
                 if was_saved:
-                    if self._values[name].changed:
+                    if value_mngr.changed:
                         raise SaveStrategyException("Attempt to change column '{}' with save strategy SAVE_ONCE".format(name))
                     else:
                         should_save = False
             elif col_strategy == properties.SAVE_ONCHANGE:
-                if was_saved and not self._values[name].changed:
+                if was_saved and not value_mngr.changed:
                     should_save = False
             
             if should_save:
-                values[col.db_field or name] = col.to_database(getattr(self, name, None))
+                values[col.db_field or name] = col.to_database(value_mngr.peek())
                 
         return values
 
+    @classmethod
+    def _from_db(cls, data):
+        """
+        Builds an element from a query result following the class's
+        deserialization plan, without copying the result.
+
+        :param data: The element as returned by rexster
+        :type data: dict
+        :rtype: BaseElement
+
+        """
+        if cls._custom_init:
+            return cls(**cls.translate_db_fields(data))
+        return cls.__new__(cls)._load_values(data)
+
+    def _load_values(self, data):
+        """
+        Sets the eid and column values from a query result.
+        """
+        self.eid = data.get('_id')
+        get = data.get
+        if self.__compact__:
+            current = []
+            for name, db_field, column, to_python, value_manager in self._deserialization_plan:
+                value = get(db_field)
+                if value is not None:
+                    value = to_python(value)
+                current.append(value)
+            self._set_compact_values(current)
+            return self
+
+        values = self._values = {}
+        for name, db_field, column, to_python, value_manager in self._deserialization_plan:
+            value = get(db_field)
+            if value is not None:
+                value = to_python(value)
+            values[name] = value_manager(self, column, value)
+        return self
+
+    def _set_deferred(self, deferred, data):
+        """
+        Marks the columns a projected query didn't fetch as deferred.
+
+        :param deferred: The keys given to defer, None if only the keys in
+        data were fetched
+        :type deferred: list of str or None
+        :param data: The element as returned by rexster
+        :type data: dict
+
+        """
+        for name, column in self._columns.items():
+            key = column.db_field_name
+            if key in data if deferred is None else key not in deferred:
+                continue
+            if self.__compact__:
+                index = self._column_index[name]
+                self._current[index] = self._original[index] = _DEFERRED
+            else:
+                self._values[name] = DeferredValue(self, column)
+
+    def _load_deferred(self):
+        """
+        Fetches the values of the deferred columns.
+        """
+        self._fill_deferred(self._python_values(self._reload_values()))
+
+    def _python_values(self, values):
+        """
+        Converts the values of an element read from the database, keyed by
+        column name.
+
+        :param values: The element as returned by rexster
+        :type values: dict
+        :rtype: dict
+
+        """
+        python_values = {}
+        for name, column in self._columns.items():
+            value = values.get(column.db_field_name)
+            python_values[name] = column.to_python(value) if value is not None else None
+        return python_values
+
+    def _fill_deferred(self, values):
+        """
+        Sets the deferred columns to the given values, as loaded values.
+
+        :param values: Column names mapped to their values
+        :type values: dict
+
+        """
+        for name, column in self._columns.items():
+            value_mngr = self._values[name]
+            value = values.get(name)
+            if value_mngr.peek() is not _DEFERRED or value is _DEFERRED:
+                continue
+            if self.__compact__:
+                value_mngr.value = value
+                value_mngr.previous_value = value
+            else:
+                self._values[name] = column.value_manager(self, column, value)
+
     @classmethod
     def translate_db_fields(cls, data):
         """
@@ -287,10 +694,9 @@ class BaseElement(object):
         """
         Reload the given element from the database.
         """
-        values = self._reload_values()
-        for name, column in self._columns.items():
-            value = values.get(column.db_field_name, None)
-            if value is not None: value = column.to_python(value)
+        values = self._python_values(self._reload_values())
+        self._fill_deferred(values)
+        for name, value in values.items():
             setattr(self, name, value)
         return self
 
@@ -310,6 +716,11 @@ class ElementMetaClass(type):
             for k,v in getattr(base, '_columns', {}).items():
                 column_dict.setdefault(k,v)
 
+        if '__compact__' in attrs:
+            compact = attrs['__compact__']
+        else:
+            compact = any(getattr(base, '__compact__', False) for base in bases)
+
         def _transform_column(col_name, col_obj):
             column_dict[col_name] = col_obj
             col_obj.set_column_name(col_name)
@@ -322,6 +733,25 @@ class ElementMetaClass(type):
             else:
                 attrs[col_name] = property(_get, _set)
 
+        def _compact_column(col_name, col_obj, index):
+            mutable = col_obj.value_manager is properties.MutableValueManager
+            def _get(self):
+                value = self._current[index]
+                if value is _DEFERRED:
+                    self._load_deferred()
+                    value = self._current[index]
+                if mutable:
+                    self._detach(index)
+                return value
+            def _set(self, val):
+                self._current[index] = val
+            def _del(self):
+                self._current[index] = None
+            if col_obj.can_delete:
+                attrs[col_name] = property(_get, _set, _del)
+            else:
+                attrs[col_name] = property(_get, _set)
+
         column_definitions = [(k,v) for k,v in attrs.items() if isinstance(v, properties.Column)]
         column_definitions = sorted(column_definitions, lambda x,y: cmp(x[1].position, y[1].position))
         
@@ -329,6 +759,21 @@ class ElementMetaClass(type):
         #Model API's existing attributes/methods transform column definitions
         for k,v in column_definitions:
             _transform_column(k,v)
+
+        if compact:
+            #inherited columns are re-bound to this class's positions
+            for index, (col_name, col_obj) in enumerate(column_dict.items()):
+                if col_obj.value_manager not in (properties.BaseValueManager, properties.MutableValueManager):
+                    raise ModelException("{} can't be compact, column {} uses a custom value manager".format(name, col_name))
+                _compact_column(col_name, col_obj, index)
+            attrs['_column_index'] = {col_name: i for i, col_name in enumerate(column_dict)}
+            attrs['_mutable_columns'] = tuple(
+                i for i, col in enumerate(column_dict.values())
+                if col.value_manager is properties.MutableValueManager)
+            attrs['_values'] = property(CompactValues)
+            if '__slots__' not in attrs:
+                compact_base = any(getattr(base, '__compact__', False) for base in bases)
+                attrs['__slots__'] = () if compact_base else ('_current', '_original')
             
         #check for duplicate column names
         col_names = set()
@@ -345,6 +790,15 @@ class ElementMetaClass(type):
         #add management members to the class
         attrs['_columns'] = column_dict
         attrs['_db_map'] = db_map
+
+        #plan for building elements from query results, see _from_db
+        attrs['_deserialization_plan'] = tuple(
+            (field_name, col.db_field_name, col, col.to_python, col.value_manager)
+            for field_name, col in column_dict.items())
+
+        #elements whose class overrides __init__ are built through it
+        attrs['_custom_init'] = ('__init__' in attrs and attrs.get('__module__') != __name__) or \
+            any(getattr(base, '_custom_init', False) for base in bases)
         
         #auto link gremlin methods
         gremlin_methods = {}
@@ -365,6 +819,11 @@ class ElementMetaClass(type):
             def method_wrapper(self, *args, **kwargs):
                 return method(self, *args, **kwargs)
             return method_wrapper
+
+        def wrap_invalidate(method):
+            def invalidate_wrapper(self, *args, **kwargs):
+                return method.invalidate(self, *args, **kwargs)
+            return invalidate_wrapper
         
         for k,v in attrs.items():
             if isinstance(v, BaseGremlinMethod):
@@ -373,6 +832,14 @@ class ElementMetaClass(type):
                 attrs[k] = method
                 if v.classmethod: attrs[k] = classmethod(method)
                 if v.property: attrs[k] = property(method)
+                #non-blocking counterpart for public methods
+                if not k.startswith('_') and not v.property:
+                    attrs.setdefault('{}_async'.format(k), async_method(k))
+                #drops the cached results of a call
+                if v.cache is not None:
+                    invalidate = wrap_invalidate(v)
+                    if v.classmethod: invalidate = classmethod(invalidate)
+                    attrs.setdefault('{}_invalidate'.format(k), invalidate)
 
         attrs['_gremlin_methods'] = gremlin_methods
 
@@ -388,27 +855,111 @@ class ElementMetaClass(type):
 
 class Element(BaseElement):
     __metaclass__ = ElementMetaClass
+    __slots__ = ()
     
     @classmethod
     def deserialize(cls, data):
         """
-        Deserializes rexster json into vertex or edge objects
+        Deserializes rexster json into vertex or edge objects, returning the
+        instance already loaded if a session is active and knows the element.
         """
         dtype = data.get('_type')
+        session = current_session()
+        if session is not None:
+            element = session.lookup(dtype, data.get('_id'))
+            if element is not None:
+                return element
+
         if dtype == 'vertex':
             vertex_type = data['element_type']
             if vertex_type not in vertex_types:
                 raise ElementDefinitionException('Vertex "{}" not defined'.format(vertex_type))
-            translated_data = vertex_types[vertex_type].translate_db_fields(data)
-            return vertex_types[vertex_type](**translated_data)
+            element = vertex_types[vertex_type]._from_db(data)
         elif dtype == 'edge':
             edge_type = data['_label']
             if edge_type not in edge_types:
                 raise ElementDefinitionException('Edge "{}" not defined'.format(edge_type))
-            translated_data = edge_types[edge_type].translate_db_fields(data)
-            return edge_types[edge_type](data['_outV'], data['_inV'], **translated_data)
+            element = edge_types[edge_type]._from_db(data)
         else:
             raise TypeError("Can't deserialize '{}'".format(dtype))
+
+        if '_deferred' in data:
+            element._set_deferred(data['_deferred'], data)
+        if session is not None:
+            session.identify(element)
+        return element
+
+    def _saved(self, results):
+        """
+        Copies the state of the saved element back onto this one. Inside a
+        session the result may be this very element, the saved values then
+        become its unchanged values.
+        """
+        result = results[0]
+        self.eid = result.eid
+        self._fill_deferred({k: v.peek() for k, v in result._values.items()})
+        for k,v in self._values.items():
+            v.previous_value = result._values[k].peek()
+        session = current_session()
+        if session is not None and result is not self:
+            #the session tracks the saved instance rather than its copy
+            session.identify(self)
+        self._invalidate_cached()
+        return self
+
+    def _cache_keys(self, element_cache):
+        """
+        Returns the keys this element is cached under.
+
+        :param element_cache: The element cache
+        :type element_cache: thunderdome.cache.ElementCache
+        :rtype: list of str
+
+        """
+        raise NotImplementedError
+
+    def _invalidate_cached(self, edge_eids=()):
+        """
+        Drops this element and the given edges from the element cache.
+
+        :param edge_eids: The eids of edges removed along with this element
+        :type edge_eids: list of int
+
+        """
+        element_cache = cache.element_cache()
+        if element_cache is not None and self.eid is not None:
+            keys = self._cache_keys(element_cache)
+            for eid in edge_eids:
+                keys += element_cache.edge_keys(eid)
+            element_cache.invalidate(keys)
+
+    @staticmethod
+    def _cache_results(results):
+        """
+        Stores the elements of a lookup in the element cache, if there is one.
+
+        :param results: Raw query results
+        :type results: list
+        :rtype: list
+
+        """
+        element_cache = cache.element_cache()
+        if element_cache is not None:
+            for result in results:
+                #partially loaded elements aren't cached
+                if isinstance(result, dict) and '_id' in result and '_deferred' not in result:
+                    element_cache.store(result)
+        return results
+
+    @classmethod
+    def _deserialize_one(cls, results):
+        """
+        Deserializes the first result of a lookup, raising DoesNotExist if
+        nothing was found.
+        """
+        if not results:
+            raise cls.DoesNotExist
+        return Element.deserialize(results[0])
     
     
 class VertexMetaClass(ElementMetaClass):
@@ -433,6 +984,10 @@ class VertexMetaClass(ElementMetaClass):
         return klass
 
     
+#marks traversals paginated by offset rather than by continuation token
+_OFFSET_PAGINATION = object()
+
+
 class Vertex(Element):
     """
     The Vertex model base class. All vertexes have a vid defined on them, the
@@ -441,11 +996,15 @@ class Vertex(Element):
     """
     __metaclass__ = VertexMetaClass
     __abstract__ = True
+    __slots__ = ()
 
     gremlin_path = 'vertex.groovy'
 
     _save_vertex = GremlinMethod()
-    _traversal = GremlinMethod()
+    _save_vertices = GremlinMethod(classmethod=True)
+    _traversal = GremlinMethod(requires=['_project'])
+    _keyset_traversal = GremlinMethod(requires=['_project'])
+    _traversal_many = GremlinMethod(classmethod=True)
     _delete_related = GremlinMethod()
 
     #vertex id
@@ -478,17 +1037,24 @@ class Vertex(Element):
         return cls._type_name(cls.element_type)
     
     @classmethod
-    def all(cls, vids, as_dict=False):
+    def all(cls, vids, as_dict=False, only=None, defer=None):
         """
         Load all vertices with the given vids from the graph. By default this
         will return a list of vertices but if as_dict is True then it will
         return a dictionary containing vids as keys and vertices found as
         values.
 
+        Passing only or defer fetches some of the properties, the others are
+        loaded on first access.
+
         :param vids: A list of thunderdome UUIDS (vids)
         :type vids: list
         :param as_dict: Toggle whether to return a dictionary or list
         :type as_dict: boolean
+        :param only: The only properties to fetch
+        :type only: list of str
+        :param defer: The properties not to fetch
+        :type defer: list of str
         :rtype: dict or list
         
         """
@@ -496,9 +1062,32 @@ class Vertex(Element):
             raise ThunderdomeQueryError("vids must be of type list or tuple")
         
         strvids = [str(v) for v in vids]
-        qs = ['vids.collect{g.V("vid", it).toList()[0]}']
-        
-        results = execute_query('\n'.join(qs), {'vids':strvids})
+        only, defer = _projection(only, defer, [cls] + [v for v in vertex_types.values() if issubclass(v, cls)])
+        if only is None and defer is None:
+            query = 'vids.collect{g.V("vid", it).toList()[0]}'
+            functions = None
+        else:
+            query = 'vids.collect{v = g.V("vid", it).toList()[0]; v == null ? null : _project(v, only, defer)}'
+            functions = [_project_function()]
+
+        element_cache = cache.element_cache()
+        cached = element_cache.vertices_by_vid(strvids) if element_cache is not None else {}
+        missing = [v for v in strvids if v not in cached]
+        if not missing:
+            return cls._deserialize_all([cached[v] for v in strvids], vids, as_dict)
+
+        def _merge(results):
+            fetched = dict(zip(missing, cls._cache_results(results)))
+            return cls._deserialize_all([cached.get(v) or fetched.get(v) for v in strvids], vids, as_dict)
+
+        params = {'vids':missing}
+        if only is not None or defer is not None:
+            params.update({'only':only, 'defer':defer})
+        results = execute_query(query, params, functions=functions)
+        return futures.chain(results, _merge)
+
+    @classmethod
+    def _deserialize_all(cls, results, vids, as_dict):
         results = filter(None, results)
         
         if len(results) != len(vids):
@@ -523,13 +1112,13 @@ class Vertex(Element):
         Method for reloading the current vertex by reading its current values
         from the database.
         """
-        results = execute_query('g.v(eid)', {'eid':self.eid})[0]
+        results = execute_query('g.v(eid)', {'eid':self.eid}, batchable=False)[0]
         del results['_id']
         del results['_type']
         return results
 
     @classmethod
-    def get(cls, vid):
+    def get(cls, vid, only=None, defer=None):
         """
         Look up vertex by thunderdome assigned UUID. Raises a DoesNotExist
         exception if a vertex with the given vid was not found. Raises a
@@ -538,11 +1127,19 @@ class Vertex(Element):
 
         :param vid: The thunderdome assigned UUID
         :type vid: str
+        :param only: The only properties to fetch
+        :type only: list of str
+        :param defer: The properties not to fetch, see all
+        :type defer: list of str
         :rtype: thunderdome.models.Vertex
         
         """
-        try:
-            results = cls.all([vid])
+        def _does_not_exist(ex):
+            if isinstance(ex, ThunderdomeQueryError):
+                raise cls.DoesNotExist
+            raise ex
+
+        def _check(results):
             if len(results) >1:
                 raise cls.MultipleObjectsReturned
 
@@ -552,6 +1149,13 @@ class Vertex(Element):
                     '{} is not an instance or subclass of {}'.format(result.__class__.__name__, cls.__name__)
                 )
             return result
+
+        session = current_session()
+        if session is not None and session.lookup_vid(vid) is not None:
+            return _check([session.lookup_vid(vid)])
+
+        try:
+            return futures.chain(cls.all([vid], only=only, defer=defer), _check, _does_not_exist)
         except ThunderdomeQueryError:
             raise cls.DoesNotExist
     
@@ -566,24 +1170,96 @@ class Vertex(Element):
         :rtype: thunderdome.models.Vertex
         
         """
+        session = current_session()
+        if session is not None and session.lookup('vertex', eid) is not None:
+            return session.lookup('vertex', eid)
+        element_cache = cache.element_cache()
+        data = element_cache.vertex_by_eid(eid) if element_cache is not None else None
+        if data is not None:
+            return cls._deserialize_one([data])
         results = execute_query('g.v(eid)', {'eid':eid})
-        if not results:
-            raise cls.DoesNotExist
-        return Element.deserialize(results[0])
+        return futures.chain(results, lambda r: cls._deserialize_one(cls._cache_results(r)))
     
     def save(self, *args, **kwargs):
         """
         Save the current vertex using the configured save strategy, the default
         save strategy is to re-save all fields every time the object is saved.
+        Returns this vertex, whether or not anything had to be sent.
+
+        :rtype: Vertex
+
         """
         super(Vertex, self).save(*args, **kwargs)
         params = self.as_save_params()
-        params['element_type'] = self.get_element_type()
-        result = self._save_vertex(params)[0]
-        self.eid = result.eid
-        for k,v in self._values.items():
-            v.previous_value = result._values[k].previous_value
-        return result
+        if self.__dirty_tracking__ and self.eid is not None:
+            #nothing changed, nothing to send
+            if not params:
+                return self
+        else:
+            params['element_type'] = self.get_element_type()
+        return futures.chain(self._save_vertex(params), self._saved)
+
+    @classmethod
+    def save_many(cls, vertices, chunk_size=500):
+        """
+        Saves the given vertices, sending them in chunks of chunk_size which
+        are each saved in a single request and transaction. Validation runs
+        for every vertex before anything is sent. Raises a BulkSaveException
+        listing the failed chunks if any of them couldn't be saved.
+
+        :param vertices: The vertices to save
+        :type vertices: list of Vertex
+        :param chunk_size: The number of vertices saved per request
+        :type chunk_size: int
+        :rtype: list of Vertex
+
+        """
+        from thunderdome.connection import _current_batch
+        if _current_batch() is not None:
+            raise ThunderdomeException("save_many can't be deferred by a batch, it already sends one request per chunk")
+        if chunk_size < 1:
+            raise ValueError('chunk_size must be at least 1')
+
+        vertices = list(vertices)
+        elements = []
+        for vertex in vertices:
+            if not isinstance(vertex, cls):
+                raise WrongElementType('{} is not an instance of {}'.format(vertex.__class__.__name__, cls.__name__))
+            super(Vertex, vertex).save()
+            attrs = vertex.as_save_params()
+            attrs['element_type'] = vertex.get_element_type()
+            elements.append({'eid': vertex.eid, 'attrs': attrs})
+
+        errors = []
+        saved = 0
+        for offset in range(0, len(vertices), chunk_size):
+            chunk = vertices[offset:offset + chunk_size]
+            try:
+                results = Vertex._save_vertices(elements[offset:offset + chunk_size])
+            except ThunderdomeException as ex:
+                errors.append(ChunkError(offset, chunk, ex))
+                continue
+            for vertex, result in zip(chunk, results):
+                vertex._saved([result])
+            saved += len(chunk)
+
+        if errors:
+            raise BulkSaveException(errors, saved)
+        return vertices
+
+    @classmethod
+    def create_many(cls, values, chunk_size=500):
+        """
+        Creates a vertex of this type for each dict of values, see save_many.
+
+        :param values: The values of each vertex
+        :type values: list of dict
+        :param chunk_size: The number of vertices saved per request
+        :type chunk_size: int
+        :rtype: list of Vertex
+
+        """
+        return cls.save_many([cls(**v) for v in values], chunk_size=chunk_size)
     
     def delete(self):
         """
@@ -593,20 +1269,44 @@ class Vertex(Element):
             raise ThunderdomeException('cant delete abstract elements')
         if self.eid is None:
             return self
-        query = """
-        g.removeVertex(g.v(eid))
-        g.stopTransaction(SUCCESS)
-        """
+        if cache.element_cache() is not None:
+            #the removed edges are dropped from the cache as well
+            query = """
+            v = g.v(eid)
+            edges = v.bothE.id.toList()
+            g.removeVertex(v)
+            g.stopTransaction(SUCCESS)
+            edges
+            """
+        else:
+            query = """
+            g.removeVertex(g.v(eid))
+            g.stopTransaction(SUCCESS)
+            """
         results = execute_query(query, {'eid': self.eid})
-        
+        return futures.chain(results, lambda r: self._invalidate_cached(edge_eids=filter(None, r or [])))
+
+    def _cache_keys(self, element_cache):
+        return element_cache.vertex_keys(self.eid, self.vid)
+
     def _simple_traversal(self,
                           operation,
                           labels,
                           limit=None,
                           offset=None,
-                          types=None):
+                          types=None,
+                          stream=False,
+                          after=_OFFSET_PAGINATION,
+                          sort_key=None,
+                          only=None,
+                          defer=None,
+                          include_vertices=False):
         """
         Perform simple graph database traversals with ubiquitous pagination.
+        Passing `after` switches to keyset pagination, a Page of at most
+        `limit` results is returned, resuming after the continuation token.
+        Passing `only` or `defer` fetches some of the properties of the
+        results, the others are loaded on first access.
 
         :param operation: The operation to be performed
         :type operation: str
@@ -618,50 +1318,129 @@ class Vertex(Element):
         :type max_results: int
         :param types: The list of allowed result elements
         :type types: list
+        :param stream: Return a thunderdome.connection.Cursor yielding the
+        results as they are read instead of a list
+        :type stream: boolean
+        :param after: The next_token of the previous page, None for the first
+        :type after: str or None
+        :param sort_key: The edge property pages are ordered by, edge ids break
+        ties. Required with `after`, see _keyset_page.
+        :type sort_key: str or None
+        :param only: The only properties to fetch
+        :type only: list of str or None
+        :param defer: The properties not to fetch
+        :type defer: list of str or None
+        :param include_vertices: Load the endpoints of the resulting edges,
+        see prefetch_vertices
+        :type include_vertices: boolean
         
         """
-        label_strings = []
-        for label in labels:
-            if inspect.isclass(label) and issubclass(label, Edge):
-                label_string = label.get_label()
-            elif isinstance(label, Edge):
-                label_string = label.get_label()
-            elif isinstance(label, basestring):
-                label_string = label
-            else:
-                raise ThunderdomeException('traversal labels must be edge classes, instances, or strings')
-            label_strings.append(label_string)
-
-        allowed_elts = None
-        if types is not None:
-            allowed_elts = []
-            for e in types:
-                if issubclass(e, Vertex):
-                    allowed_elts += [e.get_element_type()]
-                elif issubclass(e, Edge):
-                    allowed_elts += [e.get_label()]
-
-        if limit is not None and offset is not None:
-            start = offset
-            end = offset + limit
+        label_strings = self._label_strings(labels)
+        allowed_elts = self._allowed_element_types(types)
+
+        if include_vertices:
+            if not operation.endswith('E'):
+                raise ThunderdomeException('include_vertices only applies to edge traversals')
+            if stream:
+                raise ThunderdomeException('streamed traversals can not include vertices')
+            results = self._simple_traversal(operation, labels, limit=limit, offset=offset, types=types,
+                                             after=after, sort_key=sort_key, only=only, defer=defer)
+            return futures.chain(results, lambda edges: prefetch_vertices(_attach_vertices(edges, [self])))
+
+        only, defer = _projection(only, defer, types)
+
+        if after is not _OFFSET_PAGINATION:
+            if stream:
+                raise ThunderdomeException('keyset paginated traversals can not be streamed')
+            return self._keyset_page(operation, label_strings, limit, after, sort_key, allowed_elts,
+                                     only=only, defer=defer)
+
+        if limit is not None:
+            start = offset or 0
+            end = start + limit
         else:
             start = end = None
+
+        if stream:
+            return self._gremlin_methods['_traversal'].iterate(self,
+                                                                operation,
+                                                                label_strings,
+                                                                start,
+                                                                end,
+                                                                allowed_elts,
+                                                                only,
+                                                                defer)
         
         return self._traversal(operation,
                                label_strings,
                                start,
                                end,
-                               allowed_elts)
+                               allowed_elts,
+                               only,
+                               defer)
 
-    def _simple_deletion(self, operation, labels):
-        """
-        Perform simple bulk graph deletion operation.
+    @classmethod
+    def _simple_traversal_many(cls,
+                               operation,
+                               vertices,
+                               labels,
+                               limit=None,
+                               offset=None,
+                               types=None):
+        """
+        Perform the same traversal from many vertices in a single query.
+        Elements reached from several of the vertices are only sent and
+        deserialized once.
 
         :param operation: The operation to be performed
         :type operation: str
-        :param label: The edge label to be used
-        :type label: str or Edge
-        
+        :param vertices: The vertices to start from
+        :type vertices: list of Vertex
+        :param labels: The edge labels to be used
+        :type labels: list of Edges or strings
+        :param limit: The maximum number of results per vertex
+        :type limit: int
+        :param offset: The number of results skipped for each vertex
+        :type offset: int
+        :param types: The list of allowed result elements
+        :type types: list
+        :rtype: dict
+
+        """
+        vertices = list(vertices)
+        label_strings = cls._label_strings(labels)
+        allowed_elts = cls._allowed_element_types(types)
+
+        if limit is not None:
+            start = offset or 0
+            end = start + limit
+        else:
+            start = end = None
+
+        eids = []
+        for v in vertices:
+            if v.eid is not None and v.eid not in eids:
+                eids.append(v.eid)
+        if not eids:
+            return {v: [] for v in vertices}
+
+        results = cls._traversal_many(eids, operation, label_strings, start, end, allowed_elts)
+
+        def _by_vertex(results):
+            elements, positions = results
+            reached = {eid: [elements[i] for i in indices] for eid, indices in positions}
+            return {v: list(reached.get(v.eid, [])) for v in vertices}
+        return futures.chain(results, _by_vertex)
+
+    @staticmethod
+    def _label_strings(labels):
+        """
+        Converts traversal labels to strings.
+
+        :param labels: The edge labels to be used
+        :type labels: list of Edges or strings
+        :rtype: list of str
+
         """
         label_strings = []
         for label in labels:
@@ -669,9 +1448,126 @@ class Vertex(Element):
                 label_string = label.get_label()
             elif isinstance(label, Edge):
                 label_string = label.get_label()
+            elif isinstance(label, basestring):
+                label_string = label
+            else:
+                raise ThunderdomeException('traversal labels must be edge classes, instances, or strings')
             label_strings.append(label_string)
+        return label_strings
 
-        return self._delete_related(operation, label_strings)
+    @staticmethod
+    def _allowed_element_types(types):
+        """
+        Converts the allowed result classes to element types and labels.
+
+        :param types: The list of allowed result elements
+        :type types: list or None
+        :rtype: list of str or None
+
+        """
+        if types is None:
+            return None
+        allowed_elts = []
+        for e in types:
+            if issubclass(e, Vertex):
+                allowed_elts += [e.get_element_type()]
+            elif issubclass(e, Edge):
+                allowed_elts += [e.get_label()]
+        return allowed_elts
+
+    def _keyset_page(self, operation, labels, limit, after, sort_key, element_types=None, other=None,
+                     only=None, defer=None):
+        """
+        Fetch one keyset paginated page of a traversal, only the labels given
+        are followed. Edge classes declaring sort_key as their primary_key
+        column have their edges read in sort key order, which stops once the
+        page is full, the edges of other labels are all read.
+
+        :param operation: The operation to be performed
+        :type operation: str
+        :param labels: The edge labels to be followed
+        :type labels: list of str
+        :param limit: The maximum number of results
+        :type limit: int
+        :param after: The continuation token of the previous page
+        :type after: str or None
+        :param sort_key: The edge property the results are ordered by
+        :type sort_key: str
+        :param element_types: The allowed result element types
+        :type element_types: list of str
+        :param other: Only follow edges to this vertex
+        :type other: Vertex
+        :param only: The only properties to fetch, see _projection
+        :type only: list of str or None
+        :param defer: The properties not to fetch
+        :type defer: list of str or None
+        :rtype: thunderdome.containers.Page
+
+        """
+        if not limit:
+            raise ThunderdomeException('keyset pagination needs a page size')
+        if sort_key is None:
+            raise ThunderdomeException('keyset pagination needs a sort key')
+        if not labels:
+            raise ThunderdomeException('keyset pagination needs the edge labels to follow')
+        position = decode_token(after, sort_key)
+        sorted_labels = [label for label in labels if _primary_key(label) == sort_key]
+        results = self._keyset_traversal(operation,
+                                         labels,
+                                         sorted_labels,
+                                         other.eid if other is not None else None,
+                                         sort_key,
+                                         position,
+                                         limit,
+                                         element_types,
+                                         only,
+                                         defer)
+
+        def _page(results):
+            elements, last = results
+            return Page(elements, encode_token(sort_key, last) if last is not None else None)
+        return futures.chain(results, _page)
+
+    def _simple_deletion(self, operation, labels):
+        """
+        Perform simple bulk graph deletion operation.
+
+        :param operation: The operation to be performed
+        :type operation: str
+        :param label: The edge label to be used
+        :type label: str or Edge
+        
+        """
+        label_strings = []
+        for label in labels:
+            if inspect.isclass(label) and issubclass(label, Edge):
+                label_string = label.get_label()
+            elif isinstance(label, Edge):
+                label_string = label.get_label()
+            label_strings.append(label_string)
+
+        results = self._delete_related(operation, label_strings)
+        return futures.chain(results, self._invalidate_deleted)
+
+    @staticmethod
+    def _invalidate_deleted(results):
+        """
+        Drops the elements removed by _delete_related from the element cache.
+
+        :param results: The [eid, vid] pairs of the removed vertices and the
+        eids of the removed edges
+        :type results: list
+
+        """
+        element_cache = cache.element_cache()
+        if element_cache is not None and results:
+            vertices, edges = results
+            keys = []
+            for eid, vid in vertices:
+                keys += element_cache.vertex_keys(eid, vid)
+            for eid in edges:
+                keys += element_cache.edge_keys(eid)
+            element_cache.invalidate(keys)
 
     def outV(self, *labels, **kwargs):
         """
@@ -686,6 +1582,14 @@ class Vertex(Element):
         :type offset: int or None
         :param types: A list of allowed element types
         :type types: list
+        :param stream: Return a cursor yielding the results as they are read
+        :type stream: boolean
+        :param after: Continuation token, switches to keyset pagination
+        :type after: str or None
+        :param only: The only properties of the results to fetch
+        :type only: list of str
+        :param defer: The properties of the results not to fetch
+        :type defer: list of str
         
         """
         return self._simple_traversal('outV', labels, **kwargs)
@@ -703,6 +1607,14 @@ class Vertex(Element):
         :type offset: int or None
         :param types: A list of allowed element types
         :type types: list
+        :param stream: Return a cursor yielding the results as they are read
+        :type stream: boolean
+        :param after: Continuation token, switches to keyset pagination
+        :type after: str or None
+        :param only: The only properties of the results to fetch
+        :type only: list of str
+        :param defer: The properties of the results not to fetch
+        :type defer: list of str
 
         """
         return self._simple_traversal('inV', labels, **kwargs)
@@ -719,6 +1631,16 @@ class Vertex(Element):
         :type offset: int or None
         :param types: A list of allowed element types
         :type types: list
+        :param stream: Return a cursor yielding the results as they are read
+        :type stream: boolean
+        :param after: Continuation token, switches to keyset pagination
+        :type after: str or None
+        :param only: The only properties of the results to fetch
+        :type only: list of str
+        :param defer: The properties of the results not to fetch
+        :type defer: list of str
+        :param include_vertices: Also load the vertices at the ends of the edges
+        :type include_vertices: boolean
         
         """
         return self._simple_traversal('outE', labels, **kwargs)
@@ -735,6 +1657,16 @@ class Vertex(Element):
         :type offset: int or None
         :param types: A list of allowed element types
         :type types: list
+        :param stream: Return a cursor yielding the results as they are read
+        :type stream: boolean
+        :param after: Continuation token, switches to keyset pagination
+        :type after: str or None
+        :param only: The only properties of the results to fetch
+        :type only: list of str
+        :param defer: The properties of the results not to fetch
+        :type defer: list of str
+        :param include_vertices: Also load the vertices at the ends of the edges
+        :type include_vertices: boolean
         
         """
         return self._simple_traversal('inE', labels, **kwargs)
@@ -751,6 +1683,16 @@ class Vertex(Element):
         :type offset: int or None
         :param types: A list of allowed element types
         :type types: list
+        :param stream: Return a cursor yielding the results as they are read
+        :type stream: boolean
+        :param after: Continuation token, switches to keyset pagination
+        :type after: str or None
+        :param only: The only properties of the results to fetch
+        :type only: list of str
+        :param defer: The properties of the results not to fetch
+        :type defer: list of str
+        :param include_vertices: Also load the vertices at the ends of the edges
+        :type include_vertices: boolean
         
         """
         return self._simple_traversal('bothE', labels, **kwargs)
@@ -767,10 +1709,144 @@ class Vertex(Element):
         :type offset: int or None
         :param types: A list of allowed element types
         :type types: list
+        :param stream: Return a cursor yielding the results as they are read
+        :type stream: boolean
+        :param after: Continuation token, switches to keyset pagination
+        :type after: str or None
+        :param only: The only properties of the results to fetch
+        :type only: list of str
+        :param defer: The properties of the results not to fetch
+        :type defer: list of str
         
         """
         return self._simple_traversal('bothV', labels, **kwargs)
 
+    @classmethod
+    def outV_many(cls, vertices, *labels, **kwargs):
+        """
+        Return the vertices reached by traversing the outgoing edges with the
+        given labels from each of the vertices, in a single query.
+
+        :param vertices: The vertices to traverse from
+        :type vertices: list of Vertex
+        :param labels: pass in the labels to follow in as positional arguments
+        :type labels: str or BaseEdge
+        :param limit: The maximum number of results per vertex
+        :type limit: int or None
+        :param offset: The number of results skipped for each vertex
+        :type offset: int or None
+        :param types: A list of allowed element types
+        :type types: list
+        :rtype: dict mapping each vertex to its results
+
+        """
+        return cls._simple_traversal_many('outV', vertices, labels, **kwargs)
+
+    @classmethod
+    def inV_many(cls, vertices, *labels, **kwargs):
+        """
+        Return the vertices reached by traversing the incoming edges with the
+        given labels from each of the vertices, in a single query.
+
+        :param vertices: The vertices to traverse from
+        :type vertices: list of Vertex
+        :param labels: pass in the labels to follow in as positional arguments
+        :type labels: str or BaseEdge
+        :param limit: The maximum number of results per vertex
+        :type limit: int or None
+        :param offset: The number of results skipped for each vertex
+        :type offset: int or None
+        :param types: A list of allowed element types
+        :type types: list
+        :rtype: dict mapping each vertex to its results
+
+        """
+        return cls._simple_traversal_many('inV', vertices, labels, **kwargs)
+
+    @classmethod
+    def outE_many(cls, vertices, *labels, **kwargs):
+        """
+        Return the edges with the given labels going out of each of the
+        vertices, in a single query.
+
+        :param vertices: The vertices to traverse from
+        :type vertices: list of Vertex
+        :param labels: pass in the labels to follow in as positional arguments
+        :type labels: str or BaseEdge
+        :param limit: The maximum number of results per vertex
+        :type limit: int or None
+        :param offset: The number of results skipped for each vertex
+        :type offset: int or None
+        :param types: A list of allowed element types
+        :type types: list
+        :rtype: dict mapping each vertex to its results
+
+        """
+        return cls._simple_traversal_many('outE', vertices, labels, **kwargs)
+
+    @classmethod
+    def inE_many(cls, vertices, *labels, **kwargs):
+        """
+        Return the edges with the given labels coming into each of the
+        vertices, in a single query.
+
+        :param vertices: The vertices to traverse from
+        :type vertices: list of Vertex
+        :param labels: pass in the labels to follow in as positional arguments
+        :type labels: str or BaseEdge
+        :param limit: The maximum number of results per vertex
+        :type limit: int or None
+        :param offset: The number of results skipped for each vertex
+        :type offset: int or None
+        :param types: A list of allowed element types
+        :type types: list
+        :rtype: dict mapping each vertex to its results
+
+        """
+        return cls._simple_traversal_many('inE', vertices, labels, **kwargs)
+
+    @classmethod
+    def bothE_many(cls, vertices, *labels, **kwargs):
+        """
+        Return the edges both incoming and outgoing from each of the
+        vertices, in a single query.
+
+        :param vertices: The vertices to traverse from
+        :type vertices: list of Vertex
+        :param labels: pass in the labels to follow in as positional arguments
+        :type labels: str or BaseEdge
+        :param limit: The maximum number of results per vertex
+        :type limit: int or None
+        :param offset: The number of results skipped for each vertex
+        :type offset: int or None
+        :param types: A list of allowed element types
+        :type types: list
+        :rtype: dict mapping each vertex to its results
+
+        """
+        return cls._simple_traversal_many('bothE', vertices, labels, **kwargs)
+
+    @classmethod
+    def bothV_many(cls, vertices, *labels, **kwargs):
+        """
+        Return the vertices both incoming and outgoing from each of the
+        vertices, in a single query.
+
+        :param vertices: The vertices to traverse from
+        :type vertices: list of Vertex
+        :param labels: pass in the labels to follow in as positional arguments
+        :type labels: str or BaseEdge
+        :param limit: The maximum number of results per vertex
+        :type limit: int or None
+        :param offset: The number of results skipped for each vertex
+        :type offset: int or None
+        :param types: A list of allowed element types
+        :type types: list
+        :rtype: dict mapping each vertex to its results
+
+        """
+        return cls._simple_traversal_many('bothV', vertices, labels, **kwargs)
+
 
     def delete_outE(self, *labels):
         """Delete all outgoing edges with the given label."""
@@ -791,6 +1867,36 @@ class Vertex(Element):
     def query(self):
         return Query(self)
 
+    def traverse(self):
+        """
+        Starts a multi hop traversal from this vertex, see Traversal.
+
+        :rtype: Traversal
+
+        """
+        return Traversal(self)
+
+    #non-blocking counterparts returning thunderdome.futures.Future objects
+    all_async = async_method('all')
+    get_async = async_method('get')
+    get_by_eid_async = async_method('get_by_eid')
+    save_async = async_method('save')
+    save_many_async = async_method('save_many')
+    create_many_async = async_method('create_many')
+    delete_async = async_method('delete')
+    outV_async = async_method('outV')
+    inV_async = async_method('inV')
+    outE_async = async_method('outE')
+    inE_async = async_method('inE')
+    bothE_async = async_method('bothE')
+    bothV_async = async_method('bothV')
+    outV_many_async = async_method('outV_many')
+    inV_many_async = async_method('inV_many')
+    outE_many_async = async_method('outE_many')
+    inE_many_async = async_method('inE_many')
+    bothE_many_async = async_method('bothE_many')
+    bothV_many_async = async_method('bothV_many')
+
         
         
 def to_offset(page_num, per_page):
@@ -814,6 +1920,7 @@ class PaginatedVertex(Vertex):
     """
     Convenience class to easily handle pagination for traversals
     """
+    __slots__ = ()
 
     @staticmethod
     def _transform_kwargs(kwargs):
@@ -822,12 +1929,20 @@ class PaginatedVertex(Vertex):
         :param kwargs:
         :return:
         """
-        values = kwargs.copy()
-        return {
+        values = {
             'limit': kwargs.get('per_page'),
             'offset': to_offset(kwargs.get('page_num'), kwargs.get('per_page')),
             'types': kwargs.get('types'),
+            'stream': kwargs.get('stream', False),
+            'only': kwargs.get('only'),
+            'defer': kwargs.get('defer'),
+            'include_vertices': kwargs.get('include_vertices', False),
         }
+        #keyset pagination
+        if 'after' in kwargs:
+            values['after'] = kwargs['after']
+            values['sort_key'] = kwargs.get('sort_key')
+        return values
 
     __abstract__ = True
     def outV(self, *labels, **kwargs):
@@ -835,6 +1950,8 @@ class PaginatedVertex(Vertex):
         :param labels: pass in the labels to follow in as positional arguments
         :param page_num: the page number to return
         :param per_page: the number of objects to return per page
+        :param after: continuation token of the previous page, pages by key instead of page_num
+        :param sort_key: the edge property keyset pages are ordered by
         :param types: the element types this method is allowed to return
         :return:
         """
@@ -845,6 +1962,8 @@ class PaginatedVertex(Vertex):
         :param labels: pass in the labels to follow in as positional arguments
         :param page_num: the page number to return
         :param per_page: the number of objects to return per page
+        :param after: continuation token of the previous page, pages by key instead of page_num
+        :param sort_key: the edge property keyset pages are ordered by
         :param types: the element types this method is allowed to return
         :return:
         """
@@ -855,6 +1974,8 @@ class PaginatedVertex(Vertex):
         :param labels: pass in the labels to follow in as positional arguments
         :param page_num: the page number to return
         :param per_page: the number of objects to return per page
+        :param after: continuation token of the previous page, pages by key instead of page_num
+        :param sort_key: the edge property keyset pages are ordered by
         :param types: the element types this method is allowed to return
         :return:
         """
@@ -865,6 +1986,8 @@ class PaginatedVertex(Vertex):
         :param labels: pass in the labels to follow in as positional arguments
         :param page_num: the page number to return
         :param per_page: the number of objects to return per page
+        :param after: continuation token of the previous page, pages by key instead of page_num
+        :param sort_key: the edge property keyset pages are ordered by
         :param types: the element types this method is allowed to return
         :return:
         """
@@ -875,6 +1998,8 @@ class PaginatedVertex(Vertex):
         :param labels: pass in the labels to follow in as positional arguments
         :param page_num: the page number to return
         :param per_page: the number of objects to return per page
+        :param after: continuation token of the previous page, pages by key instead of page_num
+        :param sort_key: the edge property keyset pages are ordered by
         :param types: the element types this method is allowed to return
         :return:
         """
@@ -885,6 +2010,8 @@ class PaginatedVertex(Vertex):
         :param labels: pass in the labels to follow in as positional arguments
         :param page_num: the page number to return
         :param per_page: the number of objects to return per page
+        :param after: continuation token of the previous page, pages by key instead of page_num
+        :param sort_key: the edge property keyset pages are ordered by
         :param types: the element types this method is allowed to return
         :return:
         """
@@ -913,6 +2040,7 @@ class Edge(Element):
     
     __metaclass__ = EdgeMetaClass
     __abstract__ = True
+    __slots__ = ('_outV', '_inV')
 
     # if set to True, no more than one edge will
     # be created between two vertices
@@ -923,6 +2051,7 @@ class Edge(Element):
     gremlin_path = 'edge.groovy'
     
     _save_edge = GremlinMethod()
+    _save_edges = GremlinMethod(classmethod=True)
     _get_edges_between = GremlinMethod(classmethod=True)
     
     def __init__(self, outV, inV, **values):
@@ -942,6 +2071,23 @@ class Edge(Element):
         self._inV = inV
         super(Edge, self).__init__(**values)
         
+    @classmethod
+    def _from_db(cls, data):
+        """
+        Builds an edge from a query result, see BaseElement._from_db.
+
+        :param data: The edge as returned by rexster
+        :type data: dict
+        :rtype: Edge
+
+        """
+        if cls._custom_init:
+            return cls(data['_outV'], data['_inV'], **cls.translate_db_fields(data))
+        edge = cls.__new__(cls)
+        edge._outV = data['_outV']
+        edge._inV = data['_inV']
+        return edge._load_values(data)
+
     @classmethod
     def get_label(cls):
         """
@@ -953,9 +2099,11 @@ class Edge(Element):
         return cls._type_name(cls.label)
     
     @classmethod
-    def get_between(cls, outV, inV, page_num=None, per_page=None):
+    def get_between(cls, outV, inV, page_num=None, per_page=None, after=_OFFSET_PAGINATION, sort_key=None,
+                    include_vertices=False):
         """
-        Return all the edges with a given label between two vertices.
+        Return all the edges with a given label between two vertices. Passing
+        `after` pages by continuation token, returning a Page.
         
         :param outV: The vertex the edge comes out of.
         :type outV: Vertex
@@ -965,14 +2113,26 @@ class Edge(Element):
         :type page_num: int
         :param per_page: The number of results per page
         :type per_page : int
+        :param after: The next_token of the previous page, None for the first
+        :type after: str or None
+        :param sort_key: The edge property pages are ordered by, required with `after`
+        :type sort_key: str or None
+        :param include_vertices: Attach outV and inV to the edges
+        :type include_vertices: boolean
         :rtype: list
         
         """
-        return cls._get_edges_between(out_v=outV,
-                                      in_v=inV,
-                                      label=cls.get_label(),
-                                      page_num=page_num,
-                                      per_page=per_page)
+        if after is not _OFFSET_PAGINATION:
+            results = outV._keyset_page('outE', [cls.get_label()], per_page, after, sort_key, other=inV)
+        else:
+            results = cls._get_edges_between(out_v=outV,
+                                              in_v=inV,
+                                              label=cls.get_label(),
+                                              page_num=page_num,
+                                              per_page=per_page)
+        if include_vertices:
+            return futures.chain(results, lambda edges: prefetch_vertices(_attach_vertices(edges, [outV, inV])))
+        return results
     
     def validate(self):
         """
@@ -988,20 +2148,107 @@ class Edge(Element):
         
     def save(self, *args, **kwargs):
         """
-        Save this edge to the graph database.
+        Save this edge to the graph database. Returns this edge, whether or
+        not anything had to be sent.
+
+        :rtype: Edge
+
         """
         super(Edge, self).save(*args, **kwargs)
-        return self._save_edge(self._outV,
-                               self._inV,
-                               self.get_label(),
-                               self.as_save_params(),
-                               exclusive=self.__exclusive__)[0]
+        params = self.as_save_params()
+        if self.__dirty_tracking__ and self.eid is not None and not params:
+            return self
+        results = self._save_edge(self._outV,
+                                  self._inV,
+                                  self.get_label(),
+                                  params,
+                                  exclusive=self.__exclusive__)
+        return futures.chain(results, self._saved)
+
+    @classmethod
+    def create_many(cls, edges, chunk_size=500):
+        """
+        Creates an edge of this type for each (outV, inV, values) tuple,
+        sending them in chunks of chunk_size which are each saved in a single
+        request and transaction. Endpoints can be saved vertices, eids or
+        vids. For exclusive edges the existing edges of each out vertex are
+        only looked up once per chunk. Raises a BulkSaveException listing the
+        failed chunks if any of them couldn't be saved.
+
+        :param edges: (outV, inV) or (outV, inV, values) tuples
+        :type edges: list of tuple
+        :param chunk_size: The number of edges saved per request
+        :type chunk_size: int
+        :rtype: list of Edge
+
+        """
+        from thunderdome.connection import _current_batch
+        if _current_batch() is not None:
+            raise ThunderdomeException("create_many can't be deferred by a batch, it already sends one request per chunk")
+        if chunk_size < 1:
+            raise ValueError('chunk_size must be at least 1')
+
+        instances = []
+        elements = []
+        for entry in edges:
+            outV, inV = entry[0], entry[1]
+            values = entry[2] if len(entry) > 2 else {}
+            edge = cls(outV, inV, **values)
+            super(Edge, edge).save()
+
+            element = {'attrs': edge.as_save_params()}
+            element['out_eid'], element['out_vid'] = cls._endpoint_params(outV)
+            element['in_eid'], element['in_vid'] = cls._endpoint_params(inV)
+            instances.append(edge)
+            elements.append(element)
+
+        errors = []
+        saved = 0
+        for offset in range(0, len(instances), chunk_size):
+            chunk = instances[offset:offset + chunk_size]
+            try:
+                results = cls._save_edges(cls.get_label(), cls.__exclusive__, elements[offset:offset + chunk_size])
+            except ThunderdomeException as ex:
+                errors.append(ChunkError(offset, chunk, ex))
+                continue
+            for edge, result in zip(chunk, results):
+                edge._saved([result])
+                #vids are replaced with the eids they resolved to
+                if not isinstance(edge._outV, Vertex):
+                    edge._outV = result._outV
+                if not isinstance(edge._inV, Vertex):
+                    edge._inV = result._inV
+            saved += len(chunk)
+
+        if errors:
+            raise BulkSaveException(errors, saved)
+        return instances
+
+    @staticmethod
+    def _endpoint_params(vertex):
+        """
+        Returns the eid and vid identifying an edge endpoint, one of them None.
+
+        :param vertex: A saved vertex, an eid or a vid
+        :type vertex: Vertex, int or str
+        :rtype: tuple
+
+        """
+        if isinstance(vertex, Vertex):
+            if vertex.eid is None:
+                raise ValidationError('vertices must be saved before edges to them are created')
+            return vertex.eid, None
+        if isinstance(vertex, (int, long)):
+            return vertex, None
+        if isinstance(vertex, (basestring, UUID)):
+            return None, str(vertex)
+        raise ValidationError('edge endpoints must be vertices, eids or vids, got {}'.format(type(vertex).__name__))
 
     def _reload_values(self):
         """
         Re-read the values for this edge from the graph database.
         """
-        results = execute_query('g.e(eid)', {'eid':self.eid})[0]
+        results = execute_query('g.e(eid)', {'eid':self.eid}, batchable=False)[0]
         del results['_id']
         del results['_type']
         return results
@@ -1016,10 +2263,15 @@ class Edge(Element):
         :type eid: int
         
         """
+        session = current_session()
+        if session is not None and session.lookup('edge', eid) is not None:
+            return session.lookup('edge', eid)
+        element_cache = cache.element_cache()
+        data = element_cache.edge_by_eid(eid) if element_cache is not None else None
+        if data is not None:
+            return cls._deserialize_one([data])
         results = execute_query('g.e(eid)', {'eid':eid})
-        if not results:
-            raise cls.DoesNotExist
-        return Element.deserialize(results[0])
+        return futures.chain(results, lambda r: cls._deserialize_one(cls._cache_results(r)))
 
     @classmethod
     def create(cls, outV, inV, *args, **kwargs):
@@ -1051,6 +2303,10 @@ class Edge(Element):
         }
         """        
         results = execute_query(query, {'eid':self.eid})
+        return futures.chain(results, lambda r: self._invalidate_cached())
+
+    def _cache_keys(self, element_cache):
+        return element_cache.edge_keys(self.eid)
 
     def _simple_traversal(self, operation):
         """
@@ -1063,8 +2319,33 @@ class Edge(Element):
         
         """
         results = execute_query('g.e(eid).%s()'%operation, {'eid':self.eid})
-        return [Element.deserialize(r) for r in results]
+        return futures.chain(results, lambda r: [Element.deserialize(x) for x in r])
         
+    def _endpoint(self, name, operation):
+        """
+        Returns the endpoint kept in the given attribute, loading it if only
+        its eid is known. Loaded endpoints are kept once they are available,
+        inside a batch the attribute is left as it is until the batch is sent.
+
+        :param name: The attribute holding the endpoint
+        :type name: str
+        :param operation: The traversal reaching the endpoint
+        :type operation: str
+
+        """
+        vertex = getattr(self, name)
+        if vertex is None:
+            vertex = self._simple_traversal(operation)
+        elif isinstance(vertex, (int, long)):
+            vertex = Vertex.get_by_eid(vertex)
+        else:
+            return vertex
+
+        def _keep(vertex):
+            setattr(self, name, vertex)
+            return vertex
+        return futures.chain(vertex, _keep)
+
     def inV(self):
         """
         Return the vertex that this edge goes into.
@@ -1072,11 +2353,7 @@ class Edge(Element):
         :rtype: Vertex
         
         """
-        if self._inV is None:
-            self._inV = self._simple_traversal('inV')
-        elif isinstance(self._inV, (int, long)):
-            self._inV = Vertex.get_by_eid(self._inV)
-        return self._inV
+        return self._endpoint('_inV', 'inV')
     
     def outV(self):
         """
@@ -1085,11 +2362,103 @@ class Edge(Element):
         :rtype: Vertex
         
         """
-        if self._outV is None:
-            self._outV = self._simple_traversal('outV')
-        elif isinstance(self._outV, (int, long)):
-            self._outV = Vertex.get_by_eid(self._outV)
-        return self._outV
+        return self._endpoint('_outV', 'outV')
+
+    #non-blocking counterparts returning thunderdome.futures.Future objects
+    get_between_async = async_method('get_between')
+    get_by_eid_async = async_method('get_by_eid')
+    save_async = async_method('save')
+    create_many_async = async_method('create_many')
+    delete_async = async_method('delete')
+    inV_async = async_method('inV')
+    outV_async = async_method('outV')
+
+
+#elements are passed to gremlin methods by eid and element classes by name
+register_param_encoder(BaseElement, lambda element: element.eid)
+register_param_encoder(VertexMetaClass, lambda klass: klass.element_type)
+register_param_encoder(EdgeMetaClass, lambda klass: klass.label)
+
+
+#edge attributes holding the endpoints loaded by prefetch_vertices
+_PREFETCH_ENDPOINTS = {
+    'inV': ('_inV',),
+    'outV': ('_outV',),
+    'both': ('_outV', '_inV'),
+}
+
+
+def _attach_vertices(edges, vertices):
+    """
+    Replaces the endpoint eids of the edges with the given vertices.
+
+    :param edges: The edges
+    :type edges: list of Edge
+    :param vertices: Vertices already loaded
+    :type vertices: list of Vertex
+    :rtype: list of Edge
+
+    """
+    loaded = {v.eid: v for v in vertices if isinstance(v, Vertex) and v.eid is not None}
+    for edge in edges:
+        for attr in _PREFETCH_ENDPOINTS['both']:
+            eid = getattr(edge, attr)
+            if isinstance(eid, (int, long)) and eid in loaded:
+                setattr(edge, attr, loaded[eid])
+    return edges
+
+
+def prefetch_vertices(edges, direction='both'):
+    """
+    Loads the endpoints of the given edges in a single query and attaches
+    them, so calling inV() or outV() on the edges doesn't query the graph
+    once per edge. Vertices known to the current session or the element cache
+    aren't fetched.
+
+    :param edges: The edges
+    :type edges: list of Edge
+    :param direction: The endpoints to load, 'inV', 'outV' or 'both'
+    :type direction: str
+    :rtype: list of Edge
+
+    """
+    if direction not in _PREFETCH_ENDPOINTS:
+        raise ThunderdomeException("direction must be one of 'inV', 'outV' or 'both', got {}".format(direction))
+    attrs = _PREFETCH_ENDPOINTS[direction]
+    if not isinstance(edges, list):
+        edges = list(edges)
+
+    eids = []
+    seen = set()
+    for edge in edges:
+        for attr in attrs:
+            eid = getattr(edge, attr)
+            if isinstance(eid, (int, long)) and eid not in seen:
+                seen.add(eid)
+                eids.append(eid)
+
+    session = current_session()
+    element_cache = cache.element_cache()
+    vertices = []
+    missing = []
+    for eid in eids:
+        vertex = session.lookup('vertex', eid) if session is not None else None
+        if vertex is None and element_cache is not None:
+            data = element_cache.vertex_by_eid(eid)
+            vertex = Element.deserialize(data) if data is not None else None
+        if vertex is not None:
+            vertices.append(vertex)
+        else:
+            missing.append(eid)
+
+    def _attach(results):
+        loaded = vertices + [Element.deserialize(r) for r in Element._cache_results(results) if r is not None]
+        return _attach_vertices(edges, loaded)
+
+    if not missing:
+        return _attach([])
+    results = execute_query('eids.collect{g.v(it)}', {'eids':missing})
+    return futures.chain(results, _attach)
 
 
 
@@ -1102,21 +2471,25 @@ class Query(object):
     This method seems more flexible, and consistent w/ the rest of Gremlin.
     """
     _limit = None
+    _only = None
+    _defer = None
+
+    #compiled scripts keyed by query shape, see _shape
+    _script_cache = LRUCache(maxsize=512)
 
     def __init__(self, vertex):
         self._vertex = vertex
-        self._has = []
-        self._interval = []
+        self._has = ()
+        self._interval = ()
         self._labels = []
         self._direction = []
-        self._vars = {}
 
     def count(self):
         """
         :return: number of matching vertices
         :rtype int
         """
-        return self._execute('count', deserialize=False)[0]
+        return futures.chain(self._execute('count', deserialize=False), lambda r: r[0])
 
     def direction(self, direction):
         """
@@ -1129,11 +2502,13 @@ class Query(object):
         q._direction = direction
         return q
 
-    def edges(self):
+    def edges(self, stream=False):
         """
+        :param stream: Return a cursor yielding the edges as they are read
+        :type stream: boolean
         :return list of matching edges
         """
-        return self._execute('edges')
+        return self._execute('edges', stream=stream)
 
     def has(self, key, value, compare=EQUAL):
         """
@@ -1145,7 +2520,7 @@ class Query(object):
         compare = "Query.Compare.{}".format(compare)
 
         q = copy.copy(self)
-        q._has.append((key,value,compare))
+        q._has = self._has + ((key,value,compare),)
         return q
 
     def interval(self, key, start, end):
@@ -1156,7 +2531,7 @@ class Query(object):
             start, end = end, start
 
         q = copy.copy(self)
-        q._interval.append((key, start, end))
+        q._interval = self._interval + ((key, start, end),)
         return q
 
 
@@ -1181,69 +2556,141 @@ class Query(object):
         q._limit = limit
         return q
 
+    def only(self, *keys):
+        """
+        Fetches only the given properties of the matching elements, the
+        others are loaded on first access.
+
+        :param keys: The properties to fetch
+        :type keys: str
+        :rtype: Query
+        """
+        q = copy.copy(self)
+        q._only, q._defer = _projection(keys, self._defer)
+        return q
+
+    def defer(self, *keys):
+        """
+        Fetches all but the given properties of the matching elements, they
+        are loaded on first access.
+
+        :param keys: The properties not to fetch
+        :type keys: str
+        :rtype: Query
+        """
+        q = copy.copy(self)
+        q._only, q._defer = _projection(self._only, keys)
+        return q
+
     def vertexIds(self):
         return self._execute('vertexIds', deserialize=False)
 
-    def vertices(self):
-        return self._execute('vertices')
+    def vertices(self, stream=False):
+        """
+        :param stream: Return a cursor yielding the vertices as they are read
+        :type stream: boolean
+        :return list of matching vertices
+        """
+        return self._execute('vertices', stream=stream)
+
+    #non-blocking counterparts returning thunderdome.futures.Future objects
+    count_async = async_method('count')
+    edges_async = async_method('edges')
+    vertices_async = async_method('vertices')
+    vertexIds_async = async_method('vertexIds')
+
+    def _shape(self):
+        """
+        Returns what the script of this query depends on, queries of the same
+        shape only differ by their parameters.
+
+        :rtype: tuple
+
+        """
+        return (tuple(self._labels),
+                bool(self._limit),
+                self._direction or None,
+                tuple((key, isinstance(value, float), compare) for key, value, compare in self._has),
+                tuple((key, isinstance(start, float), isinstance(end, float)) for key, start, end in self._interval),
+                self._only is not None or self._defer is not None)
+
+    def _params(self):
+        """
+        Returns the parameters bound to the script, named in the order they
+        appear in it.
+
+        :rtype: dict
+
+        """
+        values = [value for key, value, compare in self._has]
+        for key, start, end in self._interval:
+            values += [start, end]
+        params = {"v{}".format(i): value for i, value in enumerate(values)}
+        params.update({"eid":self._vertex.eid, "limit":self._limit})
+        if self._only is not None or self._defer is not None:
+            params.update({"only":self._only, "defer":self._defer})
+        return params
 
     def _get_partial(self):
-        limit = ".limit(limit)" if self._limit else ""
-        dir = ".direction({})".format(self._direction) if self._direction else ""
+        return self._script(self._shape())
 
-        # do labels
-        labels = ""
-        if self._labels:
-            labels = ["'{}'".format(x) for x in self._labels]
-            labels = ", ".join(labels)
-            labels = ".labels({})".format(labels)
-
-        ### construct has clauses
-        has = []
-
-        for x in self._has:
-            c = "v{}".format(len(self._vars))
-            self._vars[c] = x[1]
-
-            val = "{} as double".format(c) if isinstance(x[1], float) else c
-            key = x[0]
-            has.append("has('{}', {}, {})".format(key, val, x[2]))
-
-        if has:
-            tmp = ".".join(has)
-            has = '.{}'.format(tmp)
-        else:
-            has = ""
-        ### end construct has clauses
+    @classmethod
+    def _script(cls, shape, func=None):
+        """
+        Returns the script of the given shape, compiling it on a cache miss.
 
-        intervals = []
-        for x in self._interval:
-            c = "v{}".format(len(self._vars))
-            self._vars[c] = x[1]
-            c2 = "v{}".format(len(self._vars))
-            self._vars[c2] = x[2]
+        :param shape: The query shape
+        :type shape: tuple
+        :param func: The query method called at the end of the script
+        :type func: str or None
+        :rtype: str
 
+        """
+        key = (shape, func)
+        script = cls._script_cache.get(key)
+        if script is None:
+            script = cls._compile(shape)
+            if func is not None:
+                script = "{}.{}()".format(script, func)
+                #projected elements are turned into maps
+                if shape[-1] and func in ('vertices', 'edges'):
+                    script = "{}.collect{{ _project(it, only, defer) }}".format(script)
+            cls._script_cache.set(key, script)
+        return script
 
-            val1 = "{} as double".format(c) if isinstance(x[1], float) else c
-            val2 = "{} as double".format(c2) if isinstance(x[2], float) else c2
+    @staticmethod
+    def _compile(shape):
+        labels, limit, direction, has_clauses, interval_clauses, projected = shape
+        limit = ".limit(limit)" if limit else ""
+        dir = ".direction({})".format(direction) if direction else ""
 
-            tmp = "interval('{}', {}, {})".format(x[0], val1, val2)
-            intervals.append(tmp)
+        # do labels
+        labels = ".labels({})".format(", ".join("'{}'".format(x) for x in labels)) if labels else ""
 
-        if intervals:
-            intervals = ".{}".format(".".join(intervals))
-        else:
-            intervals = ""
+        variables = ("v{}".format(i) for i in itertools.count())
+
+        def value(is_float):
+            c = next(variables)
+            return "{} as double".format(c) if is_float else c
+
+        has = "".join(".has('{}', {}, {})".format(key, value(is_float), compare)
+                      for key, is_float, compare in has_clauses)
+
+        intervals = "".join(".interval('{}', {}, {})".format(key, value(start_float), value(end_float))
+                            for key, start_float, end_float in interval_clauses)
 
         return "g.v(eid).query(){}{}{}{}{}".format(labels, limit, dir, has, intervals)
 
-    def _execute(self, func, deserialize=True):
-        tmp = "{}.{}()".format(self._get_partial(), func)
-        self._vars.update({"eid":self._vertex.eid, "limit":self._limit})
-        results = execute_query(tmp, self._vars)
+    def _execute(self, func, deserialize=True, stream=False):
+        shape = self._shape()
+        tmp = self._script(shape, func)
+        functions = [_project_function()] if shape[-1] and func in ('vertices', 'edges') else None
+        results = execute_query(tmp, self._params(), functions=functions, stream=stream)
 
+        if stream:
+            return results.map(Element.deserialize) if deserialize else results
         if deserialize:
-            return  [Element.deserialize(r) for r in results]
+            return futures.chain(results, lambda r: [Element.deserialize(x) for x in r])
         else:
             return results
 
@@ -1252,3 +2699,257 @@ class Query(object):
 
 
 
+
+
+#gremlin pipeline tokens of the Query compare constants
+_PIPELINE_COMPARE = {
+    EQUAL: 'T.eq',
+    NOT_EQUAL: 'T.neq',
+    GREATER_THAN: 'T.gt',
+    GREATER_THAN_EQUAL: 'T.gte',
+    LESS_THAN: 'T.lt',
+    LESS_THAN_EQUAL: 'T.lte',
+}
+
+
+class Traversal(object):
+    """
+    Builds a multi hop traversal starting at a vertex, compiled to a single
+    parameterized gremlin pipeline and run in one request. Like Query, every
+    step returns a new traversal.
+
+    friends_of_friends = v.traverse().out(Follows).out(Follows).dedup().limit(50).all()
+    """
+
+    def __init__(self, vertex, steps=()):
+        """
+        :param vertex: The vertex the traversal starts at
+        :type vertex: Vertex
+        :param steps: The (step, args) pairs of the pipeline
+        :type steps: tuple
+
+        """
+        self._vertex = vertex
+        self._steps = steps
+
+    def _step(self, name, *args):
+        return Traversal(self._vertex, self._steps + ((name, args),))
+
+    def _label_args(self, labels):
+        return ('labels', tuple(Vertex._label_strings(labels)))
+
+    def out(self, *labels):
+        """
+        Follows outgoing edges to the adjacent vertices.
+
+        :param labels: The edge labels to follow, all labels if none are given
+        :type labels: str or Edge
+        :rtype: Traversal
+
+        """
+        return self._step('out', self._label_args(labels))
+
+    def in_(self, *labels):
+        """
+        Follows incoming edges to the adjacent vertices.
+
+        :param labels: The edge labels to follow, all labels if none are given
+        :type labels: str or Edge
+        :rtype: Traversal
+
+        """
+        return self._step('in', self._label_args(labels))
+
+    def both(self, *labels):
+        """
+        Follows edges in both directions to the adjacent vertices.
+
+        :param labels: The edge labels to follow, all labels if none are given
+        :type labels: str or Edge
+        :rtype: Traversal
+
+        """
+        return self._step('both', self._label_args(labels))
+
+    def outE(self, *labels):
+        """
+        Moves to the outgoing edges.
+
+        :param labels: The edge labels to follow, all labels if none are given
+        :type labels: str or Edge
+        :rtype: Traversal
+
+        """
+        return self._step('outE', self._label_args(labels))
+
+    def inE(self, *labels):
+        """
+        Moves to the incoming edges.
+
+        :param labels: The edge labels to follow, all labels if none are given
+        :type labels: str or Edge
+        :rtype: Traversal
+
+        """
+        return self._step('inE', self._label_args(labels))
+
+    def bothE(self, *labels):
+        """
+        Moves to the incoming and outgoing edges.
+
+        :param labels: The edge labels to follow, all labels if none are given
+        :type labels: str or Edge
+        :rtype: Traversal
+
+        """
+        return self._step('bothE', self._label_args(labels))
+
+    def outV(self):
+        """
+        Moves from edges to the vertices they come out of.
+
+        :rtype: Traversal
+
+        """
+        return self._step('outV')
+
+    def inV(self):
+        """
+        Moves from edges to the vertices they go into.
+
+        :rtype: Traversal
+
+        """
+        return self._step('inV')
+
+    def bothV(self):
+        """
+        Moves from edges to both of their vertices.
+
+        :rtype: Traversal
+
+        """
+        return self._step('bothV')
+
+    def has(self, key, value, compare=EQUAL):
+        """
+        Keeps the elements whose property compares to the value.
+
+        :param key: The property name
+        :type key: str
+        :param value: The value to compare to
+        :type value: str, float, int
+        :param compare: One of the compare constants, EQUAL by default
+        :type compare: str
+        :rtype: Traversal
+
+        """
+        if compare not in _PIPELINE_COMPARE:
+            raise ThunderdomeQueryError('unknown comparison: {}'.format(compare))
+        return self._step('has', ('value', key), ('token', _PIPELINE_COMPARE[compare]), ('value', value))
+
+    def interval(self, key, start, end):
+        """
+        Keeps the elements whose property is within [start, end).
+
+        :rtype: Traversal
+
+        """
+        if start > end:
+            start, end = end, start
+        return self._step('interval', ('value', key), ('value', start), ('value', end))
+
+    def types(self, *classes):
+        """
+        Keeps the elements of the given vertex or edge classes.
+
+        :param classes: The allowed vertex and edge classes
+        :type classes: Vertex or Edge
+        :rtype: Traversal
+
+        """
+        return self._step('types', ('value', Vertex._allowed_element_types(classes)))
+
+    def dedup(self):
+        """
+        Drops elements which have already been reached.
+
+        :rtype: Traversal
+
+        """
+        return self._step('dedup')
+
+    def limit(self, limit):
+        """
+        Stops after the given number of elements.
+
+        :rtype: Traversal
+
+        """
+        return self._step('limit', ('value', limit))
+
+    def all(self, stream=False):
+        """
+        Runs the traversal, returning the elements reached.
+
+        :param stream: Return a cursor yielding the elements as they are read
+        :type stream: boolean
+        :rtype: list
+
+        """
+        script, params = self._compile()
+        results = execute_query(script, params, stream=stream)
+        if stream:
+            return results.map(Element.deserialize)
+        return futures.chain(results, lambda r: [Element.deserialize(x) for x in r])
+
+    def count(self):
+        """
+        Runs the traversal, returning the number of elements reached.
+
+        :rtype: int
+
+        """
+        script, params = self._compile(".count()")
+        return futures.chain(execute_query(script, params), lambda r: r[0])
+
+    #non-blocking counterparts returning thunderdome.futures.Future objects
+    all_async = async_method('all')
+    count_async = async_method('count')
+
+    def _compile(self, suffix=""):
+        """
+        Builds the gremlin script and its parameters, values are always sent
+        as parameters so the script only depends on the steps taken.
+
+        :rtype: tuple
+
+        """
+        if self._vertex.eid is None:
+            raise ThunderdomeQueryError('can not traverse from an unsaved vertex')
+        params = {'eid': self._vertex.eid}
+
+        def param(value):
+            name = 'p{}'.format(len(params) - 1)
+            params[name] = value
+            return "{} as double".format(name) if isinstance(value, float) else name
+
+        script = ["g.v(eid)"]
+        for name, args in self._steps:
+            compiled = []
+            for kind, value in args:
+                if kind == 'labels':
+                    compiled.extend(param(label) for label in value)
+                elif kind == 'token':
+                    compiled.append(value)
+                else:
+                    compiled.append(param(value))
+
+            if name == 'limit':
+                script.append("[0..<{}]".format(compiled[0]))
+            elif name == 'types':
+                script.append(".filter{{(it.element_type ?: it.label) in {}}}".format(compiled[0]))
+            else:
+                script.append(".{}({})".format(name, ", ".join(compiled)))
+
+        return "".join(script) + suffix, params
@@ -0,0 +1,327 @@
+# Copyright (c) 2012-2013 SHIFT.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from contextlib import contextmanager
+import httplib
+import logging
+import select
+import threading
+import time
+
+from thunderdome.exceptions import ThunderdomeException
+
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(ThunderdomeException):
+    """
+    No connection became available within the pool timeout
+    """
+
+
+def http_connection_factory(host):
+    """
+    Returns a new, unconnected, HTTP/1.1 connection to the given host.
+
+    :param host: The host to connect to
+    :type host: thunderdome.connection.Host
+    :rtype: httplib.HTTPConnection
+
+    """
+    return httplib.HTTPConnection(host.name, int(host.port))
+
+
+def http_connection_is_alive(conn):
+    """
+    Checks that a pooled HTTP connection can be reused. An idle keep-alive
+    socket should never be readable, if it is the server has either closed it
+    or sent garbage, either way it can't be used for another request.
+
+    :param conn: The connection to check
+    :type conn: httplib.HTTPConnection
+    :rtype: boolean
+
+    """
+    sock = getattr(conn, 'sock', None)
+    if sock is None:
+        # httplib reconnects lazily on the next request
+        return True
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+    except (select.error, ValueError, TypeError):
+        return False
+    return not readable
+
+
+class PooledConnection(object):
+    """
+    Wraps a connection with the bookkeeping needed to expire it.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        self.uses = 0
+
+    def close(self):
+        try:
+            self.conn.close()
+        except Exception:
+            logger.debug("Error closing pooled connection", exc_info=True)
+
+
+class ConnectionPool(object):
+    """
+    Thread-safe pool of persistent connections to a single host.
+
+    Connections are created lazily, up to `size` of them may be checked out at
+    any time. Idle connections are handed out most-recently-used first so that
+    surplus connections age out through `idle_timeout`.
+    """
+
+    def __init__(self,
+                 host,
+                 size=10,
+                 timeout=None,
+                 idle_timeout=60,
+                 max_lifetime=600,
+                 factory=http_connection_factory,
+                 health_check=http_connection_is_alive):
+        """
+        Initialize the pool.
+
+        :param host: The host connections are made to
+        :type host: thunderdome.connection.Host
+        :param size: The maximum number of connections open at once
+        :type size: int
+        :param timeout: Seconds to wait for a free connection, None waits forever
+        :type timeout: float or None
+        :param idle_timeout: Seconds an unused connection is kept open
+        :type idle_timeout: float or None
+        :param max_lifetime: Seconds after which a connection is recycled
+        :type max_lifetime: float or None
+        :param factory: Callable taking the host and returning a new connection
+        :type factory: callable
+        :param health_check: Callable returning False if an idle connection
+        can't be reused
+        :type health_check: callable or None
+
+        """
+        if size < 1:
+            raise ValueError("pool size must be at least 1")
+        self.host = host
+        self.size = size
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.factory = factory
+        self.health_check = health_check
+
+        self._cond = threading.Condition(threading.Lock())
+        self._idle = []
+        self._in_use = 0
+        self._closed = False
+
+        #stats
+        self._created = 0
+        self._discarded = 0
+        self._acquired = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._max_wait_time = 0.0
+
+    def _is_expired(self, pooled, now):
+        """
+        Indicates whether or not the given idle connection should be dropped.
+
+        :rtype: boolean
+
+        """
+        if self.idle_timeout is not None and now - pooled.last_used > self.idle_timeout:
+            return True
+        if self.max_lifetime is not None and now - pooled.created_at > self.max_lifetime:
+            return True
+        return False
+
+    def acquire(self, timeout=-1):
+        """
+        Check a connection out of the pool, creating one if there is room.
+        Raises PoolTimeoutError if none became available in time.
+
+        :param timeout: Overrides the pool timeout if given
+        :type timeout: float or None
+        :rtype: PooledConnection
+
+        """
+        if timeout == -1:
+            timeout = self.timeout
+
+        start = time.time()
+        waited = False
+        stale = []
+        pooled = None
+        create = False
+        try:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolTimeoutError("Connection pool for {}:{} is closed".format(*self.host))
+
+                    now = time.time()
+                    while self._idle:
+                        candidate = self._idle.pop()
+                        if self._is_expired(candidate, now):
+                            stale.append(candidate)
+                        else:
+                            pooled = candidate
+                            break
+                    if pooled is not None or self._in_use + len(self._idle) < self.size:
+                        create = pooled is None
+                        self._in_use += 1
+                        self._acquired += 1
+                        break
+
+                    remaining = None
+                    if timeout is not None:
+                        remaining = timeout - (time.time() - start)
+                        if remaining <= 0:
+                            raise PoolTimeoutError(
+                                "Timed out waiting for a connection to {}:{} ({} in use)".format(
+                                    self.host[0], self.host[1], self._in_use))
+                    waited = True
+                    self._cond.wait(remaining)
+
+                wait_time = time.time() - start
+                if waited:
+                    self._waits += 1
+                self._wait_time += wait_time
+                self._max_wait_time = max(self._max_wait_time, wait_time)
+                self._discarded += len(stale)
+        finally:
+            for s in stale:
+                s.close()
+
+        # health checks and connection creation happen outside of the lock
+        if pooled is not None and self.health_check and not self.health_check(pooled.conn):
+            pooled.close()
+            with self._cond:
+                self._discarded += 1
+            create = True
+
+        if create:
+            try:
+                pooled = PooledConnection(self.factory(self.host))
+            except:
+                with self._cond:
+                    self._in_use -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._created += 1
+
+        pooled.uses += 1
+        return pooled
+
+    def release(self, pooled, discard=False):
+        """
+        Return a connection to the pool.
+
+        :param pooled: The connection returned by acquire
+        :type pooled: PooledConnection
+        :param discard: Close the connection instead of reusing it
+        :type discard: boolean
+
+        """
+        now = time.time()
+        pooled.last_used = now
+        if not discard and self.max_lifetime is not None:
+            discard = now - pooled.created_at > self.max_lifetime
+
+        with self._cond:
+            self._in_use -= 1
+            if discard or self._closed:
+                self._discarded += 1
+            else:
+                self._idle.append(pooled)
+            self._cond.notify()
+
+        if discard or self._closed:
+            pooled.close()
+
+    @contextmanager
+    def connection(self, timeout=-1):
+        """
+        Context manager checking a connection out for the duration of the
+        block. The connection is discarded if the block raises.
+        """
+        pooled = self.acquire(timeout)
+        try:
+            yield pooled
+        except:
+            self.release(pooled, discard=True)
+            raise
+        else:
+            self.release(pooled)
+
+    def prune(self):
+        """
+        Close idle connections which have expired.
+        """
+        now = time.time()
+        with self._cond:
+            stale = [p for p in self._idle if self._is_expired(p, now)]
+            self._idle = [p for p in self._idle if p not in stale]
+            self._discarded += len(stale)
+        for p in stale:
+            p.close()
+
+    def close(self):
+        """
+        Close all idle connections, connections currently checked out are
+        closed as they are released.
+        """
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._discarded += len(idle)
+            self._cond.notify_all()
+        for p in idle:
+            p.close()
+
+    def stats(self):
+        """
+        Returns a snapshot of the pool state.
+
+        :rtype: dict
+
+        """
+        with self._cond:
+            return {
+                'size': self.size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'created': self._created,
+                'discarded': self._discarded,
+                'acquired': self._acquired,
+                'waits': self._waits,
+                'wait_time': self._wait_time,
+                'max_wait_time': self._max_wait_time,
+            }
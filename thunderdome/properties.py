@@ -62,8 +62,8 @@ class BaseValueManager(object):
 
         self.instance = instance
         self.column = column
-        self.previous_value = value
         self.value = value
+        self.previous_value = value
 
     def _create_private_fields(self):
         self._previous_value = None
@@ -100,6 +100,13 @@ class BaseValueManager(object):
         """Return the current value."""
         return self.value
 
+    def peek(self):
+        """
+        Return the current value for inspection, unlike getval the value
+        isn't handed out to be changed.
+        """
+        return self.value
+
     def setval(self, val):
         """
         Updates the current value.
@@ -131,6 +138,56 @@ class BaseValueManager(object):
             return property(_get, _set)
 
 
+class MutableValueManager(BaseValueManager):
+    """
+    Value manager for mutable values, keeps a deep copy of the previous value
+    so changes made in place, e.g. to a nested list, are detected. The copy is
+    taken when the value is first read, values which are loaded but never
+    read aren't copied.
+    """
+
+    def _create_private_fields(self):
+        super(MutableValueManager, self)._create_private_fields()
+        self._value = None
+
+    def _detach(self):
+        """
+        Copies the previous value if it still is the current value, which is
+        about to be handed out and may be changed in place.
+        """
+        if self._value is self._previous_value and self._value is not None:
+            self._previous_value = copy.deepcopy(self._value)
+
+    @property
+    def value(self):
+        self._detach()
+        return self._value
+
+    @value.setter
+    def value(self, val):
+        self._value = val
+
+    @property
+    def previous_value(self):
+        self._detach()
+        return self._previous_value
+
+    @previous_value.setter
+    def previous_value(self, val):
+        self._previous_value = val if val is self._value else copy.deepcopy(val)
+
+    @property
+    def deleted(self):
+        return self._value is None and self._previous_value is not None
+
+    @property
+    def changed(self):
+        return self._value != self._previous_value
+
+    def peek(self):
+        return self._value
+
+
 class Column(object):
     """Base class for column types"""
 
@@ -444,6 +501,8 @@ class Decimal(Column):
 
 class Dictionary(Column):
 
+    value_manager = MutableValueManager
+
     def validate(self, value):
         val = super(Dictionary, self).validate(value)
         if val is None:
@@ -455,6 +514,8 @@ class Dictionary(Column):
 
 class List(Column):
 
+    value_manager = MutableValueManager
+
     def validate(self, value):
         val = super(List, self).validate(value)
         if val is None:
@@ -0,0 +1,276 @@
+# Copyright (c) 2012-2013 SHIFT.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import threading
+
+from thunderdome import connection
+from thunderdome import futures
+from thunderdome.exceptions import ThunderdomeException
+
+
+_local = threading.local()
+
+
+class SessionFlushError(ThunderdomeException):
+    """
+    Some of the pending changes of a session couldn't be written, `errors`
+    holds (element, exception) tuples for each of them.
+    """
+
+    def __init__(self, errors):
+        self.errors = errors
+        super(SessionFlushError, self).__init__('{} changes failed: {}'.format(
+            len(errors), '; '.join('{}: {}'.format(e.__class__.__name__, ex) for e, ex in errors)))
+
+
+def _index(elements, element):
+    """
+    Returns the position of the element in the list compared by identity,
+    elements compare equal when their values do.
+    """
+    for i, e in enumerate(elements):
+        if e is element:
+            return i
+    return -1
+
+
+def current_session():
+    """
+    Returns the innermost session active on this thread, if any.
+
+    :rtype: Session or None
+
+    """
+    stack = getattr(_local, 'sessions', None)
+    return stack[-1] if stack else None
+
+
+class Session(object):
+    """
+    Unit of work with an identity map. While a session is active every
+    element loaded from the graph is deserialized into the same instance for
+    as long as the session lives, lookups by eid or vid of loaded elements
+    don't hit the graph, and the elements added, changed or deleted are
+    written at once when the session is flushed.
+
+    with Session() as session:
+        person = Person.get(vid)
+        person.name = 'jon'
+        session.add(Person(name='arya'))
+    # both vertices were saved in one request
+    """
+
+    def __init__(self):
+        self._elements = {}
+        self._vids = {}
+        self._new = []
+        self._deleted = []
+
+    def __enter__(self):
+        if not hasattr(_local, 'sessions'):
+            _local.sessions = []
+        _local.sessions.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        _local.sessions.remove(self)
+        if exc_type is None:
+            self.flush()
+        else:
+            self.rollback()
+        return False
+
+    def __contains__(self, element):
+        return _index(self._new, element) >= 0 or self._elements.get(self._key(element)) is element
+
+    @staticmethod
+    def _key(element):
+        from thunderdome.models import Vertex
+        return ('vertex' if isinstance(element, Vertex) else 'edge', element.eid)
+
+    def identify(self, element):
+        """
+        Adds a loaded element to the identity map.
+
+        :param element: The element
+        :type element: thunderdome.models.Element
+
+        """
+        if element.eid is None:
+            return
+        self._elements[self._key(element)] = element
+        vid = getattr(element, 'vid', None)
+        if vid is not None:
+            self._vids[str(vid)] = element
+
+    def lookup(self, element_type, eid):
+        """
+        Returns the element of the given kind with the given eid, if the
+        session knows it.
+
+        :param element_type: 'vertex' or 'edge'
+        :type element_type: str
+        :param eid: The Titan-specific id
+        :type eid: int
+        :rtype: thunderdome.models.Element or None
+
+        """
+        return self._elements.get((element_type, eid))
+
+    def lookup_vid(self, vid):
+        """
+        Returns the vertex with the given vid, if the session knows it.
+
+        :param vid: The thunderdome assigned UUID
+        :type vid: str
+        :rtype: thunderdome.models.Vertex or None
+
+        """
+        return self._vids.get(str(vid))
+
+    def add(self, element):
+        """
+        Schedules a new element to be created, or an element loaded outside of
+        the session to be tracked.
+
+        :param element: The element
+        :type element: thunderdome.models.Element
+
+        """
+        if element.eid is None:
+            if _index(self._new, element) < 0:
+                self._new.append(element)
+        else:
+            self.identify(element)
+
+    def delete(self, element):
+        """
+        Schedules an element to be deleted.
+
+        :param element: The element
+        :type element: thunderdome.models.Element
+
+        """
+        if element.eid is None:
+            self._discard(self._new, element)
+        elif _index(self._deleted, element) < 0:
+            self._deleted.append(element)
+
+    def expunge(self, element):
+        """
+        Stops tracking an element, its pending changes won't be written.
+
+        :param element: The element
+        :type element: thunderdome.models.Element
+
+        """
+        self._discard(self._new, element)
+        self._discard(self._deleted, element)
+        if element.eid is not None and self._elements.get(self._key(element)) is element:
+            del self._elements[self._key(element)]
+            self._vids.pop(str(getattr(element, 'vid', None)), None)
+
+    @property
+    def dirty(self):
+        """
+        The tracked elements with changed values that aren't scheduled for
+        deletion.
+
+        :rtype: list
+
+        """
+        return [e for e in self._elements.values()
+                if _index(self._deleted, e) < 0 and any(v.changed for v in e._values.values())]
+
+    @property
+    def new(self):
+        return list(self._new)
+
+    @property
+    def deleted(self):
+        return list(self._deleted)
+
+    def flush(self):
+        """
+        Writes the pending creates, updates and deletes, batched into one
+        request. New edges between vertices created in the same flush have to
+        wait for their eids and are sent in a second request. Raises a
+        SessionFlushError if any of the changes failed, the others are still
+        written.
+        """
+        from thunderdome.models import Edge, Vertex
+
+        pending = [e for e in self._new if isinstance(e, Vertex)] + self.dirty
+        new_edges = [e for e in self._new if isinstance(e, Edge)]
+        later = [e for e in new_edges if self._has_unsaved_endpoint(e)]
+        pending += [e for e in new_edges if _index(later, e) < 0]
+
+        errors = []
+        for saves, deletes in [(pending, self._deleted), (later, [])]:
+            if not saves and not deletes:
+                continue
+            with connection.batch():
+                calls = [(e, e.save()) for e in saves] + [(e, e.delete()) for e in deletes]
+            #saves of unchanged elements return without a request
+            for element, result in calls:
+                try:
+                    if isinstance(result, futures.Future):
+                        result.result()
+                except ThunderdomeException as ex:
+                    errors.append((element, ex))
+
+        failed = [e for e, ex in errors]
+        for element in self._deleted[:]:
+            if _index(failed, element) < 0:
+                self.expunge(element)
+        for element in self._new[:]:
+            if _index(failed, element) < 0:
+                self._discard(self._new, element)
+                self.identify(element)
+
+        if errors:
+            raise SessionFlushError(errors)
+
+    commit = flush
+
+    @staticmethod
+    def _discard(elements, element):
+        i = _index(elements, element)
+        if i >= 0:
+            del elements[i]
+
+    @staticmethod
+    def _has_unsaved_endpoint(edge):
+        from thunderdome.models import Vertex
+        return any(isinstance(v, Vertex) and v.eid is None for v in (edge._outV, edge._inV))
+
+    def rollback(self):
+        """
+        Discards the pending creates and deletes, and the identity map.
+        """
+        self._new = []
+        self._deleted = []
+        self.clear()
+
+    def clear(self):
+        """
+        Empties the identity map.
+        """
+        self._elements.clear()
+        self._vids.clear()
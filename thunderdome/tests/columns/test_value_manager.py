@@ -106,3 +106,18 @@ class TestChangedProperty(BaseThunderdomeTestCase):
         vm.value.append(4)
         assert vm.changed
 
+    def test_mutable_values_are_copied_when_read(self):
+        """ Tests that loaded mutable values are only copied once handed out """
+        vm = List.value_manager(None, None, [1,[2]])
+        assert vm._previous_value is vm._value
+        vm.value[1].append(3)
+        assert vm.changed
+        assert vm.previous_value == [1,[2]]
+
+    def test_peeking_does_not_copy(self):
+        """ Tests that peek returns the value without copying the previous one """
+        vm = List.value_manager(None, None, [1,[2]])
+        assert vm.peek() == [1,[2]]
+        assert not vm.changed and not vm.deleted
+        assert vm._previous_value is vm._value
+
@@ -0,0 +1,140 @@
+# Copyright (c) 2012-2013 SHIFT.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import socket
+import threading
+from unittest import TestCase
+
+from thunderdome import connection
+from thunderdome import balancing
+from thunderdome.balancing import LoadBalancer, HealthProbe, LatencyWeightedPolicy
+from thunderdome.connection import Host, ThunderdomeQueryError
+from thunderdome.tests.mocks import MockServerTestCase
+
+
+def closed_port_host():
+    """ Returns a host nothing is listening on """
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return Host('127.0.0.1', port)
+
+
+class TestLoadBalancer(TestCase):
+
+    def setUp(self):
+        self.hosts = [Host('a', 1), Host('b', 2), Host('c', 3)]
+
+    def test_round_robin(self):
+        """ Tests that round robin cycles through every host """
+        lb = LoadBalancer(self.hosts, 'round_robin')
+        chosen = []
+        for i in range(6):
+            state = lb.choose()
+            chosen.append(state.host)
+            lb.finish(state, elapsed=0.01)
+        assert chosen == self.hosts * 2
+
+    def test_least_outstanding(self):
+        """ Tests that the host with the fewest requests in flight is picked """
+        lb = LoadBalancer(self.hosts, 'least_outstanding')
+        s1 = lb.choose()
+        s2 = lb.choose()
+        s3 = lb.choose()
+        lb.finish(s2, elapsed=0.01)
+        assert lb.choose() is s2
+
+    def test_latency_weighted_prefers_fast_hosts(self):
+        """ Tests that faster hosts get proportionally more requests """
+        lb = LoadBalancer(self.hosts[:2], LatencyWeightedPolicy(rand=lambda: 0.5))
+        lb.states[0].latency = 1.0
+        lb.states[1].latency = 0.1
+        assert lb.choose().host == self.hosts[1]
+
+    def test_failed_hosts_are_skipped(self):
+        """ Tests that a host marked down isn't used until its backoff expires """
+        lb = LoadBalancer(self.hosts, retry_backoff=60)
+        state = lb.choose()
+        lb.finish(state, failed=True)
+        for i in range(6):
+            assert lb.choose().host != state.host
+        assert not lb.status()['{}:{}'.format(*state.host)]['up']
+
+    def test_backoff_is_exponential(self):
+        """ Tests that consecutive failures back off further """
+        lb = LoadBalancer(self.hosts[:1], retry_backoff=1, max_retry_backoff=3)
+        state = lb.states[0]
+        retries = []
+        for i in range(4):
+            lb.mark_down(state.host)
+            retries.append(state.retry_at)
+        assert retries[1] - retries[0] > 0.9
+        assert retries[3] - retries[2] < 0.1
+
+    def test_all_hosts_down_returns_next_retry(self):
+        """ Tests that a host is still returned when every host is down """
+        lb = LoadBalancer(self.hosts[:2], retry_backoff=60)
+        lb.mark_down(self.hosts[0])
+        lb.mark_down(self.hosts[1])
+        assert lb.choose().host == self.hosts[0]
+
+    def test_probe_brings_hosts_back(self):
+        """ Tests that the health probe marks responsive hosts up """
+        lb = LoadBalancer(self.hosts, retry_backoff=60)
+        lb.mark_down(self.hosts[0])
+        lb.mark_down(self.hosts[1])
+        HealthProbe(lb, lambda host: host == self.hosts[0], 1).probe()
+        assert lb.down_hosts() == [self.hosts[1]]
+
+    def test_probes_are_stopped_at_exit(self):
+        """ Tests that the exit hook stops running probes before shutdown """
+        lb = LoadBalancer(self.hosts)
+        lb.mark_down(self.hosts[0])
+        checked = threading.Event()
+        lb.start_probe(lambda host: checked.set(), 0.01)
+        probe = lb._probe
+        assert checked.wait(1)
+        balancing._stop_probes()
+        assert not probe.is_alive()
+        assert lb._probe is None
+        assert lb not in balancing._probing
+
+
+class TestExecuteQueryFailover(MockServerTestCase):
+    transport_class = None
+
+    def test_requests_fail_over_to_live_host(self):
+        """ Tests that a host which refuses connections is marked down and skipped """
+        dead = closed_port_host()
+        live = Host(*self.server.server_address)
+        connection._hosts[:] = [dead, live]
+
+        for i in range(4):
+            assert connection.execute_query('x', {'i': i}) == [{'i': i}]
+
+        status = connection.host_status()
+        assert not status['{}:{}'.format(*dead)]['up']
+        assert status[self.server.address]['requests'] == 4
+
+    def test_single_dead_host_raises(self):
+        """ Tests that a socket error is still raised when no host is reachable """
+        connection._hosts[:] = [closed_port_host()]
+        with self.assertRaises(ThunderdomeQueryError):
+            connection.execute_query('x')
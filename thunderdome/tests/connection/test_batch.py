@@ -0,0 +1,87 @@
+# Copyright (c) 2012-2013 SHIFT.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from thunderdome import connection
+from thunderdome.connection import ThunderdomeException, ThunderdomeQueryError
+from thunderdome.futures import Future
+from thunderdome.tests.mocks import MockServerTestCase
+
+
+class TestBatch(MockServerTestCase):
+    transport_class = None
+
+    def setUp(self):
+        super(TestBatch, self).setUp()
+        self.replies = []
+
+    def respond(self, request):
+        return 200, {'results': self.replies.pop(0), 'success': True}
+
+    def test_queries_are_sent_in_one_request(self):
+        """ Tests that queued queries share a round trip and resolve in order """
+        self.replies.append([[True, [1]], [True, [2]], [True, []]])
+        with connection.batch() as b:
+            f1 = connection.execute_query('g.v(eid)', {'eid': 1})
+            f2 = connection.execute_query('g.v(eid)', {'eid': 2})
+            f3 = connection.execute_query('g.V')
+            assert isinstance(f1, Future)
+            assert not f1.done()
+
+        assert len(self.server.requests) == 1
+        assert [f.result() for f in (f1, f2, f3)] == [[1], [2], []]
+        assert b.futures == [f1, f2, f3]
+
+    def test_identical_bodies_are_defined_once(self):
+        """ Tests that repeated queries reuse one closure with renamed params """
+        b = connection.Batch()
+        b.add('g.v(eid)', {'eid': 1})
+        b.add('g.v(eid)', {'eid': 2})
+        script, params = b.compile()
+        assert script.count('g.v(eid)') == 1
+        assert params == {'_td_0_eid': 1, '_td_1_eid': 2}
+        assert '_td_f0(_td_0_eid)' in script
+        assert '_td_f0(_td_1_eid)' in script
+
+    def test_errors_are_isolated(self):
+        """ Tests that a failing query only fails its own future """
+        self.replies.append([[False, 'boom'], [True, [2]]])
+        with connection.batch() as b:
+            f1 = connection.execute_query('x')
+            f2 = connection.execute_query('y')
+
+        with self.assertRaises(ThunderdomeQueryError):
+            f1.result()
+        assert f2.result() == [2]
+
+    def test_exception_in_block_aborts(self):
+        """ Tests that nothing is sent when the block raises """
+        with self.assertRaises(KeyError):
+            with connection.batch():
+                f1 = connection.execute_query('x')
+                raise KeyError('x')
+
+        assert self.server.requests == []
+        with self.assertRaises(ThunderdomeException):
+            f1.result()
+
+    def test_unbatchable_queries_run_immediately(self):
+        self.replies.append([5])
+        with connection.batch() as b:
+            assert connection.execute_query('x', batchable=False) == [5]
+        assert len(b) == 0
@@ -0,0 +1,132 @@
+# Copyright (c) 2012-2013 SHIFT.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import threading
+import time
+from unittest import TestCase
+
+from thunderdome import connection
+from thunderdome.connection import Host
+from thunderdome.pool import ConnectionPool, PoolTimeoutError
+from thunderdome.tests.mocks import MockServerTestCase
+
+
+class FakeConnection(object):
+    def __init__(self, host):
+        self.host = host
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class TestConnectionPool(TestCase):
+
+    def setUp(self):
+        self.host = Host('localhost', 8182)
+
+    def make_pool(self, **kwargs):
+        return ConnectionPool(self.host, factory=FakeConnection, health_check=None, **kwargs)
+
+    def test_connections_are_reused(self):
+        """ Tests that a released connection is handed out again """
+        pool = self.make_pool(size=2)
+        c1 = pool.acquire()
+        pool.release(c1)
+        c2 = pool.acquire()
+        assert c1 is c2
+        assert c2.uses == 2
+        assert pool.stats()['created'] == 1
+
+    def test_pool_size_is_enforced(self):
+        """ Tests that acquiring from an exhausted pool times out """
+        pool = self.make_pool(size=1, timeout=0.05)
+        pool.acquire()
+        with self.assertRaises(PoolTimeoutError):
+            pool.acquire()
+
+    def test_waiters_are_woken_on_release(self):
+        """ Tests that a blocked acquire gets the connection that is released """
+        pool = self.make_pool(size=1, timeout=5)
+        c1 = pool.acquire()
+        acquired = []
+
+        t = threading.Thread(target=lambda: acquired.append(pool.acquire()))
+        t.start()
+        time.sleep(0.05)
+        pool.release(c1)
+        t.join(1)
+
+        assert acquired == [c1]
+        stats = pool.stats()
+        assert stats['waits'] == 1
+        assert stats['max_wait_time'] > 0
+
+    def test_idle_connections_expire(self):
+        """ Tests that connections idle longer than idle_timeout are closed """
+        pool = self.make_pool(idle_timeout=0)
+        c1 = pool.acquire()
+        pool.release(c1)
+        time.sleep(0.01)
+        c2 = pool.acquire()
+        assert c1 is not c2
+        assert c1.conn.closed
+
+    def test_connections_are_recycled_after_max_lifetime(self):
+        """ Tests that old connections are closed when released """
+        pool = self.make_pool(max_lifetime=0)
+        c1 = pool.acquire()
+        time.sleep(0.01)
+        pool.release(c1)
+        assert c1.conn.closed
+        assert pool.stats()['idle'] == 0
+
+    def test_failed_health_check_replaces_connection(self):
+        """ Tests that unhealthy idle connections are replaced """
+        pool = ConnectionPool(self.host, factory=FakeConnection, health_check=lambda c: False)
+        c1 = pool.acquire()
+        pool.release(c1)
+        c2 = pool.acquire()
+        assert c1 is not c2
+        assert c1.conn.closed
+
+    def test_discarded_connections_free_capacity(self):
+        """ Tests that discarding a connection lets a new one be created """
+        pool = self.make_pool(size=1, timeout=0.05)
+        with self.assertRaises(ValueError):
+            with pool.connection():
+                raise ValueError
+        with pool.connection() as c:
+            assert not c.conn.closed
+        assert pool.stats()['discarded'] == 1
+
+
+class TestExecuteQueryPooling(MockServerTestCase):
+    transport_class = None
+
+    def test_keep_alive_connection_is_reused(self):
+        """ Tests that consecutive queries share one http connection """
+        for i in range(5):
+            assert connection.execute_query('x', {'i': i}) == [{'i': i}]
+        assert self.server.connections == 1
+
+        stats = connection.pool_stats()[self.server.address]
+        assert stats['in_use'] == 0
+        assert stats['idle'] == 1
+        assert stats['acquired'] == 5
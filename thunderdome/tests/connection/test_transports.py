@@ -0,0 +1,292 @@
+# Copyright (c) 2012-2013 SHIFT.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import json
+import socket
+from StringIO import StringIO
+from unittest import TestCase
+
+from thunderdome import connection
+from thunderdome import transports
+from thunderdome.connection import Host, ThunderdomeQueryError
+from thunderdome.gremlin import GremlinMethod, GremlinValue, ThunderdomeGremlinException
+from thunderdome.models import Vertex
+from thunderdome.tests.mocks import MockRexProServer, MockServerTestCase
+
+
+class TestRexProFraming(TestCase):
+
+    def test_message_round_trip(self):
+        """ Tests that framed messages are read back intact """
+        a, b = socket.socketpair()
+        try:
+            a.sendall(transports.pack_rexpro_message(transports.REXPRO_SCRIPT_REQUEST, ['x', {'k': 1}]))
+            message_type, body = transports.read_rexpro_message(b)
+        finally:
+            a.close()
+            b.close()
+        assert message_type == transports.REXPRO_SCRIPT_REQUEST
+        assert list(body) == ['x', {'k': 1}]
+
+    def test_element_properties_are_flattened(self):
+        """ Tests that RexPro element properties are hoisted like the json api """
+        element = {'_id': 1, '_type': 'vertex', '_properties': {'name': 'jon', 'vid': 'abc'}}
+        assert transports.flatten_rexpro_element([element]) == [
+            {'_id': 1, '_type': 'vertex', 'name': 'jon', 'vid': 'abc'}]
+
+    def test_unknown_transport(self):
+        with self.assertRaises(ValueError):
+            transports.get_transport('carrier_pigeon')
+
+
+class TestRexProTransport(MockServerTestCase):
+    server_class = MockRexProServer
+    transport_class = transports.RexProTransport
+    transport_options = {'timeout': 5}
+
+    def test_query_round_trip(self):
+        """ Tests that scripts and params are sent and results returned """
+        assert connection.execute_query('x', {'a': 1}) == [{'a': 1}]
+        message_type, body = self.server.requests[-1]
+        assert message_type == transports.REXPRO_SCRIPT_REQUEST
+        assert body[4] == "g.stopTransaction(FAILURE)\nx"
+
+    def test_bindings_do_not_leak_between_scripts(self):
+        """ Tests that params of the previous script are reset when not passed again """
+        assert connection.execute_query('x', {'a': 1, 'b': 2}) == [{'a': 1, 'b': 2}]
+        assert connection.execute_query('x', {'a': 3}) == [{'a': 3, 'b': None}]
+        assert connection.execute_query('x', {'a': 4}) == [{'a': 4}]
+
+    def test_session_is_reused(self):
+        """ Tests that every query on a connection runs in the same session """
+        def respond(session, script, bindings):
+            session['calls'] = session.get('calls', 0) + 1
+            return transports.REXPRO_SCRIPT_RESPONSE, session['calls']
+
+        self.server.respond = respond
+        results = [connection.execute_query('x')[0] for i in range(3)]
+        assert results == [1, 2, 3]
+        assert len(self.server.sessions) == 1
+        assert self.server.connections == 1
+
+    def test_errors_are_raised(self):
+        """ Tests that RexPro error responses raise query errors """
+        self.server.respond = lambda session, script, bindings: (transports.REXPRO_ERROR, 'boom')
+        with self.assertRaises(ThunderdomeQueryError):
+            connection.execute_query('x')
+
+    def test_new_session_after_server_drops_connection(self):
+        """ Tests that a dropped connection is replaced with a new session """
+        connection.execute_query('x')
+        pool = connection._transport.get_pool(connection._hosts[0])
+        pool._idle[0].conn.sock.shutdown(socket.SHUT_RDWR)
+        connection.execute_query('x')
+        assert len(self.server.sessions) == 2
+
+    def test_sessions_are_ended_on_close(self):
+        """ Tests that closing a connection ends its server side session """
+        connection.execute_query('x')
+        assert len(self.server.sessions) == 1
+        connection._transport.close()
+        message_type, body = self.server.requests[-1]
+        assert message_type == transports.REXPRO_SESSION_REQUEST
+        assert body[2]['killSession']
+        assert self.server.sessions == {}
+
+
+class TestRegisteredFunctions(MockServerTestCase):
+    server_class = MockRexProServer
+    transport_class = transports.RexProTransport
+    transport_options = {'timeout': 5}
+
+    def setUp(self):
+        super(TestRegisteredFunctions, self).setUp()
+        connection._register_functions = True
+        self.definition = transports.define_function('_td_f', ['a'], 'a + 1')
+
+    def tearDown(self):
+        connection._register_functions = False
+        super(TestRegisteredFunctions, self).tearDown()
+
+    def respond(self, session, script, bindings):
+        """ Pretends to run scripts defining and calling _td_f """
+        if '_td_f = {' in script:
+            session['defined'] = True
+        if not session.get('defined'):
+            return transports.REXPRO_ERROR, 'No such property: _td_f for class: Script3'
+        return transports.REXPRO_SCRIPT_RESPONSE, bindings['a'] + 1
+
+    def scripts(self):
+        return [body[4] for message_type, body in self.server.requests
+                if message_type == transports.REXPRO_SCRIPT_REQUEST]
+
+    def test_functions_are_defined_once_per_session(self):
+        """ Tests that only the first call on a session carries the definition """
+        for i in range(3):
+            assert connection.execute_query('_td_f(a)', {'a': i}, functions=[('_td_f', self.definition)]) == [i + 1]
+        scripts = self.scripts()
+        assert self.definition in scripts[0]
+        assert all(self.definition not in s for s in scripts[1:])
+
+    def test_lost_functions_are_defined_again(self):
+        """ Tests that a session which forgot a function gets it re-sent """
+        connection.execute_query('_td_f(a)', {'a': 1}, functions=[('_td_f', self.definition)])
+        for session in self.server.sessions.values():
+            session.clear()
+        assert connection.execute_query('_td_f(a)', {'a': 2}, functions=[('_td_f', self.definition)]) == [3]
+        assert self.definition in self.scripts()[-1]
+
+    def test_lost_functions_are_defined_again_once(self):
+        """ Tests that a session still missing the function after a re-send fails """
+        connection.execute_query('_td_f(a)', {'a': 1}, functions=[('_td_f', self.definition)])
+        self.server.respond = lambda session, script, bindings: (
+            transports.REXPRO_ERROR, 'No signature of method: Script7._td_f() is applicable for argument types')
+        with self.assertRaises(ThunderdomeQueryError):
+            connection.execute_query('_td_f(a)', {'a': 2}, functions=[('_td_f', self.definition)])
+        assert len(self.scripts()) == 3
+        assert self.definition in self.scripts()[-1]
+
+    def test_unrelated_errors_are_not_retried(self):
+        """ Tests that an error merely mentioning a function doesn't re-run the script """
+        connection.execute_query('_td_f(a)', {'a': 1}, functions=[('_td_f', self.definition)])
+        self.server.respond = lambda session, script, bindings: (
+            transports.REXPRO_ERROR, 'java.lang.ArithmeticException: Division by zero in _td_f')
+        with self.assertRaises(ThunderdomeQueryError):
+            connection.execute_query('_td_f(a)', {'a': 2}, functions=[('_td_f', self.definition)])
+        assert len(self.scripts()) == 2
+
+    def test_gremlin_methods_are_called_by_name(self):
+        """ Tests that gremlin methods send a call rather than their body """
+        self.server.respond = lambda session, script, bindings: (transports.REXPRO_SCRIPT_RESPONSE, [])
+        method = GremlinMethod(method_name='_delete_related', classmethod=True)
+        method.configure_method(Vertex, 'delete_related', None)
+
+        method(None, 1, 'outE', [])
+        method(None, 2, 'outE', [])
+        first, second = self.scripts()
+        assert method.function_registration[1] in first
+        assert second.endswith('{}(eid, operation, labels)'.format(method.function_name))
+
+
+class TestJSONResultsParser(TestCase):
+
+    def parse(self, body, chunk_size):
+        parser = transports.JSONResultsParser(StringIO(body).read, chunk_size=chunk_size)
+        return list(parser), parser.members
+
+    def test_results_match_json_module(self):
+        """ Tests that results are parsed the same whatever the chunk size """
+        response = {'version': '2.3', 'results': [
+            {'_id': 1, 'name': 'a "quoted" \\ name, [with] {brackets}'},
+            [1, 2.5, None, True],
+            u'\u00e9t\u00e9',
+            {'nested': {'list': [{}, []]}},
+        ], 'success': True, 'queryTime': 1.5}
+        body = json.dumps(response)
+        for chunk_size in (1, 2, 3, 7, 64, 16384):
+            results, members = self.parse(body, chunk_size)
+            assert results == response['results'], chunk_size
+            assert members['success'] is True
+            assert members['queryTime'] == 1.5
+
+    def test_empty_and_null_results(self):
+        assert self.parse('{"results": [], "success": true}', 4)[0] == []
+        assert self.parse('{"results": null, "success": true}', 4)[0] == []
+        assert self.parse('{"results": 5}', 4)[0] == [5]
+
+    def test_truncated_response(self):
+        with self.assertRaises(ValueError):
+            self.parse('{"results": [1, 2, {"a"', 4)
+
+
+class TestHTTPStreaming(MockServerTestCase):
+
+    def respond(self, request):
+        return 200, {'results': [{'i': i} for i in range(request['params']['n'])], 'success': True}
+
+    def stats(self):
+        return connection.pool_stats()[self.server.address]
+
+    def test_results_are_streamed(self):
+        """ Tests that a cursor yields every result and releases its connection """
+        cursor = connection.execute_query('x', {'n': 50}, stream=True)
+        assert isinstance(cursor, connection.Cursor)
+        assert self.stats()['in_use'] == 1
+        assert [r['i'] for r in cursor] == range(50)
+        assert self.stats()['in_use'] == 0
+
+        #the connection was kept alive
+        assert list(connection.execute_query('x', {'n': 2}, stream=True)) == [{'i': 0}, {'i': 1}]
+        assert self.server.connections == 1
+
+    def test_closed_cursors_discard_their_connection(self):
+        """ Tests that a partially read response doesn't leak into the next query """
+        with connection.execute_query('x', {'n': 1000}, stream=True) as cursor:
+            assert next(cursor) == {'i': 0}
+        stats = self.stats()
+        assert stats['in_use'] == 0
+        assert stats['discarded'] == 1
+        assert connection.execute_query('x', {'n': 1}) == [{'i': 0}]
+
+    def test_map(self):
+        cursor = connection.execute_query('x', {'n': 3}, stream=True).map(lambda r: r['i'] * 2)
+        assert list(cursor) == [0, 2, 4]
+
+    def test_errors_are_raised(self):
+        """ Tests that error responses raise before a cursor is returned """
+        self.server.respond = lambda request: (500, {'message': 'boom', 'success': False})
+        with self.assertRaises(ThunderdomeQueryError):
+            connection.execute_query('x', stream=True)
+        assert self.stats()['in_use'] == 0
+
+    def test_streams_are_not_batched(self):
+        """ Tests that streamed queries run immediately inside a batch """
+        with connection.batch():
+            cursor = connection.execute_query('x', {'n': 2}, stream=True)
+            assert isinstance(cursor, connection.Cursor)
+            assert len(list(cursor)) == 2
+
+    def test_gremlin_methods_stream(self):
+        """ Tests that gremlin methods can return cursors """
+        self.server.respond = lambda request: (200, {'results': [{'a': [1]}, 2], 'success': True})
+        method = GremlinMethod(method_name='_delete_related', classmethod=True, stream=True)
+        method.configure_method(Vertex, 'delete_related', None)
+        cursor = method(None, 1, 'outE', [])
+        assert isinstance(cursor, connection.Cursor)
+        assert list(cursor) == [{'a': [1]}, 2]
+
+        method = GremlinMethod(method_name='_delete_related', classmethod=True)
+        method.configure_method(Vertex, 'delete_related', None)
+        assert list(method.iterate(None, 1, 'outE', [])) == [{'a': [1]}, 2]
+
+        with self.assertRaises(ThunderdomeGremlinException):
+            GremlinValue(stream=True)
+
+    def test_rexpro_streams_read_results(self):
+        """ Tests that transports without incremental parsing still return cursors """
+        server = MockRexProServer(lambda session, script, bindings: (transports.REXPRO_SCRIPT_RESPONSE, [1, 2])).start()
+        transport = transports.RexProTransport(timeout=5)
+        transport.configure('thunderdome')
+        try:
+            status, response = transport.stream(Host(*server.server_address), 'x', {})
+            assert status == 200
+            assert list(response['results']) == [1, 2]
+        finally:
+            transport.close()
+            server.stop()
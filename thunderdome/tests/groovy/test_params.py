@@ -0,0 +1,142 @@
+# Copyright (c) 2012-2013 SHIFT.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from collections import OrderedDict
+from datetime import datetime
+from decimal import Decimal
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from uuid import uuid4
+
+from thunderdome import gremlin
+from thunderdome.gremlin import encode_param, register_param_encoder, groovy_function, GremlinMethod
+from thunderdome.gremlin import ThunderdomeGremlinException
+from thunderdome.properties import DateTime
+from thunderdome.tests.models import TestModel, TestEdge
+
+
+class Point(object):
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+class Point3D(Point):
+    pass
+
+
+class TestParamEncoding(TestCase):
+
+    def setUp(self):
+        self._param_encoders = gremlin._param_encoders.copy()
+        self._resolved_encoders = gremlin._resolved_encoders.copy()
+
+    def tearDown(self):
+        #encoders registered by the tests are global, put the tables back
+        gremlin._param_encoders.clear()
+        gremlin._param_encoders.update(self._param_encoders)
+        gremlin._resolved_encoders.clear()
+        gremlin._resolved_encoders.update(self._resolved_encoders)
+
+    def test_values_are_encoded(self):
+        """ Tests that elements, classes and column types are translated recursively """
+        v = TestModel()
+        v.eid = 5
+        now = datetime(2013, 5, 1, 12, 30)
+        vid = uuid4()
+        params = {'v': v, 'vertex_type': TestModel, 'label': TestEdge,
+                  'nested': OrderedDict([('at', [now, Decimal('1.5')])]), 'vid': vid}
+        assert encode_param(params) == {
+            'v': 5,
+            'vertex_type': TestModel.element_type,
+            'label': TestEdge.label,
+            'nested': {'at': [DateTime().to_database(now), '1.5']},
+            'vid': str(vid),
+        }
+
+    def test_primitive_lists_are_not_copied(self):
+        eids = [1, 2L, 3.5, 'a', u'b', None, True]
+        assert encode_param(eids) is eids
+        assert encode_param([1, uuid4()]) is not eids
+
+    def test_registered_types(self):
+        """ Tests that registered encoders apply to subclasses """
+        assert isinstance(encode_param(Point(1, 2)), Point)
+        register_param_encoder(Point, lambda p: [p.x, p.y])
+        assert encode_param({'p': [Point3D(1, 2)]}) == {'p': [[1, 2]]}
+        assert encode_param([3, Point(1, 2)]) == [3, [1, 2]]
+
+
+def configured(path, name, **kwargs):
+    method = GremlinMethod(method_name=name, **kwargs)
+    method.configure_method(TestModel, name, path)
+    method._setup()
+    return method
+
+
+class TestArgumentBinding(TestCase):
+
+    def setUp(self):
+        self.path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'groovy_test_model.groovy')
+        self.vertex = TestModel()
+        self.vertex.eid = 7
+
+    def test_arguments_are_bound(self):
+        """ Tests that positional, keyword and default arguments map onto the params """
+        method = configured(self.path, 'return_value', defaults={'val': lambda: 5000})
+        assert method.bind_arguments.__name__ == 'return_value'
+        assert method._build_params(self.vertex, (), {}) == {'eid': 7, 'val': 5000}
+        assert method._build_params(self.vertex, (1,), {}) == {'eid': 7, 'val': 1}
+        assert method._build_params(self.vertex, (), {'val': 2}) == {'eid': 7, 'val': 2}
+
+        method = configured(self.path, 'second_method', classmethod=True)
+        assert method._build_params(None, (1,), {'a3': 3}) == {'a1': 1, 'a3': 3}
+
+    def test_binding_errors(self):
+        method = configured(self.path, 'first_method', classmethod=True)
+        with self.assertRaises(TypeError):
+            method._build_params(None, (1, 2, 3), {})
+        with self.assertRaises(TypeError):
+            method._build_params(None, (1,), {'a1': 2})
+        with self.assertRaises(TypeError):
+            method._build_params(None, (), {'a4': 2})
+
+    def test_required_functions(self):
+        """ Tests that the groovy functions a method calls are defined under their own name """
+        method = configured(self.path, 'return_value', requires=['second_method'])
+        assert method.required_functions == [groovy_function(self.path, 'second_method')]
+        assert method.required_functions[0][1].startswith('second_method = {')
+        with self.assertRaises(ThunderdomeGremlinException):
+            configured(self.path, 'first_method', requires=['missing'])
+
+    def test_keyword_arguments_fall_back(self):
+        """ Tests that groovy arguments named like python keywords still bind """
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'keywords.groovy')
+            with open(path, 'w') as f:
+                f.write('def between(from, to) {\n    return [from, to]\n}\n')
+            method = configured(path, 'between', classmethod=True)
+            assert method._build_params(None, (1,), {'to': 2}) == {'from': 1, 'to': 2}
+            with self.assertRaises(TypeError):
+                method._build_params(None, (1,), {'from': 2})
+        finally:
+            shutil.rmtree(directory)
@@ -18,9 +18,13 @@
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 import os
+import shutil
+import tempfile
 
 from unittest import TestCase
+from thunderdome import groovy
 from thunderdome.gremlin import parse
+from thunderdome.groovy import scan, GroovyModule, GroovyParseError
 
 class GroovyScannerTest(TestCase):
     """
@@ -36,3 +40,93 @@ class GroovyScannerTest(TestCase):
         assert 'get_self' in result_map
         assert 'return_value' in result_map
         assert 'long_func' in result_map
+
+    def test_functions_are_indexed_by_name(self):
+        groovy_file = os.path.join(os.path.dirname(__file__), 'groovy_test_model.groovy')
+        result = parse(groovy_file)
+        assert 'long_func' in result
+        assert result.get('long_func') is result[6]
+        assert result.get('missing') is None
+
+    def test_nested_braces_strings_and_comments(self):
+        """ Tests that braces in closures, strings and comments don't end functions """
+        functions = scan('''
+def first(a, b) {
+    // a comment with a } brace
+    c = [1, 2].collect{ it -> if (it) { "}" } else { '{' } }
+    /* } */
+}
+
+def second() { return """
+}""" }
+''')
+        assert [(f.name, f.args) for f in functions] == [('first', ['a', 'b']), ('second', [])]
+        assert functions[0].body.startswith('// a comment')
+        assert functions[0].body.endswith('/* } */')
+        assert functions[1].defn.startswith('def second()')
+
+    def test_invalid_files(self):
+        with self.assertRaises(GroovyParseError):
+            scan('def f(a) {\n    if (a) {\n}\n')
+        with self.assertRaises(GroovyParseError):
+            scan('def f(a) {}\n}')
+        with self.assertRaises(GroovyParseError):
+            GroovyModule('x.groovy', scan('def f(a) {}\ndef f(b) {}'))
+
+
+class ParsedFileCacheTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'functions.groovy')
+        self.write('def first(a) {\n    a\n}\n', 1000)
+        groovy.configure_cache(os.path.join(self.directory, 'cache'))
+        self.scans = []
+        self._scan = groovy.scan
+        groovy.scan = lambda data, path: self.scans.append(path) or self._scan(data, path)
+
+    def tearDown(self):
+        groovy.scan = self._scan
+        groovy.configure_cache(None)
+        groovy._parsed_file_cache.pop(self.path, None)
+        shutil.rmtree(self.directory)
+
+    def write(self, data, mtime):
+        with open(self.path, 'w') as f:
+            f.write(data)
+        os.utime(self.path, (mtime, mtime))
+
+    def reparse(self):
+        """ Parses the file as a new process would """
+        groovy._parsed_file_cache.pop(self.path, None)
+        return parse(self.path)
+
+    def test_parsed_files_are_cached_on_disk(self):
+        assert self.reparse().get('first').args == ['a']
+        assert len(self.scans) == 1
+        module = self.reparse()
+        assert len(self.scans) == 1
+        assert module.get('first') == ('first', ['a'], 'a', 'def first(a) {\n    a\n}')
+        assert isinstance(module.get('first').body, str)
+
+    def test_changed_files_are_parsed_again(self):
+        """ Tests that edits are noticed in process and on disk """
+        parse(self.path)
+        self.write('def second(b) {\n    b\n}\n', 2000)
+        assert 'second' in parse(self.path)
+        assert len(self.scans) == 2
+        assert 'second' in self.reparse()
+        assert len(self.scans) == 2
+
+    def test_touched_files_are_matched_by_content(self):
+        parse(self.path)
+        os.utime(self.path, (3000, 3000))
+        assert 'first' in parse(self.path)
+        assert len(self.scans) == 1
+
+    def test_unreadable_entries_are_ignored(self):
+        parse(self.path)
+        with open(groovy._cache_path(self.path), 'w') as f:
+            f.write('{not json')
+        assert 'first' in self.reparse()
+        assert len(self.scans) == 2
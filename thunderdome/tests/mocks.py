@@ -0,0 +1,199 @@
+# Copyright (c) 2012-2013 SHIFT.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+import json
+from SocketServer import BaseRequestHandler, TCPServer, ThreadingMixIn
+import threading
+from unittest import TestCase
+import uuid
+
+from thunderdome import connection
+from thunderdome import transports
+
+
+class _RexsterHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        length = int(self.headers.getheader('content-length', 0))
+        request = json.loads(self.rfile.read(length))
+        with self.server.lock:
+            self.server.requests.append(request)
+        status, body = self.server.respond(request)
+        body = json.dumps(body)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class MockRexsterServer(ThreadingMixIn, HTTPServer):
+    """
+    Local stand-in for the Rexster gremlin extension. Every request is
+    answered by `respond`, which by default echoes the request params back as
+    the results.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, respond=None):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), _RexsterHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = []
+        if respond is not None:
+            self.respond = respond
+        self._thread = None
+
+    @property
+    def address(self):
+        return '{}:{}'.format(*self.server_address)
+
+    def respond(self, request):
+        return 200, {'results': [request.get('params')], 'success': True}
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _RexProHandler(BaseRequestHandler):
+
+    def handle(self):
+        with self.server.lock:
+            self.server.connections += 1
+        while True:
+            try:
+                message_type, body = transports.read_rexpro_message(self.request)
+            except transports.ConnectionClosedError:
+                return
+            body = list(body)
+            with self.server.lock:
+                self.server.requests.append((message_type, body))
+
+            if message_type == transports.REXPRO_SESSION_REQUEST and body[2].get('killSession'):
+                with self.server.lock:
+                    self.server.sessions.pop(body[0], None)
+                reply = (transports.REXPRO_SESSION_RESPONSE, [transports.REXPRO_EMPTY_SESSION, body[1], {}, []])
+            elif message_type == transports.REXPRO_SESSION_REQUEST:
+                session = uuid.uuid4().bytes
+                with self.server.lock:
+                    self.server.sessions[session] = {}
+                reply = (transports.REXPRO_SESSION_RESPONSE, [session, body[1], {}, ['groovy']])
+            elif message_type == transports.REXPRO_SCRIPT_REQUEST:
+                session, request, meta, language, script, bindings = body
+                if session not in self.server.sessions:
+                    reply = (transports.REXPRO_ERROR, [session, request, {'flag': 0}, 'The session is not valid'])
+                else:
+                    reply = self.server.respond(self.server.sessions[session], script, dict(bindings))
+                    if reply[0] != transports.REXPRO_ERROR:
+                        reply = (reply[0], [session, request, {}, reply[1], {}])
+                    else:
+                        reply = (reply[0], [session, request, {'flag': 0}, reply[1]])
+            else:
+                reply = (transports.REXPRO_ERROR, [body[0], body[1], {'flag': 0}, 'unsupported message'])
+            self.request.sendall(transports.pack_rexpro_message(*reply))
+
+
+class MockRexProServer(ThreadingMixIn, TCPServer):
+    """
+    Local stand-in for a RexPro server. Sessions are kept as dicts, every
+    script request is answered by `respond`, which by default echoes the
+    bindings back as the results.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, respond=None):
+        TCPServer.__init__(self, ('127.0.0.1', 0), _RexProHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = []
+        self.sessions = {}
+        if respond is not None:
+            self.respond = respond
+        self._thread = None
+
+    @property
+    def address(self):
+        return '{}:{}'.format(*self.server_address)
+
+    def respond(self, session, script, bindings):
+        """
+        Returns a tuple of the reply message type and its results, or error
+        message for REXPRO_ERROR.
+        """
+        return transports.REXPRO_SCRIPT_RESPONSE, bindings
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class MockServerTestCase(TestCase):
+    """
+    Runs each test against a mock server the connection is pointed at, the
+    configured hosts and transport are restored afterwards. Test cases
+    defining `respond` answer the server's requests with it.
+    """
+    server_class = MockRexsterServer
+
+    #None leaves the transport to be created on first use
+    transport_class = transports.HTTPTransport
+    transport_options = {}
+
+    def setUp(self):
+        super(MockServerTestCase, self).setUp()
+        self.server = self.server_class(getattr(self, 'respond', None)).start()
+        self._hosts = connection._hosts[:]
+        connection._hosts[:] = [connection.Host(*self.server.server_address)]
+        self._transport = connection._transport
+        connection._transport = None
+        if self.transport_class is not None:
+            connection._transport = self.transport_class(**self.transport_options)
+            connection._transport.configure('thunderdome')
+
+    def tearDown(self):
+        connection._get_transport().close()
+        connection._transport = self._transport
+        connection._hosts[:] = self._hosts
+        self.server.stop()
+        super(MockServerTestCase, self).tearDown()
@@ -17,10 +17,13 @@
 # IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+from unittest import TestCase
+from uuid import uuid4
+
 from thunderdome.tests.base import BaseThunderdomeTestCase
 
 from thunderdome.exceptions import ModelException, ThunderdomeException
-from thunderdome.models import Vertex, Edge
+from thunderdome.models import Element, Vertex, Edge
 from thunderdome import properties, ValidationError
 import thunderdome
 
@@ -155,3 +158,90 @@ class TestValidation(BaseThunderdomeTestCase):
 
 
 
+
+
+class CustomInitVertex(Vertex):
+    num = properties.Integer()
+
+    def __init__(self, **values):
+        super(CustomInitVertex, self).__init__(**values)
+        self.initialized = True
+
+class CustomInitChild(CustomInitVertex): pass
+
+class TestDeserializationPlan(TestCase):
+
+    def test_plan_matches_constructor(self):
+        """ Tests that elements built from the plan equal constructed ones """
+        data = {'_id': 3, '_type': 'vertex', 'element_type': WildDBNames.get_element_type(),
+                'vid': str(uuid4()), 'words_and_whatnot': 'hi', 'integers_etc': 5}
+        loaded = Element.deserialize(data)
+        assert isinstance(loaded, WildDBNames)
+        assert loaded == WildDBNames(**WildDBNames.translate_db_fields(data))
+        assert loaded.content == 'hi'
+        assert loaded.eid == 3
+        assert not loaded._values['numbers'].changed
+
+    def test_custom_init_is_honored(self):
+        """ Tests that classes overriding __init__ are still built through it """
+        for klass in (CustomInitVertex, CustomInitChild):
+            v = klass._from_db({'_id': 1, 'num': 2})
+            assert v.initialized
+            assert v.num == 2
+        assert not Stuff._custom_init
+
+
+class CompactVertex(Vertex):
+    __compact__ = True
+
+    num = properties.Integer()
+    tags = properties.List()
+
+class CompactChild(CompactVertex):
+    text = properties.Text()
+
+class TestCompactElements(TestCase):
+
+    def test_instances_have_no_dict(self):
+        """ Tests that compact elements are slot based """
+        v = CompactChild(num=1, text='a')
+        assert not hasattr(v, '__dict__')
+        with self.assertRaises(AttributeError):
+            v.something_else = 1
+        assert v.num == 1 and v.text == 'a'
+
+    def test_change_tracking(self):
+        """ Tests that compact values keep the value manager semantics """
+        v = CompactVertex._from_db({'_id': 1, 'vid': str(uuid4()), 'num': 1, 'tags': ['a']})
+        assert not any(val.changed for val in v._values.values())
+        v.num = 2
+        v.tags.append('b')
+        assert v._values['num'].changed
+        assert v._values['tags'].changed
+        assert v._values['tags'].previous_value == ['a']
+
+        del v.num
+        assert v._values['num'].deleted
+        v._values['num'].previous_value = None
+        assert not v._values['num'].changed
+
+    def test_mutable_values_are_copied_when_read(self):
+        """ Tests that loaded mutable values are only copied once handed out """
+        v = CompactVertex._from_db({'_id': 1, 'vid': str(uuid4()), 'num': 1, 'tags': ['a']})
+        index = CompactVertex._column_index['tags']
+        assert v._original[index] is v._current[index]
+        v.tags.append('b')
+        assert v._original[index] == ['a']
+
+    def test_saving_does_not_copy_mutable_values(self):
+        """ Tests that validation and save params leave loaded values uncopied """
+        v = CompactVertex._from_db({'_id': 1, 'vid': str(uuid4()), 'num': 1, 'tags': ['a']})
+        index = CompactVertex._column_index['tags']
+        v.validate()
+        v.as_save_params()
+        assert v._original[index] is v._current[index]
+
+    def test_columns_are_shared_with_subclasses(self):
+        v = CompactChild(num=1, text='a')
+        assert [k for k, val in v._values.items()] == CompactChild._columns.keys()
+        assert v.as_dict()['text'] == 'a'
@@ -18,8 +18,15 @@
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 from unittest import skip
+from uuid import UUID
 
+from thunderdome import connection
+from thunderdome.exceptions import ThunderdomeException
+from thunderdome.futures import Future
+from thunderdome.models import prefetch_vertices
+from thunderdome.session import Session
 from thunderdome.tests.base import BaseThunderdomeTestCase
+from thunderdome.tests.mocks import MockServerTestCase
 from thunderdome.tests.models import TestModel, TestEdge
 
 
@@ -73,3 +80,117 @@ class TestEdgeIO(BaseThunderdomeTestCase):
         e1.reload()
         assert e1.numbers == 5
 
+
+    def test_create_many(self):
+        """ Tests that edges are created in bulk with any kind of endpoint """
+        v3 = TestModel.create(count=6, text='c')
+        edges = TestEdge.create_many([
+            (self.v1, self.v2, {'numbers': 1}),
+            (self.v1.eid, v3.vid, {'numbers': 2}),
+            (v3.vid, self.v2),
+        ], chunk_size=2)
+
+        assert all(e.eid is not None for e in edges)
+        assert edges[1].inV().vid == v3.vid
+        assert edges[2].outV().vid == v3.vid
+        assert sorted(e.numbers for e in self.v1.outE()) == [1, 2]
+
+    def test_create_many_exclusive(self):
+        """ Tests that exclusive edges between the same vertices are merged """
+        edges = ExclusiveTestEdge.create_many([
+            (self.v1, self.v2, {'numbers': 1}),
+            (self.v1, self.v2, {'numbers': 2}),
+        ])
+        assert edges[0].eid == edges[1].eid
+        assert [e.numbers for e in self.v1.outE()] == [2]
+
+
+class ExclusiveTestEdge(TestEdge):
+    __exclusive__ = True
+    label = 'exclusive_test_edge'
+
+
+def vertex_data(eid):
+    return {'_id': eid, '_type': 'vertex', 'element_type': TestModel.get_element_type(),
+            'vid': str(UUID(int=eid)), 'count': eid}
+
+
+def edge_data(eid, out_v, in_v):
+    return {'_id': eid, '_type': 'edge', '_label': TestEdge.get_label(),
+            '_outV': out_v, '_inV': in_v, 'numbers': eid}
+
+
+class TestPrefetchVertices(MockServerTestCase):
+
+    def setUp(self):
+        super(TestPrefetchVertices, self).setUp()
+        self.source = TestModel.get_by_eid(1)
+
+    def respond(self, request):
+        """ Answers vertex lookups and outE traversals from vertex 1 """
+        params = request['params']
+        if '_td_0_eid' in params:
+            results = [[True, [vertex_data(params['_td_0_eid'])]]]
+        elif 'eids' in params:
+            results = [vertex_data(eid) if eid < 100 else None for eid in params['eids']]
+        elif 'operation' in params:
+            results = [edge_data(100 + i, 1, 10 + i) for i in range(5)]
+        else:
+            results = [vertex_data(params['eid'])]
+        return 200, {'results': results, 'success': True}
+
+    def test_endpoints_are_loaded_in_one_query(self):
+        """ Tests that the endpoints of many edges are fetched together """
+        edges = self.source.outE()
+        requests = len(self.server.requests)
+        assert prefetch_vertices(edges) is edges
+        assert len(self.server.requests) == requests + 1
+        assert self.server.requests[-1]['params']['eids'] == [1, 10, 11, 12, 13, 14]
+        assert [e.inV().count for e in edges] == [10, 11, 12, 13, 14]
+        assert all(e.outV().eid == 1 for e in edges)
+        assert len(self.server.requests) == requests + 1
+
+    def test_one_direction(self):
+        edges = self.source.outE()
+        prefetch_vertices(edges, 'inV')
+        assert self.server.requests[-1]['params']['eids'] == [10, 11, 12, 13, 14]
+        assert all(isinstance(e._outV, (int, long)) for e in edges)
+        with self.assertRaises(ThunderdomeException):
+            prefetch_vertices(edges, 'sideways')
+
+    def test_missing_vertices_are_left_as_eids(self):
+        edges = [TestEdge._from_db(edge_data(100, 1, 500))]
+        prefetch_vertices(edges)
+        assert edges[0]._inV == 500
+        assert edges[0]._outV.eid == 1
+
+    def test_include_vertices(self):
+        """ Tests that traversed edges come back with both endpoints attached """
+        requests = len(self.server.requests)
+        edges = self.source.outE(include_vertices=True)
+        assert len(self.server.requests) == requests + 2
+        #the traversal source isn't fetched again
+        assert self.server.requests[-1]['params']['eids'] == [10, 11, 12, 13, 14]
+        assert all(e.outV() is self.source for e in edges)
+        assert [e.inV().eid for e in edges] == [10, 11, 12, 13, 14]
+        with self.assertRaises(ThunderdomeException):
+            self.source.outV(include_vertices=True)
+
+    def test_batched_endpoints_are_kept_once_loaded(self):
+        """ Tests that the future of a batched endpoint lookup isn't kept on the edge """
+        edge = TestEdge._from_db(edge_data(100, 1, 10))
+        with connection.batch():
+            vertex = edge.inV()
+            assert isinstance(vertex, Future)
+            assert edge._inV == 10
+        assert isinstance(edge._inV, TestModel)
+        assert edge.inV() is vertex.result()
+        assert edge.inV().count == 10
+
+    def test_session_vertices_are_not_fetched(self):
+        with Session():
+            known = TestModel.get_by_eid(10)
+            edges = self.source.outE()
+            prefetch_vertices(edges, 'inV')
+            assert self.server.requests[-1]['params']['eids'] == [11, 12, 13, 14]
+            assert edges[0].inV() is known
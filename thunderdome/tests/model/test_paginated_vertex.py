@@ -18,14 +18,16 @@
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 from unittest import skip
-from thunderdome import connection 
 from thunderdome.tests.base import BaseThunderdomeTestCase
+from thunderdome.tests.mocks import MockServerTestCase
 
 
 from thunderdome import gremlin
 from thunderdome import models
 from thunderdome.models import Edge, PaginatedVertex
 from thunderdome import properties
+from thunderdome.containers import Page, encode_token, decode_token
+from thunderdome.exceptions import InvalidContinuationToken, ThunderdomeException
 import unittest
 
 
@@ -39,6 +41,10 @@ class TestPEdge(Edge):
     numbers = properties.Integer()
 
 
+class SortedPEdge(Edge):
+    numbers = properties.Integer(primary_key=True, db_field='num')
+
+
 
 class PaginatedVertexTest(unittest.TestCase):
     def test_traversal(self):
@@ -63,3 +69,112 @@ class PaginatedVertexTest(unittest.TestCase):
         # just to be sure
         all_edges = t.outV()
         assert len(all_edges) == 5
+
+    def test_keyset_traversal(self):
+        """ Tests that walking continuation tokens visits every edge once """
+        t = TestPModel.create()
+        t2 = TestPModel.create()
+        for x in range(5):
+            TestPEdge.create(t, t2, numbers=4 - x)
+
+        seen = []
+        page = t.outE(TestPEdge, per_page=2, after=None, sort_key='numbers')
+        pages = 1
+        while page.next_token is not None:
+            seen += page
+            page = t.outE(TestPEdge, per_page=2, after=page.next_token, sort_key='numbers')
+            pages += 1
+        seen += page
+        assert pages == 3
+        assert len(set(e.eid for e in seen)) == 5
+        assert [e.numbers for e in seen] == range(5)
+
+        assert len(t.outV(TestPEdge, per_page=10, after=None, sort_key='numbers')) == 5
+
+    def test_keyset_traversal_of_unordered_edges(self):
+        """ Tests that pages are ordered by sort key whatever order the edges were created in """
+        t = TestPModel.create()
+        t2 = TestPModel.create()
+        for x in [3, 0, 4, 1, 2]:
+            TestPEdge.create(t, t2, numbers=x)
+        #both directions of the traversal are interleaved in sort key order
+        for x in [6, 5]:
+            TestPEdge.create(t2, t, numbers=x)
+        TestPEdge.create(t2, t, numbers=-1)
+
+        seen = []
+        page = t.bothE(TestPEdge, per_page=3, after=None, sort_key='numbers')
+        while page.next_token is not None:
+            seen += page
+            page = t.bothE(TestPEdge, per_page=3, after=page.next_token, sort_key='numbers')
+        seen += page
+        assert [e.numbers for e in seen] == range(-1, 7)
+
+    def test_keyset_get_between(self):
+        t = TestPModel.create()
+        t2 = TestPModel.create()
+        t3 = TestPModel.create()
+        for x in range(3):
+            TestPEdge.create(t, t2, numbers=x)
+        TestPEdge.create(t, t3, numbers=3)
+
+        page = TestPEdge.get_between(t, t2, per_page=2, after=None, sort_key='numbers')
+        assert len(page) == 2
+        page = TestPEdge.get_between(t, t2, per_page=2, after=page.next_token, sort_key='numbers')
+        assert len(page) == 1
+        assert page.next_token is None
+
+
+class TestContinuationTokens(MockServerTestCase):
+
+    def respond(self, request):
+        return 200, {'results': [[], [7, 12]], 'success': True}
+
+    def test_token_round_trip(self):
+        token = encode_token('numbers', [7, 12])
+        assert decode_token(token, 'numbers') == [7, 12]
+        assert decode_token(None, 'numbers') is None
+
+    def test_invalid_tokens(self):
+        with self.assertRaises(InvalidContinuationToken):
+            decode_token('not a token', None)
+        with self.assertRaises(InvalidContinuationToken):
+            decode_token(encode_token('numbers', [7, 12]), None)
+
+    def test_pages_resume_after_the_token(self):
+        """ Tests that the decoded position is sent instead of an offset """
+        v = TestPModel()
+        v.eid = 1
+        page = v.outE(TestPEdge, per_page=2, after=encode_token('numbers', [5, 3]), sort_key='numbers')
+        assert isinstance(page, Page)
+        assert decode_token(page.next_token, 'numbers') == [7, 12]
+
+        params = self.server.requests[-1]['params']
+        assert params['eid'] == 1
+        assert params['after'] == [5, 3]
+        assert params['limit'] == 2
+        assert params['labels'] == [TestPEdge.get_label()]
+        assert params['sorted_labels'] == []
+        assert params['sort_key'] == 'numbers'
+
+    def test_primary_key_labels_are_read_in_order(self):
+        """ Tests that only labels whose primary key is the sort key stop scanning early """
+        v = TestPModel()
+        v.eid = 1
+        v.outE(TestPEdge, SortedPEdge, per_page=2, after=None, sort_key='num')
+        params = self.server.requests[-1]['params']
+        assert params['labels'] == [TestPEdge.get_label(), SortedPEdge.get_label()]
+        assert params['sorted_labels'] == [SortedPEdge.get_label()]
+
+        v.outE(SortedPEdge, per_page=2, after=None, sort_key='numbers')
+        assert self.server.requests[-1]['params']['sorted_labels'] == []
+
+    def test_keyset_pages_need_a_sort_key_and_labels(self):
+        """ Tests that keyset pages can't fall back to scanning every edge """
+        v = TestPModel()
+        v.eid = 1
+        with self.assertRaises(ThunderdomeException):
+            v.outE(TestPEdge, per_page=2, after=None)
+        with self.assertRaises(ThunderdomeException):
+            v.outE(per_page=2, after=None, sort_key='numbers')
+        assert self.server.requests == []
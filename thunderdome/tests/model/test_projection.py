@@ -0,0 +1,172 @@
+# Copyright (c) 2012-2013 SHIFT.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from uuid import UUID
+
+from thunderdome.connection import ThunderdomeQueryError
+from thunderdome.models import Vertex, _project_function
+from thunderdome import properties
+from thunderdome.tests.mocks import MockServerTestCase
+
+
+class ProjectedPerson(Vertex):
+    name = properties.Text()
+    bio = properties.Text()
+    tags = properties.List()
+    nickname = properties.Text(db_field='nick')
+
+
+class CompactProjectedPerson(Vertex):
+    __compact__ = True
+    name = properties.Text()
+    bio = properties.Text()
+
+
+class TestProjection(MockServerTestCase):
+
+    def setUp(self):
+        super(TestProjection, self).setUp()
+        self.klass = ProjectedPerson
+        self.stored = {'name': 'jon', 'bio': 'a' * 100, 'tags': ['x', 'y'], 'nick': 'snow'}
+
+    def element(self, eid):
+        data = {'_id': eid, '_type': 'vertex', 'element_type': self.klass.get_element_type(),
+                'vid': str(UUID(int=eid))}
+        data.update(self.stored)
+        return data
+
+    def project(self, data, only, defer):
+        """ Mirrors the groovy projection closure """
+        projected = {'_id': data['_id'], '_type': data['_type'], '_deferred': defer}
+        keys = only if only is not None else [k for k in data if not k.startswith('_') and k not in defer]
+        for key in keys:
+            projected[key] = data.get(key)
+        return projected
+
+    def respond(self, request):
+        params = request['params']
+        if 'project' not in request['script']:
+            return 200, {'results': [self.element(params['eid'])], 'success': True}
+        data = self.element(UUID(params['vids'][0]).int) if 'vids' in params else self.element(1)
+        return 200, {'results': [self.project(data, params['only'], params['defer'])], 'success': True}
+
+    def test_only_fetches_the_given_keys(self):
+        """ Tests that only the requested keys, the vid and element type are fetched """
+        person = self.klass.get(UUID(int=5), only=['name'])
+        assert set(self.server.requests[-1]['params']['only']) == {'name', 'vid', 'element_type'}
+        assert person.eid == 5
+        assert person.vid == str(UUID(int=5))
+        assert person.name == 'jon'
+        assert len(self.server.requests) == 1
+
+    def test_deferred_fields_are_loaded_on_access(self):
+        """ Tests that reading a deferred field loads all of them in one query """
+        person, = self.klass.all([UUID(int=5)], defer=['bio', 'tags', 'vid'])
+        assert self.server.requests[-1]['params']['defer'] == ['bio', 'tags']
+        assert len(self.server.requests) == 1
+        assert person.bio == 'a' * 100
+        assert person.tags == ['x', 'y']
+        assert len(self.server.requests) == 2
+        assert self.server.requests[-1]['params'] == {'eid': 5}
+
+    def test_unset_fields_fetched_with_only_are_not_deferred(self):
+        """ Tests that an unset key given to only doesn't trigger a query """
+        self.stored['name'] = None
+        person = self.klass.get(UUID(int=5), only=['name'])
+        assert person.name is None
+        assert len(self.server.requests) == 1
+
+    def test_deferred_fields_are_not_saved(self):
+        """ Tests that saving a partial element only sends the fetched fields """
+        person = self.klass.get(UUID(int=5), only=['name'])
+        params = person.as_save_params()
+        assert 'bio' not in params
+        assert 'tags' not in params
+        assert len(self.server.requests) == 1
+
+        person.bio = 'short'
+        assert person.as_save_params()['bio'] == 'short'
+        assert len(self.server.requests) == 1
+
+    def test_traversals_and_queries_send_the_projection(self):
+        """ Tests that traversals and queries pass only/defer to the server """
+        person = self.klass()
+        person.eid = 1
+        result, = person.outV('knows', only=['name'])
+        assert result.name == 'jon'
+        assert self.server.requests[-1]['params']['only'] == ['name', 'vid', 'element_type']
+
+        result, = person.query().labels('knows').defer('bio').vertices()
+        assert '_project(it, only, defer)' in self.server.requests[-1]['script']
+        assert self.server.requests[-1]['params']['defer'] == ['bio']
+        assert len(self.server.requests) == 2
+        assert result.bio == 'a' * 100
+        assert len(self.server.requests) == 3
+
+    def test_projection_function_is_shared(self):
+        """ Tests that every projected query defines the groovy _project function of vertex.groovy """
+        name, definition = _project_function()
+        person = self.klass()
+        person.eid = 1
+        self.klass.get(UUID(int=5), only=['name'])
+        person.outV('knows', only=['name'])
+        person.query().labels('knows').defer('bio').vertices()
+        assert len(self.server.requests) == 3
+        for request in self.server.requests:
+            assert request['script'].count('_project = {') == 1
+            assert definition in request['script']
+
+    def test_aliased_fields_are_projected_by_attribute_name(self):
+        """ Tests that only and defer translate attribute names into db fields """
+        person = self.klass.get(UUID(int=5), only=['nickname'])
+        assert set(self.server.requests[-1]['params']['only']) == {'nick', 'vid', 'element_type'}
+        assert person.nickname == 'snow'
+        assert len(self.server.requests) == 1
+
+        person, = self.klass.all([UUID(int=5)], defer=['nickname'])
+        assert self.server.requests[-1]['params']['defer'] == ['nick']
+        assert person.name == 'jon'
+        assert len(self.server.requests) == 2
+        assert person.nickname == 'snow'
+        assert len(self.server.requests) == 3
+
+    def test_unknown_fields_raise(self):
+        with self.assertRaises(ThunderdomeQueryError):
+            self.klass.all([UUID(int=5)], only=['nick'])
+        with self.assertRaises(ThunderdomeQueryError):
+            self.klass(eid=1).query().defer('missing')
+        assert self.server.requests == []
+
+    def test_only_and_defer_are_exclusive(self):
+        with self.assertRaises(ThunderdomeQueryError):
+            self.klass.all([UUID(int=5)], only=['name'], defer=['bio'])
+        with self.assertRaises(ThunderdomeQueryError):
+            self.klass(eid=1).query().only('name').defer('bio')
+
+    def test_compact_elements(self):
+        """ Tests that compact elements load their deferred fields on access """
+        self.klass = CompactProjectedPerson
+        del self.stored['tags']
+        person = CompactProjectedPerson.get(UUID(int=5), only=['name'])
+        assert person.name == 'jon'
+        assert 'bio' not in person.as_save_params()
+        assert len(self.server.requests) == 1
+        assert person.bio == 'a' * 100
+        assert len(self.server.requests) == 2
+        assert not person._values['bio'].changed
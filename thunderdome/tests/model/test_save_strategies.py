@@ -17,6 +17,7 @@
 # IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+from unittest import TestCase
 import uuid
 from thunderdome import connection 
 from thunderdome.tests.base import BaseThunderdomeTestCase
@@ -48,6 +49,15 @@ class ModelLevelSaveStrategy(Vertex):
 class DefaultModelLevelSaveStrategy(Vertex):
     val = properties.Integer()
 
+
+class DirtyTrackingModel(Vertex):
+    __dirty_tracking__ = True
+
+    val = properties.Integer()
+    always = properties.Integer(save_strategy=properties.SAVE_ALWAYS)
+    tags = properties.List()
+    attrs = properties.Dictionary()
+
     
 class TestOnceSaveStrategy(BaseThunderdomeTestCase):
 
@@ -116,3 +126,31 @@ class TestModelLevelSaveStrategy(BaseThunderdomeTestCase):
         v.val = 2
         assert 'val' in v.as_save_params()
         v.save()
+
+
+class TestDirtyTracking(TestCase):
+
+    def loaded(self):
+        return DirtyTrackingModel(_id=1, vid=str(uuid.uuid4()), val=1, always=2,
+                                  tags=['a'], attrs={'k': [1]})
+
+    def test_only_changed_columns_are_sent(self):
+        """Saved elements should only send changed columns and explicit strategies"""
+        v = self.loaded()
+        assert v.as_save_params() == {'always': 2}
+        v.val = 5
+        del v.tags
+        assert v.as_save_params() == {'always': 2, 'val': 5, 'tags': None}
+
+    def test_in_place_mutations_are_detected(self):
+        """Mutating a list or nested dict value should mark it changed"""
+        v = self.loaded()
+        v.tags.append('b')
+        v.attrs['k'].append(2)
+        params = v.as_save_params()
+        assert params['tags'] == ['a', 'b']
+        assert params['attrs'] == {'k': [1, 2]}
+
+    def test_new_elements_send_everything(self):
+        v = DirtyTrackingModel(val=1)
+        assert set(v.as_save_params()) == set(['vid', 'val', 'always', 'tags', 'attrs'])
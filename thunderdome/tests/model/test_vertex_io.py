@@ -3,6 +3,7 @@ from unittest import skip
 from thunderdome import connection
 from thunderdome.exceptions import ThunderdomeException
 from thunderdome.tests.base import BaseThunderdomeTestCase
+from thunderdome.tests.mocks import MockServerTestCase
 
 from thunderdome.tests.models import TestModel, TestEdge
 
@@ -107,6 +108,76 @@ class TestVertexIO(BaseThunderdomeTestCase):
         tm0.reload()
         assert tm0.count == 7
 
+    def test_async_get_and_traversal(self):
+        """ Tests that the non-blocking api returns the same results """
+        tm0 = TestModel.create(count=8, text='123456789')
+        tm1 = TestModel.create(count=9, text='456789')
+        TestEdge.create(tm0, tm1, numbers=1)
+
+        get0, get1, out = tm0.get_async(tm0.vid), TestModel.get_async(tm1.vid), tm0.outV_async()
+        assert get0.result().vid == tm0.vid
+        assert get1.result().vid == tm1.vid
+        assert [v.vid for v in out.result()] == [tm1.vid]
+
+    def test_save_many(self):
+        """ Tests that bulk saves write back eids and values """
+        existing = TestModel.create(count=1, text='a')
+        existing.count = 2
+        new = [TestModel(count=i, text='b') for i in range(5)]
+        saved = TestModel.save_many(new + [existing], chunk_size=2)
+
+        assert saved == new + [existing]
+        assert all(v.eid is not None for v in saved)
+        assert TestModel.get(existing.vid).count == 2
+        assert TestModel.get(new[3].vid).count == 3
+        assert not any(v._values['count'].changed for v in saved)
+
+    def test_create_many(self):
+        created = TestModel.create_many([{'count': i, 'text': 'c'} for i in range(3)])
+        assert [TestModel.get(v.vid).count for v in created] == [0, 1, 2]
+
+    def test_batched_saves_and_traversals(self):
+        """ Tests that calls made inside a batch resolve once it is sent """
+        tm0 = TestModel.create(count=8, text='123456789')
+        tm1 = TestModel.create(count=9, text='456789')
+        with connection.batch():
+            edge = TestEdge.create(tm0, tm1, numbers=1)
+            tm0.count = 10
+            saved = tm0.save()
+            out = tm0.outV()
+            missing = TestModel.get_by_eid(-1)
+
+        assert edge.result().numbers == 1
+        assert saved.result().count == 10
+        assert [v.vid for v in out.result()] == [tm1.vid]
+        with self.assertRaises(TestModel.DoesNotExist):
+            missing.result()
+
+class TestSaveManyFailures(MockServerTestCase):
+
+    def respond(self, request):
+        """ Saves each chunk, failing the ones holding a vertex with count 2 """
+        elements = request['params']['elements']
+        if any(e['attrs']['count'] == 2 for e in elements):
+            return 500, {'message': 'constraint violated', 'success': False}
+        results = [dict(e['attrs'], _id=100 + e['attrs']['count'], _type='vertex') for e in elements]
+        return 200, {'results': results, 'success': True}
+
+    def test_save_many_reports_failed_chunks(self):
+        """ Tests that a failing chunk is reported without losing the others """
+        ok = TestModel(count=1, text='a')
+        failing = TestModel(count=2, text='b')
+        later = TestModel(count=3, text='c')
+        with self.assertRaises(models.BulkSaveException) as cm:
+            TestModel.save_many([ok, failing, later], chunk_size=1)
+
+        assert len(self.server.requests) == 3
+        assert cm.exception.saved == 2
+        assert [(e.offset, e.elements) for e in cm.exception.errors] == [(1, [failing])]
+        assert (ok.eid, later.eid) == (101, 103)
+        assert failing.eid is None
+
+
 class DeserializationTestModel(Vertex):
     count = properties.Integer()
     text  = properties.Text()
@@ -194,7 +265,19 @@ class TestVertexTraversal(BaseThunderdomeTestCase):
         assert len(results) == 1
         assert self.v3 in results
 
-    
+    def test_streamed_vertex_traversal(self):
+        """Test that traversals can stream their results."""
+        TestEdge.create(self.v1, self.v2, numbers=12)
+        TestEdge.create(self.v1, self.v3, numbers=13)
+
+        with self.v1.outV(TestEdge, stream=True) as cursor:
+            results = list(cursor)
+        assert len(results) == 2
+        assert self.v2 in results
+        assert self.v3 in results
+
+        assert len(list(self.v1.query().labels(TestEdge).vertices(stream=True))) == 2
+
     def test_incoming_vertex_traversal(self):
         """Test that incoming vertex traversals work."""
         e1 = TestEdge.create(self.v1, self.v2, numbers=12)
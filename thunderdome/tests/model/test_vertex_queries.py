@@ -1,3 +1,5 @@
+from unittest import TestCase
+
 from thunderdome.connection import ThunderdomeQueryError
 from thunderdome.tests.base import BaseThunderdomeTestCase
 from thunderdome.models import Query, IN, OUT, Edge, Vertex, GREATER_THAN
@@ -73,3 +75,34 @@ class SimpleQueryTest(BaseThunderdomeTestCase):
         result = self.q.interval('fierceness', 2.5, 5.2)._get_partial()
         assert result == "g.v(eid).query().interval('fierceness', v0 as double, v1 as double)", result
 
+
+class QueryShapeTest(TestCase):
+
+    def setUp(self):
+        self.q = Query(MockVertex())
+
+    def test_copies_do_not_share_values(self):
+        """ Tests that refining a query leaves the original untouched """
+        base = self.q.has('age', 21)
+        older = base.has('fierceness', 2.5).interval('age', 30, 40)
+        assert base._params() == {'v0': 21, 'eid': 1, 'limit': None}
+        assert older._params() == {'v0': 21, 'v1': 2.5, 'v2': 30, 'v3': 40, 'eid': 1, 'limit': None}
+        assert base._get_partial() == "g.v(eid).query().has('age', v0, Query.Compare.EQUAL)"
+        assert len(base._has) == 1
+
+    def test_same_shape_same_script(self):
+        """ Tests that queries differing only by values share a cached script """
+        a = self.q.labels(MockEdge).has('age', 21, GREATER_THAN)
+        b = self.q.labels(MockEdge).has('age', 65, GREATER_THAN)
+        assert a._shape() == b._shape()
+        assert hash(a._shape()) == hash(b._shape())
+        assert a._params() != b._params()
+
+        Query._script_cache.clear()
+        hits = Query._script_cache.hits
+        assert a._script(a._shape(), 'vertices') is b._script(b._shape(), 'vertices')
+        assert Query._script_cache.hits == hits + 1
+
+    def test_value_types_change_the_shape(self):
+        """ Tests that floats, which are cast in the script, get their own shape """
+        assert self.q.has('age', 2)._shape() != self.q.has('age', 2.5)._shape()
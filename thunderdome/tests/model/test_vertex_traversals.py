@@ -18,9 +18,11 @@
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 from datetime import datetime
+from unittest import TestCase
 
 from thunderdome import connection 
 from thunderdome.tests.base import BaseThunderdomeTestCase
+from thunderdome.tests.mocks import MockServerTestCase
 
 from thunderdome.models import Vertex, Edge, IN, OUT, BOTH, GREATER_THAN, LESS_THAN
 from thunderdome import properties
@@ -134,6 +136,93 @@ class TestVertexTraversals(BaseTraversalTestCase):
         assert len(results) == 2
         assert self.beekeeping in results
 
+    def test_multi_source_traversals(self):
+        """Test that traversals from many vertices match the single vertex ones"""
+        people = [self.jon, self.eric, self.blake]
+        results = Person.outV_many(people, EnrolledIn)
+        assert set(results.keys()) == set(people)
+        for person in people:
+            assert results[person] == person.outV(EnrolledIn)
+
+        results = Person.bothE_many(people, types=[TaughtBy])
+        assert results[self.jon] == [self.jon_physics]
+
+    def test_shared_neighbors_are_deserialized_once(self):
+        """Test that a vertex reached from several sources is one instance"""
+        results = Course.bothV_many([self.beekeeping, self.physics])
+        from_beekeeping = [v for v in results[self.beekeeping] if v.eid == self.jon.eid]
+        from_physics = [v for v in results[self.physics] if v.eid == self.jon.eid]
+        assert len(from_beekeeping) == len(from_physics) == 1
+        assert from_beekeeping[0] is from_physics[0]
+
+class TestMultiSourceTraversalRequests(MockServerTestCase):
+
+    def respond(self, request):
+        course = {'_id': 10, '_type': 'vertex', 'element_type': Course.get_element_type(),
+                  'vid': 'c', 'name': 'Physics 264', 'credits': 1.0}
+        return 200, {'results': [[course], [[1, [0]], [2, [0]], [3, []]]], 'success': True}
+
+    def test_one_query_for_all_vertices(self):
+        """Test that every source vertex is traversed by a single request"""
+        people = [Person(), Person(), Person(), Person()]
+        for eid, person in zip([1, 2, 3], people):
+            person.eid = eid
+        results = Person.outV_many(people, EnrolledIn, limit=5, offset=0)
+
+        assert len(self.server.requests) == 1
+        params = self.server.requests[0]['params']
+        assert params['eids'] == [1, 2, 3]
+        assert params['labels'] == [EnrolledIn.get_label()]
+        assert (params['start'], params['end']) == (0, 5)
+
+        assert results[people[0]][0] is results[people[1]][0]
+        assert results[people[0]][0].name == 'Physics 264'
+        assert results[people[2]] == []
+        assert results[people[3]] == []
+
+    def test_limit_without_offset(self):
+        """Test that a limit alone starts at the first result"""
+        person = Person()
+        person.eid = 1
+        Person.outV_many([person], EnrolledIn, limit=5)
+        params = self.server.requests[-1]['params']
+        assert (params['start'], params['end']) == (0, 5)
+
+        person.outV(EnrolledIn, limit=5)
+        params = self.server.requests[-1]['params']
+        assert (params['start'], params['end']) == (0, 5)
+
+
+class TestTraversalBuilder(TestCase):
+
+    def setUp(self):
+        self.person = Person()
+        self.person.eid = 5
+
+    def test_pipeline_compilation(self):
+        """Test that steps compile to one pipeline with every value as a parameter"""
+        traversal = self.person.traverse().out(EnrolledIn).in_().has('age', 18, GREATER_THAN).dedup().limit(50)
+        script, params = traversal._compile()
+        assert script == "g.v(eid).out(p0).in().has(p1, T.gt, p2).dedup()[0..<p3]"
+        assert params == {'eid': 5, 'p0': EnrolledIn.get_label(), 'p1': 'age', 'p2': 18, 'p3': 50}
+
+    def test_steps_return_new_traversals(self):
+        base = self.person.traverse().outE(TaughtBy, EnrolledIn)
+        narrowed = base.inV().types(Course)
+        assert base._compile()[0] == "g.v(eid).outE(p0, p1)"
+        assert narrowed._compile()[0] == "g.v(eid).outE(p0, p1).inV().filter{(it.element_type ?: it.label) in p2}"
+        assert narrowed._compile()[1]['p2'] == [Course.get_element_type()]
+
+    def test_floats_are_compared_as_doubles(self):
+        script, params = self.person.traverse().has('credits', 1.5, LESS_THAN).interval('age', 30, 20)._compile()
+        assert script == "g.v(eid).has(p0, T.lt, p1 as double).interval(p2, p3, p4)"
+        assert (params['p3'], params['p4']) == (20, 30)
+
+    def test_unsaved_vertices_can_not_be_traversed(self):
+        with self.assertRaises(connection.ThunderdomeQueryError):
+            Person().traverse().out().all()
+
+
 class TestVertexCentricQueries(BaseTraversalTestCase):
 
     def test_query_vertices(self):
@@ -168,3 +257,19 @@ class TestVertexCentricQueries(BaseTraversalTestCase):
         assert 1 == len(self.blake.query().labels(EnrolledIn).interval('enthusiasm', 9, 2).vertices())
         assert 0 == len(self.blake.query().labels(EnrolledIn).interval('enthusiasm', 2, 8).vertices())
 
+
+class TestTraversals(BaseTraversalTestCase):
+
+    def test_multi_hop_traversal(self):
+        """Test that a whole path is traversed in one query"""
+        teachers = self.jon.traverse().out(EnrolledIn).out(TaughtBy).all()
+        assert teachers == [self.blake]
+
+        classmates = self.eric.traverse().out(EnrolledIn).out(TaughtBy).in_(EnrolledIn).all()
+        assert classmates == [self.eric]
+
+    def test_filters(self):
+        students = self.beekeeping.traverse().both().has('age', 18, GREATER_THAN).dedup()
+        assert students.all() == [self.jon]
+        assert students.count() == 1
+        assert self.jon.traverse().bothE().types(TaughtBy).count() == 1
@@ -0,0 +1,290 @@
+# Copyright (c) 2012-2013 SHIFT.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import os
+import threading
+import time
+from unittest import TestCase
+from uuid import UUID
+
+from thunderdome import cache
+from thunderdome.cache import CachePolicy, ElementCache, LocalCacheBackend, LRUCache
+from thunderdome import futures
+from thunderdome.gremlin import GremlinMethod
+from thunderdome.models import Vertex, Edge
+from thunderdome import properties
+from thunderdome.tests.mocks import MockServerTestCase
+
+
+class TestLRUCache(TestCase):
+
+    def test_least_recently_used_is_evicted(self):
+        """ Tests that reading an entry keeps it from being evicted """
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        assert cache.get('a') == 1
+        cache.set('c', 3)
+        assert 'b' not in cache
+        assert cache.get('a') == 1
+        assert cache.get('c') == 3
+        assert len(cache) == 2
+
+    def test_hits_and_misses(self):
+        cache = LRUCache()
+        assert cache.get('a', 'default') == 'default'
+        cache.set('a', 1)
+        cache.get('a')
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_delete_and_clear(self):
+        cache = LRUCache()
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.delete('a')
+        cache.delete('missing')
+        assert 'a' not in cache
+        cache.clear()
+        assert len(cache) == 0
+
+
+class TestLocalCacheBackend(TestCase):
+
+    def test_values_expire(self):
+        """ Tests that values are dropped once their ttl has passed """
+        now = [100.0]
+        backend = LocalCacheBackend(clock=lambda: now[0])
+        backend.set('a', 'x', ttl=10)
+        backend.set('b', 'y')
+        now[0] = 109.0
+        assert backend.get_many(['a', 'b', 'c']) == {'a': 'x', 'b': 'y'}
+        now[0] = 110.0
+        assert backend.get('a') is None
+        assert backend.get('b') == 'y'
+        assert len(backend) == 1
+
+    def test_max_entries(self):
+        backend = LocalCacheBackend(max_entries=1)
+        backend.set('a', 'x')
+        backend.set('b', 'y')
+        assert backend.get('a') is None
+
+
+class CachedPerson(Vertex):
+    name = properties.Text()
+
+
+class CachedFriend(Edge):
+    pass
+
+
+def vid(eid):
+    return str(UUID(int=eid))
+
+
+def vertex_data(eid, name):
+    return {'_id': eid, '_type': 'vertex', 'element_type': CachedPerson.get_element_type(),
+            'vid': vid(eid), 'name': name}
+
+
+class TestElementCache(MockServerTestCase):
+
+    def setUp(self):
+        super(TestElementCache, self).setUp()
+        self.names = {1: 'jon', 2: 'eric'}
+        cache.configure(ElementCache())
+
+    def tearDown(self):
+        cache.configure(None)
+        super(TestElementCache, self).tearDown()
+
+    def respond(self, request):
+        """ Answers lookups by vid and eid, saves and edge lookups """
+        params = request['params']
+        script = request['script']
+        if 'vids' in params:
+            eids = [UUID(v).int for v in params['vids']]
+            results = [vertex_data(eid, self.names[eid]) if eid in self.names else None for eid in eids]
+        elif 'g.e(eid)' in script:
+            results = [{'_id': params['eid'], '_type': 'edge', '_label': CachedFriend.get_label(),
+                        '_outV': 1, '_inV': 2}]
+        elif 'removeVertex' in script:
+            results = [7]
+        elif 'attrs' in params:
+            self.names[params['eid']] = params['attrs']['name']
+            results = [vertex_data(params['eid'], params['attrs']['name'])]
+        else:
+            results = [vertex_data(params['eid'], self.names[params['eid']])]
+        return 200, {'results': results, 'success': True}
+
+    def test_lookups_are_cached(self):
+        """ Tests that repeated lookups by vid and eid are served from the cache """
+        assert CachedPerson.get(vid(1)).name == 'jon'
+        assert CachedPerson.get(vid(1)).name == 'jon'
+        assert CachedPerson.get_by_eid(1).name == 'jon'
+        assert len(self.server.requests) == 1
+
+        people = CachedPerson.all([vid(1), vid(2)])
+        assert [p.name for p in people] == ['jon', 'eric']
+        assert self.server.requests[-1]['params']['vids'] == [vid(2)]
+
+        assert CachedFriend.get_by_eid(5).eid == 5
+        CachedFriend.get_by_eid(5)
+        assert len(self.server.requests) == 3
+
+    def test_cached_elements_are_independent(self):
+        """ Tests that changing a cached element doesn't change the cache """
+        person = CachedPerson.get(vid(1))
+        person.name = 'changed'
+        assert CachedPerson.get(vid(1)).name == 'jon'
+
+    def test_saves_invalidate(self):
+        """ Tests that saving an element drops its cached data """
+        person = CachedPerson.get(vid(1))
+        person.update(name='jonathan')
+        assert CachedPerson.get(vid(1)).name == 'jonathan'
+        assert CachedPerson.get_by_eid(1).name == 'jonathan'
+
+    def test_deletes_invalidate(self):
+        """ Tests that deleting a vertex drops it and its edges from the cache """
+        CachedFriend.get_by_eid(7)
+        person = CachedPerson.get(vid(1))
+        person.delete()
+        del self.names[1]
+        with self.assertRaises(CachedPerson.DoesNotExist):
+            CachedPerson.get(vid(1))
+        requests = len(self.server.requests)
+        CachedFriend.get_by_eid(7)
+        assert len(self.server.requests) == requests + 1
+
+    def test_deleted_related_elements_are_invalidated(self):
+        element_cache = cache.element_cache()
+        CachedPerson.get(vid(2))
+        CachedFriend.get_by_eid(7)
+        Vertex._invalidate_deleted([[[2, vid(2)]], [7]])
+        assert element_cache.vertices_by_vid([vid(2)]) == {}
+        assert element_cache.vertex_by_eid(2) is None
+        assert element_cache.edge_by_eid(7) is None
+
+
+class TestCachePolicy(TestCase):
+
+    def test_results_are_memoized(self):
+        policy = CachePolicy()
+        calls = []
+        load = lambda: calls.append(1) or [{'a': 1}]
+        key = policy.make_key('m', {'b': 2, 'a': 1})
+        assert key == policy.make_key('m', {'a': 1, 'b': 2})
+        assert policy.fetch(key, load) == [{'a': 1}]
+        assert policy.fetch(key, load) == [{'a': 1}]
+        assert len(calls) == 1
+
+        policy.invalidate(key)
+        policy.fetch(key, load)
+        assert len(calls) == 2
+
+    def test_custom_keys(self):
+        policy = CachePolicy(key=lambda params: params['user'])
+        assert policy.make_key('m', {'user': 'jon', 'now': 1}) == policy.make_key('m', {'user': 'jon', 'now': 2})
+
+    def test_errors_are_not_cached(self):
+        policy = CachePolicy()
+        with self.assertRaises(KeyError):
+            policy.fetch('k', lambda: {}['missing'])
+        assert policy.fetch('k', lambda: 5) == 5
+
+    def test_concurrent_misses_are_coalesced(self):
+        """ Tests that callers missing the same key wait for a single load """
+        policy = CachePolicy()
+        release = threading.Event()
+        calls = []
+
+        def load():
+            calls.append(1)
+            release.wait(5)
+            return ['result']
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(policy.fetch('k', load))) for i in range(5)]
+        for t in threads:
+            t.start()
+        time.sleep(0.1)
+        release.set()
+        for t in threads:
+            t.join()
+        assert len(calls) == 1
+        assert results == [['result']] * 5
+
+    def test_unserializable_results_are_loaded_by_each_caller(self):
+        """ Tests that waiters run the query themselves when the results can't be cached """
+        policy = CachePolicy()
+        release = threading.Event()
+        calls = []
+
+        def load():
+            calls.append(1)
+            release.wait(5)
+            return [object()]
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(policy.fetch('k', load))) for i in range(3)]
+        for t in threads:
+            t.start()
+        time.sleep(0.1)
+        release.set()
+        for t in threads:
+            t.join()
+        assert len(results) == 3
+        assert len(calls) == 3
+        assert policy.backend.get('k') is None
+
+    def test_deferred_results(self):
+        """ Tests that results of batched calls are cached once they resolve """
+        policy = CachePolicy()
+        future = futures.Future()
+        assert policy.fetch('k', lambda: future) is future
+        assert policy.fetch('k', lambda: future) is future
+        future.set_result([1])
+        assert policy.fetch('k', lambda: [2]) == [1]
+
+
+class CachedMethodVertex(Vertex):
+    gremlin_path = os.path.join(os.path.dirname(os.path.abspath(cache.__file__)), 'vertex.groovy')
+    cached_related = GremlinMethod(method_name='_delete_related', classmethod=True, cache=CachePolicy())
+
+
+class TestCachedGremlinMethods(MockServerTestCase):
+
+    def tearDown(self):
+        CachedMethodVertex._gremlin_methods['cached_related'].cache.clear()
+        super(TestCachedGremlinMethods, self).tearDown()
+
+    def test_calls_are_cached(self):
+        """ Tests that identical calls only query once until invalidated """
+        assert CachedMethodVertex.cached_related(1, 'outE', ['a']) == [{'eid': 1, 'operation': 'outE', 'labels': ['a']}]
+        CachedMethodVertex.cached_related(1, 'outE', ['a'])
+        assert len(self.server.requests) == 1
+
+        CachedMethodVertex.cached_related(2, 'outE', ['a'])
+        assert len(self.server.requests) == 2
+
+        CachedMethodVertex.cached_related_invalidate(1, 'outE', ['a'])
+        CachedMethodVertex.cached_related(1, 'outE', ['a'])
+        CachedMethodVertex.cached_related(2, 'outE', ['a'])
+        assert len(self.server.requests) == 3
@@ -0,0 +1,120 @@
+# Copyright (c) 2012-2013 SHIFT.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import threading
+import time
+from unittest import TestCase
+
+from thunderdome import futures
+from thunderdome.futures import Executor, Future, FutureTimeoutError, async_method
+
+
+class TestFuture(TestCase):
+
+    def test_result_and_callbacks(self):
+        """ Tests that callbacks run with the completed future """
+        f = Future()
+        seen = []
+        f.add_done_callback(lambda fut: seen.append(fut.result()))
+        f.set_result(5)
+        assert f.done()
+        assert seen == [5]
+
+    def test_exceptions_are_reraised(self):
+        f = Future()
+        f.set_exception(KeyError('x'))
+        with self.assertRaises(KeyError):
+            f.result()
+        assert isinstance(f.exception(), KeyError)
+
+    def test_timeout(self):
+        with self.assertRaises(FutureTimeoutError):
+            Future().result(0.01)
+
+    def test_then_chains_results_and_errors(self):
+        """ Tests that then transforms results and propagates exceptions """
+        f = Future()
+        doubled = f.then(lambda r: r * 2)
+        f.set_result(4)
+        assert doubled.result() == 8
+
+        f = Future()
+        chained = f.then(lambda r: r * 2)
+        f.set_exception(ValueError())
+        with self.assertRaises(ValueError):
+            chained.result()
+
+    def test_chain_handles_plain_values(self):
+        assert futures.chain(3, lambda r: r + 1) == 4
+        assert futures.chain(futures.completed(3), lambda r: r + 1).result() == 4
+
+
+class TestExecutor(TestCase):
+
+    def test_concurrency_is_bounded(self):
+        """ Tests that no more than max_workers calls run at once """
+        executor = Executor(max_workers=2)
+        lock = threading.Lock()
+        running = [0]
+        peak = [0]
+
+        def work(i):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+            return i
+
+        results = futures.gather([executor.submit(work, i) for i in range(6)])
+        executor.shutdown()
+        assert results == range(6)
+        assert peak[0] == 2
+
+    def test_calls_run_concurrently(self):
+        """ Tests that independent blocking calls overlap """
+        executor = Executor(max_workers=4)
+        start = time.time()
+        futures.gather([executor.submit(time.sleep, 0.1) for i in range(4)])
+        executor.shutdown()
+        assert time.time() - start < 0.3
+
+
+class Thing(object):
+    def __init__(self, value):
+        self.value = value
+
+    def get(self, extra=0):
+        return self.value + extra
+
+    @classmethod
+    def make(cls, value):
+        return cls(value)
+
+    get_async = async_method('get')
+    make_async = async_method('make')
+
+
+class TestAsyncMethod(TestCase):
+
+    def test_instance_and_class_methods(self):
+        """ Tests that async counterparts return futures of the blocking call """
+        assert Thing(1).get_async(extra=2).result() == 3
+        assert Thing.make_async(7).result().value == 7
@@ -0,0 +1,134 @@
+# Copyright (c) 2012-2013 SHIFT.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from unittest import TestCase
+from uuid import uuid4
+
+from thunderdome import connection
+from thunderdome.models import Element
+from thunderdome.session import Session, current_session
+from thunderdome.tests.base import BaseThunderdomeTestCase
+from thunderdome.tests.mocks import MockServerTestCase
+from thunderdome.tests.models import TestModel, TestEdge
+
+
+def vertex_data(eid, vid=None, count=1):
+    return {'_id': eid, '_type': 'vertex', 'element_type': TestModel.get_element_type(),
+            'vid': vid or str(uuid4()), 'count': count, 'text': 'a'}
+
+
+class TestIdentityMap(TestCase):
+
+    def test_elements_are_deserialized_once(self):
+        """ Tests that loading an element twice returns the same instance """
+        data = vertex_data(5)
+        with Session() as session:
+            v1 = Element.deserialize(data)
+            v2 = Element.deserialize(vertex_data(5, count=3))
+            assert v1 is v2
+            assert TestModel.get(data['vid']) is v1
+            assert TestModel.get_by_eid(5) is v1
+        assert Element.deserialize(data) is not v1
+
+    def test_sessions_are_thread_local_and_nested(self):
+        assert current_session() is None
+        with Session() as outer:
+            with Session() as inner:
+                assert current_session() is inner
+            assert current_session() is outer
+        assert current_session() is None
+
+    def test_dirty_tracking(self):
+        """ Tests that changed values mark loaded elements dirty """
+        session = Session()
+        with session:
+            v1 = Element.deserialize(vertex_data(1))
+            v2 = Element.deserialize(vertex_data(2))
+            v1.count = 10
+            assert session.dirty == [v1]
+            session.delete(v1)
+            assert session.dirty == []
+            assert session.deleted == [v1]
+            session.rollback()
+
+    def test_new_elements_are_tracked_by_identity(self):
+        """ Tests that equal new elements are still scheduled separately """
+        session = Session()
+        v1, v2 = TestModel(count=1), TestModel(count=1)
+        session.add(v1)
+        session.add(v2)
+        session.add(v1)
+        assert len(session.new) == 2
+        session.delete(v2)
+        assert session.new == [v1]
+        assert session.new[0] is v1
+
+
+class TestSessionSaves(MockServerTestCase):
+
+    def setUp(self):
+        super(TestSessionSaves, self).setUp()
+        self.stored = vertex_data(1)
+
+    def respond(self, request):
+        """ Answers saves with the stored vertex updated with the saved values """
+        self.stored.update(request['params']['attrs'])
+        return 200, {'results': [self.stored], 'success': True}
+
+    def test_saved_elements_are_clean(self):
+        """ Tests that saving a tracked element leaves nothing for the flush """
+        with Session() as session:
+            v = Element.deserialize(dict(self.stored))
+            v.count = 10
+            assert v.save() is v
+            assert v._values['count'].previous_value == 10
+            assert session.dirty == []
+        assert len(self.server.requests) == 1
+        assert self.stored['count'] == 10
+
+    def test_new_elements_are_tracked_after_save(self):
+        """ Tests that the session maps the eid to the saved instance """
+        with Session() as session:
+            v = TestModel(count=1, text='a')
+            assert v.save() is v
+            assert session.lookup('vertex', 1) is v
+            assert session.dirty == []
+        assert len(self.server.requests) == 1
+
+
+class TestSessionFlush(BaseThunderdomeTestCase):
+
+    def test_flush_writes_pending_changes(self):
+        """ Tests that creates, updates and deletes are written at commit """
+        existing = TestModel.create(count=1, text='a')
+        doomed = TestModel.create(count=2, text='b')
+
+        with Session() as session:
+            loaded = TestModel.get(existing.vid)
+            loaded.count = 5
+            new = TestModel(count=3, text='c')
+            session.add(new)
+            session.add(TestEdge(new, loaded, numbers=4))
+            session.delete(TestModel.get(doomed.vid))
+
+        assert new.eid is not None
+        assert TestModel.get(existing.vid).count == 5
+        assert [v.vid for v in new.outV()] == [existing.vid]
+        with self.assertRaises(TestModel.DoesNotExist):
+            TestModel.get(doomed.vid)
@@ -0,0 +1,826 @@
+# Copyright (c) 2012-2013 SHIFT.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import errno
+import httplib
+import json
+import logging
+import re
+import socket
+import struct
+import sys
+import uuid
+
+from thunderdome.pool import ConnectionPool, http_connection_is_alive
+
+
+logger = logging.getLogger(__name__)
+
+
+class HostConnectError(socket.error):
+    """
+    Socket error raised before any part of a request was sent, so the request
+    can safely be sent to another host
+    """
+
+
+class ConnectionClosedError(socket.error):
+    """
+    The server closed the connection in the middle of a message
+    """
+
+
+def is_stale_connection_error(err):
+    """
+    Indicates whether the given error is what a persistent connection the
+    server has already closed looks like.
+
+    :rtype: boolean
+
+    """
+    if isinstance(err, (httplib.BadStatusLine, ConnectionClosedError)):
+        return True
+    if isinstance(err, socket.error):
+        return getattr(err, 'errno', None) in (errno.ECONNRESET, errno.EPIPE)
+    return False
+
+
+class JSONResultsParser(object):
+    """
+    Incrementally parses a JSON object read in chunks, iterating over the
+    items of one of its array members as soon as each of them is complete.
+    The other members are parsed into `members` as they are read.
+    """
+
+    _special = re.compile(r'["\[\]{},:]')
+    _string_special = re.compile(r'["\\]')
+
+    def __init__(self, read, key='results', chunk_size=16384):
+        """
+        :param read: Callable returning up to n more bytes, '' at the end
+        :type read: callable
+        :param key: The member holding the array to iterate over
+        :type key: str
+        :param chunk_size: The number of bytes read at a time
+        :type chunk_size: int
+
+        """
+        self.read = read
+        self.key = key
+        self.chunk_size = chunk_size
+        self.members = {}
+
+    def __iter__(self):
+        buf = ''
+        pos = 0
+        depth = 0
+        in_string = False
+        expecting_key = False
+        key = None
+        key_start = None
+        value_start = None
+        item_start = None
+        in_array = False
+
+        while True:
+            chunk = self.read(self.chunk_size)
+            if not chunk:
+                break
+            buf += chunk
+
+            while True:
+                if in_string:
+                    m = self._string_special.search(buf, pos)
+                    if m is None:
+                        pos = len(buf)
+                        break
+                    if m.group() == '\\':
+                        if m.end() >= len(buf):
+                            #the escaped character hasn't been read yet
+                            pos = m.start()
+                            break
+                        pos = m.end() + 1
+                        continue
+                    in_string = False
+                    pos = m.end()
+                    if key_start is not None:
+                        key = json.loads(buf[key_start:pos])
+                        key_start = None
+                    continue
+
+                m = self._special.search(buf, pos)
+                if m is None:
+                    pos = len(buf)
+                    break
+                c, i, pos = m.group(), m.start(), m.end()
+
+                if c == '"':
+                    in_string = True
+                    if depth == 1 and expecting_key:
+                        key_start = i
+                elif c == ':':
+                    if depth == 1:
+                        expecting_key = False
+                        value_start = pos
+                elif c == ',':
+                    if depth == 1:
+                        self._member(key, buf, value_start, i)
+                        value_start = None
+                        expecting_key = True
+                    elif in_array and depth == 2:
+                        yield json.loads(buf[item_start:i])
+                        item_start = pos
+                elif c in '[{':
+                    depth += 1
+                    if depth == 1:
+                        expecting_key = True
+                    elif depth == 2 and c == '[' and key == self.key and value_start is not None:
+                        in_array = True
+                        value_start = None
+                        item_start = pos
+                else:
+                    if in_array and depth == 2:
+                        text = buf[item_start:i].strip()
+                        if text:
+                            yield json.loads(text)
+                        in_array = False
+                        item_start = None
+                    elif depth == 1:
+                        self._member(key, buf, value_start, i)
+                        value_start = None
+                    depth -= 1
+
+            #drop what has been parsed
+            keep = min(x for x in (key_start, value_start, item_start, pos) if x is not None)
+            buf = buf[keep:]
+            pos -= keep
+            key_start = key_start - keep if key_start is not None else None
+            value_start = value_start - keep if value_start is not None else None
+            item_start = item_start - keep if item_start is not None else None
+
+        if depth != 0 or in_string:
+            raise ValueError('Unexpected end of JSON response')
+        #a member which wasn't an array, e.g. null
+        if self.members.get(self.key) is not None:
+            yield self.members[self.key]
+
+    def _member(self, key, buf, start, end):
+        if start is not None:
+            text = buf[start:end].strip()
+            if text:
+                self.members[key] = json.loads(text)
+
+
+class ResultStream(object):
+    """
+    Iterates over the results of a response as they are parsed, holding the
+    connection they're read from until the results are exhausted or the
+    stream is closed.
+    """
+
+    def __init__(self, results, release=None):
+        """
+        :param results: The results
+        :type results: iterable
+        :param release: Called with whether the response was read completely
+        once the stream is finished
+        :type release: callable
+
+        """
+        self._results = iter(results)
+        self._release = release
+        self._finished = False
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self._finished:
+            raise StopIteration
+        try:
+            return next(self._results)
+        except StopIteration:
+            self._finish(True)
+            raise
+        except:
+            exc_info = sys.exc_info()
+            self._finish(False)
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+    def close(self):
+        """
+        Stops reading the results, the connection is closed if the response
+        wasn't read completely.
+        """
+        self._finish(False)
+
+    def _finish(self, complete):
+        if not self._finished:
+            self._finished = True
+            if self._release is not None:
+                self._release(complete)
+
+    def __del__(self):
+        self.close()
+
+
+class BaseTransport(object):
+    """
+    Transports carry Gremlin scripts to a Rexster host and bring back the
+    response. Every transport keeps a pool of persistent connections per
+    host, connections are created by `connect` and must expose a `sock`
+    attribute (None until connected), `connect()` and `close()`.
+    """
+
+    # port used for hosts given without one
+    default_port = None
+
+    # whether functions defined by a script stay defined for later scripts
+    # sent over the same connection
+    supports_functions = False
+
+    def __init__(self):
+        self.graph_name = None
+        self.username = None
+        self.password = None
+        self.pool_options = {}
+        self.pools = {}
+
+    def configure(self, graph_name, username=None, password=None, pool_options=None):
+        """
+        Sets the graph and credentials used for every request.
+
+        :param graph_name: The name of the graph as defined in the rexster.xml
+        :type graph_name: str
+        :param username: The username for the rexster server
+        :type username: str
+        :param password: The password for the rexster server
+        :type password: str
+        :param pool_options: Keyword arguments for each ConnectionPool
+        :type pool_options: dict
+
+        """
+        self.close()
+        self.graph_name = graph_name
+        self.username = username
+        self.password = password
+        self.pool_options = pool_options or {}
+
+    def connect(self, host):
+        """
+        Returns a new, unconnected, connection to the given host.
+
+        :param host: The host to connect to
+        :type host: thunderdome.connection.Host
+
+        """
+        raise NotImplementedError
+
+    def execute(self, host, script, params, functions=None):
+        """
+        Runs the script on the given host and returns the response status
+        along with the response in the shape of the Rexster gremlin extension's
+        JSON response (`results`, `success`, `message`, `error`). Raises
+        socket.error on network problems and ValueError if the response can't
+        be decoded.
+
+        :param host: The host to run the script on
+        :type host: thunderdome.connection.Host
+        :param script: The Gremlin script
+        :type script: str
+        :param params: The script bindings
+        :type params: dict
+        :param functions: (name, definition) pairs of the functions the script
+        calls, see define_function
+        :type functions: list of tuple
+        :rtype: tuple
+
+        """
+        raise NotImplementedError
+
+    def stream(self, host, script, params, functions=None):
+        """
+        Like execute, but the results of a successful response are a
+        ResultStream. Transports which can't parse responses incrementally read
+        the whole response first.
+
+        :rtype: tuple
+
+        """
+        status, response_data = self.execute(host, script, params, functions)
+        if status == 200:
+            results = response_data.get('results')
+            response_data['results'] = ResultStream(results if results is not None else [])
+        return status, response_data
+
+    def probe(self, host):
+        """
+        Returns whether the given host is able to serve requests.
+
+        :rtype: boolean
+
+        """
+        conn = self.connect(host)
+        try:
+            conn.connect()
+            return True
+        finally:
+            conn.close()
+
+    def get_pool(self, host):
+        """
+        Returns the connection pool for the given host, creating it on first use.
+
+        :param host: The host to get the pool for
+        :type host: thunderdome.connection.Host
+        :rtype: thunderdome.pool.ConnectionPool
+
+        """
+        pool = self.pools.get(host)
+        if pool is None:
+            options = dict(self.pool_options)
+            options.setdefault('factory', self.connect)
+            options.setdefault('health_check', http_connection_is_alive)
+            pool = self.pools.setdefault(host, ConnectionPool(host, **options))
+        return pool
+
+    def pool_stats(self):
+        """
+        Returns connection pool statistics keyed by "<hostname>:<port>".
+
+        :rtype: dict
+
+        """
+        return {'{}:{}'.format(*host): pool.stats() for host, pool in self.pools.items()}
+
+    def close(self):
+        """
+        Closes every pooled connection.
+        """
+        for pool in self.pools.values():
+            pool.close()
+        self.pools.clear()
+
+    def _with_connection(self, host, func):
+        """
+        Calls `func(conn)` with a pooled connection to the given host. `func`
+        returns a tuple of its result and whether the connection may be reused.
+        A request that fails because a reused connection went stale is retried
+        once on a fresh connection.
+
+        """
+        pool = self.get_pool(host)
+        while True:
+            pooled = self._checkout(pool)
+            try:
+                result, reusable = func(pooled.conn)
+            except:
+                exc_info = sys.exc_info()
+                pool.release(pooled, discard=True)
+                if pooled.uses > 1 and is_stale_connection_error(exc_info[1]):
+                    continue
+                raise exc_info[0], exc_info[1], exc_info[2]
+
+            pool.release(pooled, discard=not reusable)
+            return result
+
+    def _checkout(self, pool):
+        """
+        Acquires a pooled connection, connecting it if necessary.
+
+        :rtype: thunderdome.pool.PooledConnection
+
+        """
+        pooled = pool.acquire()
+        try:
+            if pooled.conn.sock is None:
+                pooled.conn.connect()
+        except socket.error as err:
+            pool.release(pooled, discard=True)
+            raise HostConnectError(*err.args)
+        return pooled
+
+
+class HTTPTransport(BaseTransport):
+    """
+    Posts scripts to the Rexster gremlin extension as JSON over persistent
+    HTTP/1.1 connections.
+    """
+
+    default_port = 8182
+
+    headers = {'Content-Type':'application/json', 'Accept':'application/json', 'Accept-Charset':'utf-8'}
+
+    def connect(self, host):
+        return httplib.HTTPConnection(host.name, int(host.port))
+
+    def execute(self, host, script, params, functions=None):
+        url, data = self._request_data(script, params, functions)
+
+        def post(conn):
+            conn.request("POST", url, data, self.headers)
+            response = conn.getresponse()
+            content = response.read()
+            return (response.status, content), not response.will_close
+
+        status, content = self._with_connection(host, post)
+
+        logger.info(json.dumps(data))
+        logger.info(content)
+
+        return status, json.loads(content)
+
+    def stream(self, host, script, params, functions=None):
+        url, data = self._request_data(script, params, functions)
+        pool = self.get_pool(host)
+        while True:
+            pooled = self._checkout(pool)
+            try:
+                pooled.conn.request("POST", url, data, self.headers)
+                response = pooled.conn.getresponse()
+            except:
+                exc_info = sys.exc_info()
+                pool.release(pooled, discard=True)
+                if pooled.uses > 1 and is_stale_connection_error(exc_info[1]):
+                    continue
+                raise exc_info[0], exc_info[1], exc_info[2]
+            break
+
+        logger.info(json.dumps(data))
+
+        if response.status != 200:
+            try:
+                content = response.read()
+            finally:
+                pool.release(pooled, discard=response.will_close)
+            logger.info(content)
+            return response.status, json.loads(content)
+
+        def release(complete):
+            if complete:
+                try:
+                    #trailing whitespace or the end of a chunked body
+                    response.read()
+                except (httplib.HTTPException, socket.error):
+                    complete = False
+            pool.release(pooled, discard=not complete or response.will_close)
+
+        parser = JSONResultsParser(response.read)
+        return 200, {'results': ResultStream(parser, release), 'success': True}
+
+    def _request_data(self, script, params, functions):
+        # each request runs in a fresh scope, functions are defined every time
+        script = with_definitions(script, functions or [])
+        url = '/graphs/{}/tp/gremlin'.format(self.graph_name)
+        return url, json.dumps({'script':script, 'params': params})
+
+    def probe(self, host):
+        conn = httplib.HTTPConnection(host.name, int(host.port), timeout=5)
+        try:
+            conn.request("GET", '/graphs/{}'.format(self.graph_name))
+            response = conn.getresponse()
+            response.read()
+            return response.status == 200
+        finally:
+            conn.close()
+
+
+# RexPro message types
+REXPRO_ERROR = 0
+REXPRO_SESSION_REQUEST = 1
+REXPRO_SESSION_RESPONSE = 2
+REXPRO_SCRIPT_REQUEST = 3
+REXPRO_SCRIPT_RESPONSE = 5
+
+REXPRO_PROTOCOL_VERSION = 0
+REXPRO_HEADER = struct.Struct('!BBI')
+REXPRO_EMPTY_SESSION = '\x00' * 16
+
+#seconds a closing connection waits for the server to end its session
+REXPRO_CLOSE_TIMEOUT = 1.0
+
+
+def define_function(name, args, body):
+    """
+    Returns a script defining a groovy closure under the given name, for
+    transports which keep functions defined between scripts.
+
+    :param name: The name to define the function as
+    :type name: str
+    :param args: The argument names
+    :type args: list of str
+    :param body: The function body
+    :type body: str
+    :rtype: str
+
+    """
+    return '{} = {{ {} ->\n{}\n}}'.format(name, ', '.join(args), body)
+
+
+def with_definitions(script, functions):
+    """
+    Prepends the definitions of the given functions to the script.
+
+    :param script: The Gremlin script
+    :type script: str
+    :param functions: (name, definition) pairs
+    :type functions: list of tuple
+    :rtype: str
+
+    """
+    return ''.join(definition + '\n' for name, definition in functions) + script
+
+
+#groovy's error for a call to a closure the session doesn't define
+_MISSING_FUNCTION = re.compile(r'No such property: (\w+) for class|No signature of method: (?:[\w$]+\.)*(\w+)\(\)')
+
+
+def _missing_function(message, functions):
+    """
+    Returns the name of the given function a script error reports as
+    undefined, if any.
+
+    :param message: The error message of the script
+    :type message: str
+    :param functions: (name, definition) pairs
+    :type functions: list of tuple
+    :rtype: str or None
+
+    """
+    names = set(name for name, definition in functions)
+    for match in _MISSING_FUNCTION.finditer(message or ''):
+        name = match.group(1) or match.group(2)
+        if name in names:
+            return name
+    return None
+
+
+def pack_rexpro_message(message_type, body):
+    """
+    Frames a RexPro message: protocol version, message type and the size of
+    the msgpack encoded body, followed by the body itself.
+
+    :param message_type: The RexPro message type
+    :type message_type: int
+    :param body: The message fields
+    :type body: list
+    :rtype: str
+
+    """
+    import msgpack
+    data = msgpack.dumps(body)
+    return REXPRO_HEADER.pack(REXPRO_PROTOCOL_VERSION, message_type, len(data)) + data
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(min(size, 65536))
+        if not chunk:
+            raise ConnectionClosedError(errno.ECONNRESET, 'RexPro connection closed by server')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return ''.join(chunks)
+
+
+def read_rexpro_message(sock):
+    """
+    Reads one framed RexPro message from the socket and returns its type and
+    decoded body.
+
+    :param sock: The socket to read from
+    :type sock: socket.socket
+    :rtype: tuple
+
+    """
+    import msgpack
+    version, message_type, size = REXPRO_HEADER.unpack(_recv_exactly(sock, REXPRO_HEADER.size))
+    if version != REXPRO_PROTOCOL_VERSION:
+        raise ValueError('Unsupported RexPro protocol version {}'.format(version))
+    return message_type, msgpack.loads(_recv_exactly(sock, size))
+
+
+def flatten_rexpro_element(obj):
+    """
+    RexPro serializes graph elements with their properties nested under
+    `_properties`, this hoists them to the top level like the gremlin
+    extension's JSON does.
+
+    """
+    if isinstance(obj, dict):
+        if '_properties' in obj and '_type' in obj:
+            flat = {k: flatten_rexpro_element(v) for k, v in obj.items() if k != '_properties'}
+            for k, v in obj['_properties'].items():
+                flat[k] = flatten_rexpro_element(v)
+            return flat
+        return {k: flatten_rexpro_element(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [flatten_rexpro_element(v) for v in obj]
+    return obj
+
+
+class RexProConnection(object):
+    """
+    A socket speaking the RexPro protocol which holds one server side
+    session, so bindings defined by a script outlive the request.
+    """
+
+    def __init__(self, host, graph_name, username=None, password=None, timeout=None):
+        self.host = host
+        self.graph_name = graph_name
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.sock = None
+        self.session = None
+        # names of the functions defined in the current session
+        self.functions = set()
+        # names of the parameters bound by the last script
+        self.bindings = set()
+
+    def connect(self):
+        """
+        Opens the socket and starts a session bound to the graph.
+        """
+        self.sock = socket.create_connection((self.host.name, int(self.host.port)), self.timeout)
+        try:
+            meta = {'graphName': self.graph_name, 'graphObjName': 'g', 'killSession': False}
+            message_type, body = self.request(REXPRO_SESSION_REQUEST, [
+                REXPRO_EMPTY_SESSION,
+                uuid.uuid4().bytes,
+                meta,
+                self.username or '',
+                self.password or '',
+            ])
+            if message_type == REXPRO_ERROR:
+                raise socket.error('Unable to open RexPro session: {}'.format(body[3]))
+            self.session = body[0]
+        except:
+            exc_info = sys.exc_info()
+            self.close()
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+    def request(self, message_type, body):
+        """
+        Sends a message and returns the type and body of the reply.
+
+        :rtype: tuple
+
+        """
+        self.sock.sendall(pack_rexpro_message(message_type, body))
+        return read_rexpro_message(self.sock)
+
+    def execute(self, script, params, functions=None):
+        """
+        Runs the script inside this connection's session, defining the given
+        functions first if the session doesn't know them yet. If the script
+        fails because a function the session should know is undefined, the
+        functions are defined again and the script re-sent, once.
+
+        :rtype: tuple
+
+        """
+        functions = functions or []
+        retried = False
+        while True:
+            missing = [f for f in functions if f[0] not in self.functions]
+            message_type, body = self._send_script(with_definitions(script, missing), params)
+            if message_type != REXPRO_ERROR:
+                self.functions.update(name for name, definition in missing)
+            elif not missing and not retried and _missing_function(body[3], functions):
+                logger.info("RexPro session lost its functions, defining them again")
+                self.functions.clear()
+                retried = True
+                continue
+            return message_type, body
+
+    def _send_script(self, script, params):
+        """
+        Sends a script request, the parameters bound by the previous script
+        and not passed again are reset to null so they don't leak into it.
+        """
+        params = params or {}
+        bindings = dict.fromkeys(self.bindings.difference(params))
+        bindings.update(params)
+        self.bindings = set(params)
+        meta = {'inSession': True, 'isolate': False, 'transaction': True}
+        return self.request(REXPRO_SCRIPT_REQUEST, [
+            self.session,
+            uuid.uuid4().bytes,
+            meta,
+            'groovy',
+            script,
+            bindings,
+        ])
+
+    def _kill_session(self):
+        """
+        Asks the server to end this connection's session, errors are only
+        logged since the socket is closed either way.
+        """
+        meta = {'graphName': self.graph_name, 'killSession': True}
+        try:
+            if self.timeout is None or self.timeout > REXPRO_CLOSE_TIMEOUT:
+                self.sock.settimeout(REXPRO_CLOSE_TIMEOUT)
+            self.request(REXPRO_SESSION_REQUEST, [
+                self.session,
+                uuid.uuid4().bytes,
+                meta,
+                self.username or '',
+                self.password or '',
+            ])
+        except (socket.error, ValueError) as ex:
+            logger.debug("Unable to end RexPro session: {}".format(ex))
+
+    def close(self):
+        """
+        Ends the server side session and closes the socket.
+        """
+        if self.sock is not None:
+            try:
+                if self.session is not None:
+                    self._kill_session()
+                self.sock.close()
+            finally:
+                self.sock = None
+                self.session = None
+                self.functions = set()
+                self.bindings = set()
+
+
+class RexProTransport(BaseTransport):
+    """
+    Sends scripts over Rexster's binary RexPro protocol, msgpack framed
+    messages executed inside a per-connection session.
+    """
+
+    default_port = 8184
+    supports_functions = True
+
+    def __init__(self, timeout=None):
+        """
+        :param timeout: Socket timeout in seconds
+        :type timeout: float or None
+
+        """
+        super(RexProTransport, self).__init__()
+        self.timeout = timeout
+
+    def connect(self, host):
+        return RexProConnection(host, self.graph_name, self.username, self.password, self.timeout)
+
+    def execute(self, host, script, params, functions=None):
+        def run(conn):
+            return conn.execute(script, params, functions), True
+
+        message_type, body = self._with_connection(host, run)
+
+        if message_type == REXPRO_ERROR:
+            return 500, {'message': body[3], 'success': False}
+        if message_type != REXPRO_SCRIPT_RESPONSE:
+            raise ValueError('Unexpected RexPro message type {}'.format(message_type))
+
+        results = flatten_rexpro_element(body[3])
+        if not isinstance(results, list):
+            results = [results]
+        return 200, {'results': results, 'success': True}
+
+
+TRANSPORTS = {
+    'http': HTTPTransport,
+    'rexpro': RexProTransport,
+}
+
+
+def get_transport(transport):
+    """
+    Returns a transport instance for the given transport name or instance.
+
+    :param transport: 'http', 'rexpro' or an instance of BaseTransport
+    :type transport: str or BaseTransport
+    :rtype: BaseTransport
+
+    """
+    if isinstance(transport, BaseTransport):
+        return transport
+    try:
+        return TRANSPORTS[transport]()
+    except KeyError:
+        raise ValueError("Unknown transport '{}', expected one of {}".format(
+            transport, ', '.join(sorted(TRANSPORTS))))
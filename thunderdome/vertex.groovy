@@ -24,7 +24,60 @@ def _save_vertex(eid, attrs) {
     }
 }
 
-def _traversal(eid, operation, labels, start, end, element_types) {
+def _save_vertices(elements) {
+    /**
+     * Saves a list of vertices in a single transaction
+     *
+     * :param elements: list of maps holding the eid (null for new vertices)
+     * and the attrs to set on each vertex
+     */
+    try {
+        vertices = []
+        for (element in elements) {
+            v = element.eid == null ? g.addVertex() : g.v(element.eid)
+            for (item in element.attrs.entrySet()) {
+                if (item.value == null) {
+                    v.removeProperty(item.key)
+                } else {
+                    v.setProperty(item.key, item.value)
+                }
+            }
+            vertices << v
+        }
+        g.stopTransaction(SUCCESS)
+        return vertices.collect{g.getVertex(it.id)}
+    } catch (err) {
+        g.stopTransaction(FAILURE)
+        throw(err)
+    }
+}
+
+def _project(e, only, defer) {
+    /**
+     * turns an element into a map of the keys given to only, or of all keys
+     * but those given to defer. `_deferred` tells Element.deserialize the
+     * element is partially loaded, keys given to only are sent even if unset.
+     *
+     * :param e: the vertex or edge
+     * :param only: the only properties to return, or null
+     * :param defer: the properties not to return
+     */
+    def m = [_id: e.id, _deferred: defer]
+    if (e instanceof Vertex) {
+        m._type = "vertex"
+    } else {
+        m._type = "edge"
+        m._label = e.label
+        m._outV = e.getVertex(Direction.OUT).id
+        m._inV = e.getVertex(Direction.IN).id
+    }
+    for (key in (only != null ? only : e.propertyKeys - defer)) {
+        m[key] = e.getProperty(key)
+    }
+    return m
+}
+
+def _traversal(eid, operation, labels, start, end, element_types, only, defer) {
     /**
      * performs vertex/edge traversals with optional edge labels and pagination
      * :param eid: vertex eid to start from
@@ -33,6 +86,8 @@ def _traversal(eid, operation, labels, start, end, element_types) {
      * :param page_num: the page number to start on (pagination begins at 1)
      * :param per_page: number of objects to return per page
      * :param element_types: list of allowed element types for results
+     * :param only: the only properties of the results to return, or null
+     * :param defer: the properties of the results not to return, or null
      */
     results = g.v(eid)
     label_args = labels == null ? [] : labels
@@ -64,13 +119,166 @@ def _traversal(eid, operation, labels, start, end, element_types) {
     if (element_types != null) {
       results = results.filter{it.element_type in element_types}
     }
+    if (only != null || defer != null) {
+        results = results.collect{ _project(it, only, defer) }
+    }
     return results
 }
 
+def _traversal_many(eids, operation, labels, start, end, element_types) {
+    /**
+     * performs the same vertex/edge traversal from many vertices, returning
+     * the distinct elements reached and, for each vertex, the positions of its
+     * results in that list
+     *
+     * :param eids: vertex eids to start from
+     * :param operation: the traversal operation
+     * :param labels: the edge labels to filter on
+     * :param start: the offset of the first result of each vertex
+     * :param end: the offset after the last result of each vertex
+     * :param element_types: list of allowed element types for results
+     */
+    label_args = labels == null ? [] : labels
+    elements = []
+    positions = [:]
+    reached = []
+    for (eid in eids) {
+        results = g.v(eid)
+        switch (operation) {
+            case "inV":
+                results = results.in(*label_args)
+                break
+            case "outV":
+                results = results.out(*label_args)
+                break
+            case "inE":
+                results = results.inE(*label_args)
+                break
+            case "outE":
+                results = results.outE(*label_args)
+                break
+            case "bothE":
+                results = results.bothE(*label_args)
+                break
+            case "bothV":
+                results = results.both(*label_args)
+                break
+            default:
+                throw NamingException()
+        }
+        if (start != null && end != null) {
+            results = results[start..<end]
+        }
+        if (element_types != null) {
+            results = results.filter{it.element_type in element_types}
+        }
+        indices = []
+        for (element in results) {
+            if (!positions.containsKey(element.id)) {
+                positions[element.id] = elements.size()
+                elements << element
+            }
+            indices << positions[element.id]
+        }
+        reached << [eid, indices]
+    }
+    return [elements, reached]
+}
+
+def _keyset_traversal(eid, operation, labels, sorted_labels, other_eid, sort_key, after, limit, element_types, only, defer) {
+    /**
+     * performs vertex/edge traversals resuming after the last edge followed
+     * by the previous page instead of skipping an offset, edges are ordered
+     * by sort key and edge id. The edges of labels using the sort key as
+     * primary key are read in order, one direction at a time, and the scan
+     * stops once the page is full. The edges of other labels are all read.
+     *
+     * :param eid: vertex eid to start from
+     * :param operation: the traversal operation
+     * :param labels: the edge labels to filter on
+     * :param sorted_labels: the labels whose primary key is the sort key
+     * :param other_eid: only follow edges to this vertex if not null
+     * :param sort_key: edge property the edges are ordered by
+     * :param after: [sort key value, edge id] of the last edge of the previous page, null for the first page
+     * :param limit: number of edges to follow
+     * :param element_types: list of allowed element types for results
+     * :param only: the only properties of the results to return, or null
+     * :param defer: the properties of the results not to return, or null
+     */
+    v = g.v(eid)
+    switch (operation) {
+        case ["inV", "inE"]:
+            directions = [Direction.IN]
+            break
+        case ["outV", "outE"]:
+            directions = [Direction.OUT]
+            break
+        case ["bothV", "bothE"]:
+            // the edges of each direction are stored, and ordered, apart
+            directions = [Direction.OUT, Direction.IN]
+            break
+        default:
+            throw NamingException()
+    }
+
+    other = { e -> e.getVertex(Direction.OUT).id == v.id ? e.getVertex(Direction.IN) : e.getVertex(Direction.OUT) }
+    position = { e -> [e.getProperty(sort_key), e.id] }
+    compare = { a, b -> (a[0] <=> b[0]) ?: (a[1] <=> b[1]) }
+
+    // keeps the first limit positions after the previous page, the largest on top
+    page = new PriorityQueue(limit + 1, { a, b -> compare(b[0], a[0]) } as Comparator)
+    more = false
+    for (label in labels) {
+        ordered = label in sorted_labels
+        for (direction in directions) {
+            // each label and direction is queried on its own, the edges of
+            // sorted labels then come ordered by sort key
+            query = v.query().direction(direction).labels(label)
+            if (after != null && after[0] != null) {
+                query = query.has(sort_key, after[0], Query.Compare.GREATER_THAN_EQUAL)
+            }
+            for (e in query.edges()) {
+                p = position(e)
+                if (after != null && compare(p, after) <= 0) {
+                    continue
+                }
+                if (other_eid != null && other(e).id != other_eid) {
+                    continue
+                }
+                result = operation.endsWith("V") ? other(e) : e
+                if (element_types != null && !((result instanceof Vertex ? result.element_type : result.label) in element_types)) {
+                    continue
+                }
+                if (page.size() == limit && (p[0] <=> page.peek()[0][0]) > 0) {
+                    more = true
+                    if (ordered) {
+                        // the remaining edges of this run sort after the page
+                        break
+                    }
+                    continue
+                }
+                page.add([p, result])
+                if (page.size() > limit) {
+                    page.poll()
+                    more = true
+                }
+            }
+        }
+    }
+    page = page.toList().sort{ a, b -> compare(a[0], b[0]) }
+
+    results = page.collect{ it[1] }
+    if (only != null || defer != null) {
+        results = results.collect{ _project(it, only, defer) }
+    }
+    return [results, more ? page.last()[0] : null]
+}
+
 def _delete_related(eid, operation, labels) {
   try{
     /**
-     * deletes connected vertices / edges
+     * deletes connected vertices / edges, returning the [eid, vid] pairs of
+     * the removed vertices and the eids of the removed edges
      */
     results = g.v(eid)
     label_args = labels == null ? [] : labels
@@ -93,12 +301,22 @@ def _delete_related(eid, operation, labels) {
     default:
     throw NamingException()
     }
+    removed_vertices = []
+    removed_edges = []
     if (vertices) {
-      results.each{g.removeVertex(it)}
+      results.each{
+        removed_vertices << [it.id, it.vid]
+        removed_edges.addAll(it.bothE.id.toList())
+        g.removeVertex(it)
+      }
     } else {
-      results.each{g.removeEdge(it)}
+      results.each{
+        removed_edges << it.id
+        g.removeEdge(it)
+      }
     }
     g.stopTransaction(SUCCESS)
+    return [removed_vertices, removed_edges]
   } catch (err) {
     g.stopTransaction(FAILURE)
     raise(err)